@@ -14,10 +14,82 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import json
+from collections import OrderedDict
+import hashlib
+import threading
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
 
 import sqlalchemy.types as types
 
+from nailgun.settings import settings
+
+
+def copy_json(value):
+    """Copies decoded JSON document. Only dicts and lists
+    are mutable there, so it is much cheaper than deepcopy.
+    """
+    value_type = type(value)
+    if value_type is dict:
+        return dict([(k, copy_json(v)) for k, v in value.iteritems()])
+    if value_type is list:
+        return [copy_json(v) for v in value]
+    return value
+
+
+class JSONCache(object):
+    """LRU cache of decoded JSON documents keyed by digest
+    of raw text. Documents shorter than min_length are
+    always decoded, cached ones are copied on every hit,
+    so loaded values can be safely modified.
+    """
+
+    def __init__(self, size, min_length=0):
+        self.size = size
+        self.min_length = min_length
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def loads(self, raw):
+        if not self.size or len(raw) < self.min_length:
+            return json.loads(raw)
+
+        if isinstance(raw, unicode):
+            key = hashlib.sha1(raw.encode('utf-8')).digest()
+        else:
+            key = hashlib.sha1(raw).digest()
+
+        with self.lock:
+            value = self.items.pop(key, None)
+            if value is not None:
+                self.items[key] = value
+                self.hits += 1
+        if value is not None:
+            return copy_json(value)
+
+        value = json.loads(raw)
+        with self.lock:
+            self.misses += 1
+            self.items[key] = value
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+        return copy_json(value)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+json_cache = JSONCache(
+    int(settings.JSON_CACHE_SIZE or 0),
+    int(settings.JSON_CACHE_MIN_LENGTH or 0)
+)
+
 
 class JSON(types.TypeDecorator):
 
@@ -30,5 +102,5 @@ class JSON(types.TypeDecorator):
 
     def process_result_value(self, value, dialect):
         if value is not None:
-            value = json.loads(value)
+            value = json_cache.loads(value)
         return value
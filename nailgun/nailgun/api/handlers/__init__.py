@@ -13,4 +13,5 @@
 #    under the License.
 
 from nailgun.api.handlers.base import check_client_content_type
+from nailgun.api.handlers.base import flush_notifications
 from nailgun.api.handlers.base import forbid_client_caching
@@ -17,7 +17,11 @@
 from datetime import datetime
 from decorator import decorator
 import json
+import threading
 
+from sqlalchemy.orm import class_mapper
+from sqlalchemy.orm import ColumnProperty
+from sqlalchemy.orm import defer
 import web
 
 from nailgun.api.serializers.base import BasicSerializer
@@ -26,6 +30,8 @@ from nailgun.db import db
 from nailgun.errors import errors
 from nailgun.logger import logger
 from nailgun import notifier
+from nailgun.revisions import revisions
+from nailgun.settings import settings
 
 
 def check_client_content_type(handler):
@@ -49,6 +55,43 @@ def forbid_client_caching(handler):
     return handler()
 
 
+def flush_notifications(handler):
+    """Writes notifications sent by handler once
+    request transaction is finished.
+    """
+    try:
+        return handler()
+    finally:
+        notifier.flush()
+
+
+class LongPollWaiters(object):
+    """Counter of requests waiting for changes. Each of them
+    holds a worker thread of WSGI server (10 threads by default),
+    so only LONG_POLL_MAX_WAITERS requests wait at a time and
+    the rest return at once, leaving threads for other requests.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def acquire(self):
+        """:returns: True if request may wait."""
+        with self.lock:
+            if self.count >= int(settings.LONG_POLL_MAX_WAITERS or 4):
+                return False
+            self.count += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.count -= 1
+
+
+long_poll_waiters = LongPollWaiters()
+
+
 @decorator
 def content_json(func, *args, **kwargs):
     web.header('Content-Type', 'application/json')
@@ -63,6 +106,88 @@ def build_json_response(data):
     return data
 
 
+def field_name(field):
+    """Returns name of serializer field which can be
+    specified as a name or as (name, subfields) tuple.
+    """
+    return field[0] if isinstance(field, tuple) else field
+
+
+def get_requested_fields(fields, extra_fields=()):
+    """Returns fields requested by client with comma separated
+    'fields' query parameter, e.g. ?fields=id,status,online.
+    Object ID is always included.
+
+    :param fields: fields which can be requested.
+    :param extra_fields: additional fields rendered by handler.
+    :returns: tuple of fields or None if parameter isn't set.
+    :raises: web.badrequest if unknown field is requested.
+    """
+    requested = web.input(fields=None).fields
+    if not requested:
+        return None
+
+    known = dict(
+        (field_name(f), f) for f in tuple(fields) + tuple(extra_fields)
+    )
+    names = ['id'] if 'id' in known else []
+    for name in requested.split(','):
+        name = name.strip()
+        if name and name not in names:
+            names.append(name)
+
+    unknown = [n for n in names if n not in known]
+    if unknown:
+        raise web.badrequest(
+            message="Unknown fields: {0}".format(", ".join(unknown))
+        )
+    return tuple(known[name] for name in names)
+
+
+def defer_unused_columns(query, model, fields, required=()):
+    """Defers loading of model columns which are not needed
+    to render fields. Primary and foreign keys are always loaded.
+
+    :param query: query to add options to.
+    :param model: queried model.
+    :param fields: fields to render, nothing is deferred if None.
+    :param required: names of columns needed anyway.
+    :returns: query
+    """
+    if fields is None:
+        return query
+    names = set(map(field_name, fields)) | set(required)
+    options = []
+    for prop in class_mapper(model).iterate_properties:
+        if not isinstance(prop, ColumnProperty) or prop.key in names:
+            continue
+        column = prop.columns[0]
+        if column.primary_key or column.foreign_keys:
+            continue
+        options.append(defer(prop.key))
+    if options:
+        query = query.options(*options)
+    return query
+
+
+def check_etag(*tables):
+    """Sets ETag of requested resource built from revisions
+    of tables it's rendered from and current query string.
+    Responds with 304 Not Modified without touching database
+    if client already has this version of resource.
+
+    :param tables: names of tables resource depends on.
+    :raises: web.notmodified if If-None-Match header matches.
+    """
+    etag = revisions.etag(tables, web.ctx.path, web.ctx.query)
+    web.header('ETag', etag)
+    if_none_match = web.ctx.env.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        tags = [t.strip() for t in if_none_match.split(',')]
+        if etag in tags or 'W/' + etag in tags:
+            raise web.notmodified()
+
+
 handlers = {}
 
 
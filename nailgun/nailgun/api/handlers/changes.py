@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Handlers dealing with change feed
+"""
+
+import web
+
+from nailgun.api.handlers.base import content_json
+from nailgun.api.handlers.base import JSONHandler
+from nailgun.api.handlers.base import long_poll_waiters
+from nailgun.changes import feed
+from nailgun.settings import settings
+
+
+class ChangeFeedHandler(JSONHandler):
+    """Change feed handler
+    """
+
+    change_types = ('task', 'node', 'notification')
+
+    @classmethod
+    def _int_param(cls, value, name):
+        if value is None:
+            return None
+        try:
+            number = int(value)
+        except ValueError:
+            number = -1
+        if number < 0:
+            raise web.badrequest(
+                message="Invalid '{0}' value: {1}".format(name, value)
+            )
+        return number
+
+    @content_json
+    def GET(self):
+        """Waits for task, node and notification changes newer
+        than 'since' cursor returned by previous request. Request
+        blocks until such changes appear or 'timeout' seconds pass,
+        so clients can long-poll instead of polling collections.
+
+        May receive comma separated list of change types and
+        cluster_id to wait only for interesting changes,
+        e.g. ?since=<cursor>&types=task,node&cluster_id=1
+
+        At most LONG_POLL_MAX_WAITERS requests wait at a time,
+        when all of them are taken request returns at once.
+
+        :returns: cursor for the next request, list of changes and
+            'reset' flag meaning that client missed changes (or
+            server was restarted) and should reload data.
+        :http: * 200 (OK)
+               * 400 (invalid parameters specified)
+        """
+        max_timeout = int(settings.CHANGE_FEED_TIMEOUT or 30)
+        user_data = web.input(
+            since=None,
+            timeout=max_timeout,
+            types='',
+            cluster_id=None
+        )
+        timeout = min(
+            self._int_param(user_data.timeout, 'timeout'),
+            max_timeout
+        )
+        cluster_id = self._int_param(user_data.cluster_id, 'cluster_id')
+        types = [t.strip() for t in user_data.types.split(',') if t.strip()]
+        for change_type in types:
+            if change_type not in self.change_types:
+                raise web.badrequest(
+                    message="Invalid 'types' value: {0}".format(change_type)
+                )
+
+        if user_data.since is None:
+            # client starts following feed
+            return feed.wait(feed.seq, 0)
+        try:
+            since = feed.parse_cursor(user_data.since)
+        except ValueError:
+            raise web.badrequest(
+                message="Invalid 'since' value: {0}".format(user_data.since)
+            )
+        if not timeout or not long_poll_waiters.acquire():
+            return feed.wait(since, 0, types, cluster_id)
+        try:
+            return feed.wait(since, timeout, types, cluster_id)
+        finally:
+            long_poll_waiters.release()
@@ -22,11 +22,14 @@ import json
 import traceback
 import web
 
+from nailgun.api.handlers.base import check_etag
 from nailgun.api.handlers.base import content_json
 from nailgun.api.handlers.base import JSONHandler
 from nailgun.api.handlers.tasks import TaskHandler
 from nailgun.api.models import Attributes
+from nailgun.api.models import AttributesGenerators
 from nailgun.api.models import Cluster
+from nailgun.api.models import merged_attributes
 from nailgun.api.models import Node
 from nailgun.api.models import Release
 from nailgun.api.serializers.network_configuration \
@@ -36,6 +39,7 @@ from nailgun.api.validators.cluster import ClusterValidator
 from nailgun.db import db
 from nailgun.errors import errors
 from nailgun.logger import logger
+from nailgun.metadata import release_metadata
 from nailgun.network.manager import NetworkManager
 from nailgun import orchestrator
 from nailgun.task.manager import ClusterDeletionManager
@@ -54,6 +58,8 @@ class ClusterHandler(JSONHandler):
         "grouping",
         ("release", "*")
     )
+    # tables rendered cluster data depends on
+    etag_tables = ('clusters', 'releases', 'cluster_changes')
 
     model = Cluster
     validator = ClusterValidator
@@ -77,8 +83,10 @@ class ClusterHandler(JSONHandler):
     def GET(self, cluster_id):
         """:returns: JSONized Cluster object.
         :http: * 200 (OK)
+               * 304 (cluster isn't modified)
                * 404 (cluster not found in db)
         """
+        check_etag(*self.etag_tables)
         cluster = self.get_object_or_404(Cluster, cluster_id)
         return self.render(cluster)
 
@@ -156,7 +164,9 @@ class ClusterCollectionHandler(JSONHandler):
     def GET(self):
         """:returns: Collection of JSONized Cluster objects.
         :http: * 200 (OK)
+               * 304 (clusters aren't modified)
         """
+        check_etag(*ClusterHandler.etag_tables)
         return map(
             ClusterHandler.render,
             db().query(Cluster).all()
@@ -180,12 +190,14 @@ class ClusterCollectionHandler(JSONHandler):
                 setattr(cluster, field, data.get(field))
         db().add(cluster)
         db().commit()
+        metadata = release_metadata.get(cluster.release)
         attributes = Attributes(
             editable=cluster.release.attributes_metadata.get("editable"),
-            generated=cluster.release.attributes_metadata.get("generated"),
+            generated=metadata.generated_attributes(AttributesGenerators),
             cluster=cluster
         )
-        attributes.generate_fields()
+        db().add(attributes)
+        db().commit()
 
         netmanager = NetworkManager()
         try:
@@ -314,6 +326,7 @@ class ClusterAttributesHandler(JSONHandler):
         cluster.add_pending_changes("attributes")
 
         db().commit()
+        merged_attributes.invalidate(cluster.attributes.id)
         return {"editable": cluster.attributes.editable}
 
 
@@ -365,6 +378,7 @@ class ClusterAttributesDefaultsHandler(JSONHandler):
             "editable"
         )
         db().commit()
+        merged_attributes.invalidate(cluster.attributes.id)
         cluster.add_pending_changes("attributes")
 
         logger.debug('ClusterAttributesDefaultsHandler:'
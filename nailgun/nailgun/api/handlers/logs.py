@@ -18,24 +18,26 @@
 Handlers dealing with logs
 """
 
+import calendar
 from itertools import dropwhile
+from itertools import islice
 import json
 import logging
 import os
 import re
-import shlex
-import subprocess
-import tarfile
-import tempfile
 import time
 
 import web
 
 from nailgun.api.handlers.base import content_json
 from nailgun.api.handlers.base import JSONHandler
+from nailgun.api.handlers.base import long_poll_waiters
 from nailgun.api.models import Node
-from nailgun.api.models import RedHatAccount
 from nailgun.db import db
+from nailgun.logs.bundle import LogBundle
+from nailgun.logs.index import log_indexes
+from nailgun.logs.scrubber import scrubbers
+from nailgun.logs.tail import log_tails
 from nailgun.settings import settings
 
 logger = logging.getLogger(__name__)
@@ -72,6 +74,132 @@ def read_backwards(file, bufsize=4096):
             return
 
 
+def read_entries_backwards(f, parser, from_offset=0, levels=None,
+                           date_after=None, date_before=None):
+    """Parses log entries reading file backwards, newest first.
+    It's used while file is indexed in background, filters are
+    the same as of LogIndexSnapshot.find().
+
+    :returns: generator of (timestamp, level, text) tuples.
+    """
+    f.seek(0, 2)
+    # we need to calculate current position manually instead of using
+    # tell() because read_backwards uses buffering
+    pos = f.tell()
+    continuation = []
+    for line in read_backwards(f):
+        pos -= len(line)
+        if pos < from_offset:
+            return
+        entry = line.rstrip('\n')
+        if parser.skip(entry):
+            continue
+        m = parser.match(entry)
+        if m is None:
+            if parser.multiline:
+                continuation.append(entry)
+            continue
+        text = m.group('text')
+        if continuation:
+            continuation.reverse()
+            text += '\n' + '\n'.join(continuation)
+            continuation = []
+        try:
+            timestamp = parser.parse_date(m.group('date'))
+        except ValueError:
+            continue
+        level = parser.level(m)
+        if levels is not None and level not in levels:
+            continue
+        if date_after is not None and timestamp < date_after:
+            continue
+        if date_before is not None and timestamp > date_before:
+            continue
+        yield timestamp, level, text
+
+
+def render_entry(scrubber, timestamp, level, text):
+    return [
+        time.strftime(settings.UI_LOG_DATE_FORMAT, time.gmtime(timestamp)),
+        level,
+        scrubber.scrub(text)
+    ]
+
+
+def get_log_file(user_data):
+    """Finds log file by 'source' and 'node' request parameters.
+
+    :returns: (log source config, log file path) tuple.
+    :raises: web.badrequest, web.notfound, web.internalerror
+    """
+    if not user_data.get('source'):
+        logger.debug("'source' must be specified")
+        raise web.badrequest("'source' must be specified")
+
+    log_config = filter(lambda lc: lc['id'] == user_data.source,
+                        settings.LOGS)
+    # If log source not found or it is fake source but we are run without
+    # fake tasks.
+    if not log_config or (log_config[0].get('fake') and
+                          not settings.FAKE_TASKS):
+        logger.debug("Log source %r not found", user_data.source)
+        raise web.notfound("Log source not found")
+    log_config = log_config[0]
+
+    # If it is 'remote' and not 'fake' log source then calculate log file
+    # path by base dir, node IP and relative path to file.
+    # Otherwise return absolute path.
+    node = None
+    if log_config['remote'] and not log_config.get('fake'):
+        if not user_data.get('node'):
+            raise web.badrequest("'node' must be specified")
+        node = db().query(Node).get(user_data.node)
+        if not node:
+            raise web.notfound("Node not found")
+        if not node.ip:
+            logger.error('Node %r has no assigned ip', node.id)
+            raise web.internalerror("Node has no assigned ip")
+
+        if node.status == "discover":
+            ndir = node.ip
+        else:
+            ndir = node.fqdn
+
+        remote_log_dir = os.path.join(log_config['base'], ndir)
+        if not os.path.exists(remote_log_dir):
+            logger.debug("Log files dir %r for node %s not found",
+                         remote_log_dir, node.id)
+            raise web.notfound("Log files dir for node not found")
+
+        log_file = os.path.join(remote_log_dir, log_config['path'])
+    else:
+        log_file = log_config['path']
+
+    if not os.path.exists(log_file):
+        if node:
+            logger.debug("Log file %r for node %s not found",
+                         log_file, node.id)
+        else:
+            logger.debug("Log file %r not found", log_file)
+        raise web.notfound("Log file not found")
+    return log_config, log_file
+
+
+def get_allowed_levels(user_data, log_config):
+    """Returns levels allowed by 'level' request parameter
+    (the level and more severe ones) or None if it's not set.
+
+    :raises: web.badrequest if level is unknown.
+    """
+    level = user_data.get('level')
+    if level is None:
+        return None
+    if not (level in log_config['levels']):
+        raise web.badrequest("Invalid level")
+    return [l for l in dropwhile(lambda l: l != level,
+                                 log_config['levels'])]
+
+
 class LogEntryCollectionHandler(JSONHandler):
     """Log entry collection handler
     """
@@ -108,85 +236,27 @@ class LogEntryCollectionHandler(JSONHandler):
         date_before = user_data.get('date_before')
         if date_before:
             try:
-                date_before = time.strptime(date_before,
-                                            settings.UI_LOG_DATE_FORMAT)
+                date_before = calendar.timegm(time.strptime(
+                    date_before,
+                    settings.UI_LOG_DATE_FORMAT
+                ))
             except ValueError:
                 logger.debug("Invalid 'date_before' value: %s", date_before)
                 raise web.badrequest("Invalid 'date_before' value")
         date_after = user_data.get('date_after')
         if date_after:
             try:
-                date_after = time.strptime(date_after,
-                                           settings.UI_LOG_DATE_FORMAT)
+                date_after = calendar.timegm(time.strptime(
+                    date_after,
+                    settings.UI_LOG_DATE_FORMAT
+                ))
             except ValueError:
                 logger.debug("Invalid 'date_after' value: %s", date_after)
                 raise web.badrequest("Invalid 'date_after' value")
         truncate_log = bool(user_data.get('truncate_log'))
 
-        if not user_data.get('source'):
-            logger.debug("'source' must be specified")
-            raise web.badrequest("'source' must be specified")
-
-        log_config = filter(lambda lc: lc['id'] == user_data.source,
-                            settings.LOGS)
-        # If log source not found or it is fake source but we are run without
-        # fake tasks.
-        if not log_config or (log_config[0].get('fake') and
-                              not settings.FAKE_TASKS):
-            logger.debug("Log source %r not found", user_data.source)
-            return web.notfound("Log source not found")
-        log_config = log_config[0]
-
-        # If it is 'remote' and not 'fake' log source then calculate log file
-        # path by base dir, node IP and relative path to file.
-        # Otherwise return absolute path.
-        node = None
-        if log_config['remote'] and not log_config.get('fake'):
-            if not user_data.get('node'):
-                raise web.badrequest("'node' must be specified")
-            node = db().query(Node).get(user_data.node)
-            if not node:
-                return web.notfound("Node not found")
-            if not node.ip:
-                logger.error('Node %r has no assigned ip', node.id)
-                raise web.internalerror("Node has no assigned ip")
-
-            if node.status == "discover":
-                ndir = node.ip
-            else:
-                ndir = node.fqdn
-
-            remote_log_dir = os.path.join(log_config['base'], ndir)
-            if not os.path.exists(remote_log_dir):
-                logger.debug("Log files dir %r for node %s not found",
-                             remote_log_dir, node.id)
-                return web.notfound("Log files dir for node not found")
-
-            log_file = os.path.join(remote_log_dir, log_config['path'])
-        else:
-            log_file = log_config['path']
-
-        if not os.path.exists(log_file):
-            if node:
-                logger.debug("Log file %r for node %s not found",
-                             log_file, node.id)
-            else:
-                logger.debug("Log file %r not found", log_file)
-            return web.notfound("Log file not found")
-
-        level = user_data.get('level')
-        allowed_levels = log_config['levels']
-        if level is not None:
-            if not (level in log_config['levels']):
-                raise web.badrequest("Invalid level")
-            allowed_levels = [l for l in dropwhile(lambda l: l != level,
-                                                   log_config['levels'])]
-        try:
-            regexp = re.compile(log_config['regexp'])
-        except re.error as e:
-            logger.error('Invalid regular expression for file %r: %s',
-                         log_config['id'], e)
-            raise web.internalerror("Invalid regular expression in config")
+        log_config, log_file = get_log_file(user_data)
+        levels = get_allowed_levels(user_data, log_config)
 
         entries = []
         to_byte = None
@@ -211,157 +281,275 @@ class LogEntryCollectionHandler(JSONHandler):
             logger.debug("Invalid 'max_entries' value: %d", max_entries)
             raise web.badrequest("Invalid 'max_entries' value")
 
-        accs = db().query(RedHatAccount).all()
-        regs = []
-        if len(accs) > 0:
-            regs = [
-                (
-                    re.compile(r"|".join([a.username for a in accs])),
-                    "username"
-                ),
-                (
-                    re.compile(r"|".join([a.password for a in accs])),
-                    "password"
-                )
-            ]
+        try:
+            index = log_indexes.get(log_file, log_config)
+        except re.error as e:
+            logger.error('Invalid regular expression for file %r: %s',
+                         log_config['id'], e)
+            raise web.internalerror("Invalid regular expression in config")
+
+        scrubber = scrubbers.get()
 
-        has_more = False
+        from_offset = 0 if truncate_log else to_byte
         with open(log_file, 'r') as f:
-            f.seek(0, 2)
-            # we need to calculate current position manually instead of using
-            # tell() because read_backwards uses buffering
-            pos = f.tell()
-            multilinebuf = []
-            for line in read_backwards(f):
-                pos -= len(line)
-                if not truncate_log and pos < to_byte:
-                    has_more = pos > 0
-                    break
-                entry = line.rstrip('\n')
-                if not len(entry):
-                    continue
-                if 'skip_regexp' in log_config and \
-                        re.match(log_config['skip_regexp'], entry):
-                    continue
-                m = regexp.match(entry)
-                if m is None:
-                    if log_config.get('multiline'):
-                        #  Add next multiline part to last entry if it exist.
-                        multilinebuf.append(entry)
-                    else:
-                        logger.debug("Unable to parse log entry '%s' from %s",
-                                     entry, log_file)
-                    continue
-                entry_text = m.group('text')
-                if len(multilinebuf):
-                    multilinebuf.reverse()
-                    entry_text += '\n' + '\n'.join(multilinebuf)
-                    multilinebuf = []
-                entry_level = m.group('level').upper() or 'INFO'
-                if level and not (entry_level in allowed_levels):
-                    continue
-                try:
-                    entry_date = time.strptime(m.group('date'),
-                                               log_config['date_format'])
-                except ValueError:
-                    logger.debug("Unable to parse date from log entry."
-                                 " Date format: %r, date part of entry: %r",
-                                 log_config['date_format'],
-                                 m.group('date'))
-                    continue
-
-                for regex, replace in regs:
-                    entry_text = regex.sub(replace, entry_text)
-
-                entries.append([
-                    time.strftime(settings.UI_LOG_DATE_FORMAT, entry_date),
-                    entry_level,
-                    entry_text
-                ])
+            # file may be rotated after it was indexed,
+            # index is used only if it describes opened file
+            index = index.snapshot()
+            if index.ready and \
+                    os.fstat(f.fileno()).st_ino == index.inode:
+                to_byte = index.size
+                has_more = bool(
+                    not truncate_log and len(index) and
+                    index.offsets[0] < from_offset
+                )
+                found = (index.read(f, i) for i in index.find(
+                    from_offset=from_offset,
+                    levels=levels,
+                    date_after=date_after,
+                    date_before=date_before
+                ))
+                found = (entry for entry in found if entry is not None)
+            else:
+                # file is indexed in background (or rotated),
+                # meanwhile it's read backwards
+                to_byte = os.fstat(f.fileno()).st_size
+                has_more = bool(from_offset)
+                found = read_entries_backwards(
+                    f,
+                    index.parser,
+                    from_offset=from_offset,
+                    levels=levels,
+                    date_after=date_after,
+                    date_before=date_before
+                )
+            for timestamp, entry_level, entry_text in found:
                 if truncate_log and len(entries) >= max_entries:
                     has_more = True
                     break
+                entries.append(render_entry(
+                    scrubber, timestamp, entry_level, entry_text))
 
         return {
             'entries': entries,
-            'to': log_file_size,
+            'to': to_byte,
             'has_more': has_more,
         }
 
 
+class LogTailHandler(JSONHandler):
+    """Log tail handler
+    """
+
+    @content_json
+    def GET(self):
+        """Receives following parameters:
+
+        - *source* - source of logs
+        - *node* - node id (for getting node logs)
+        - *level* - log level (all levels showed by default)
+        - *cursor* - cursor returned by previous request
+        - *timeout* - max number of seconds to wait for new entries
+        - *max_entries* - max number of entries to load
+
+        Without cursor the last entries are returned. While file
+        is indexed in background they are returned without cursor
+        and request should be repeated. With cursor request waits
+        until entries are appended after it, at most
+        LONG_POLL_MAX_WAITERS requests (shared with change feed)
+        wait at a time, the rest return at once. Viewers of the
+        same file share a single reader of it.
+
+        :returns: Collection of new log entries (newest first),
+        cursor for the next request, if file was rotated and
+        if there are more new entries.
+        :http: * 200 (OK)
+               * 400 (invalid *source* value)
+               * 400 (invalid *node* value)
+               * 400 (invalid *level* value)
+               * 400 (invalid *cursor* value)
+               * 400 (invalid *timeout* value)
+               * 400 (invalid *max_entries* value)
+               * 404 (log file not found)
+               * 404 (log files dir not found)
+               * 404 (node not found)
+               * 500 (node has no assigned ip)
+               * 500 (invalid regular expression in config)
+        """
+        max_timeout = float(settings.LOG_TAIL_TIMEOUT or 30)
+        user_data = web.input(
+            cursor=None,
+            timeout=max_timeout,
+            max_entries=settings.TRUNCATE_LOG_ENTRIES
+        )
+        log_config, log_file = get_log_file(user_data)
+        levels = get_allowed_levels(user_data, log_config)
+        try:
+            timeout = min(max(float(user_data.timeout), 0), max_timeout)
+        except ValueError:
+            raise web.badrequest("Invalid 'timeout' value")
+        try:
+            max_entries = int(user_data.max_entries)
+            if max_entries < 0:
+                raise ValueError
+        except ValueError:
+            raise web.badrequest("Invalid 'max_entries' value")
+        cursor = None
+        if user_data.cursor:
+            try:
+                cursor = map(int, user_data.cursor.split(':'))
+                inode, position = cursor
+            except ValueError:
+                raise web.badrequest("Invalid 'cursor' value")
+
+        tail = log_tails.get(
+            log_file,
+            log_config,
+            float(settings.LOG_TAIL_POLL_INTERVAL or 1)
+        )
+        try:
+            if cursor is None:
+                index = tail.poll()
+                first, last = 0, len(index)
+            elif not timeout or not long_poll_waiters.acquire():
+                index, first, last = tail.wait(inode, position, 0)
+            else:
+                try:
+                    index, first, last = tail.wait(inode, position, timeout)
+                finally:
+                    long_poll_waiters.release()
+        except re.error as e:
+            logger.error('Invalid regular expression for file %r: %s',
+                         log_config['id'], e)
+            raise web.internalerror("Invalid regular expression in config")
+
+        scrubber = scrubbers.get()
+        with open(log_file, 'r') as f:
+            inode_opened = os.fstat(f.fileno()).st_ino
+            if not index.ready or inode_opened != index.inode:
+                # file is indexed in background (or was rotated after
+                # it was indexed), meanwhile the last entries are
+                # returned without cursor
+                entries = [
+                    render_entry(scrubber, *entry) for entry in islice(
+                        read_entries_backwards(f, index.parser,
+                                               levels=levels),
+                        max_entries
+                    )
+                ]
+                return {
+                    'entries': entries,
+                    'cursor': None,
+                    'rotated': cursor is not None and inode_opened != inode,
+                    'has_more': False
+                }
+
+            has_more = False
+            if cursor is None:
+                # only the last entries are shown at start
+                positions = list(islice(
+                    index.find(levels=levels, start=first, stop=last),
+                    max_entries
+                ))
+            else:
+                # the oldest new entries are returned, the rest
+                # is returned by the following requests
+                positions = list(islice(
+                    index.find(levels=levels, start=first, stop=last,
+                               oldest_first=True),
+                    max_entries + 1
+                ))
+                if len(positions) > max_entries:
+                    positions = positions[:max_entries]
+                    last = positions[-1] + 1 if positions else first
+                    has_more = True
+                positions.reverse()
+
+            entries = []
+            for i in positions:
+                entry = index.read(f, i)
+                if entry is not None:
+                    entries.append(render_entry(scrubber, *entry))
+
+        return {
+            'entries': entries,
+            'cursor': '{0}:{1}'.format(index.inode, last),
+            'rotated': cursor is not None and (
+                index.inode != inode or first < position),
+            'has_more': has_more
+        }
+
+
 class LogPackageHandler(object):
     """Log package handler
     """
 
-    def sed(self, from_filename, to_filename, gz=False):
-        accounts = db().query(RedHatAccount).all()
-        tf = tempfile.NamedTemporaryFile()
-        for fieldname in ("username", "password"):
-            for fieldvalue in [getattr(acc, fieldname) for acc in accounts]:
-                tf.write("s/%s/%s/g\n" % (fieldvalue, fieldname))
-                tf.flush()
-
-        commands = filter(lambda x: x != "", [
-            "cat %s" % from_filename,
-            "gunzip -c" if gz else "",
-            "sed -f %s" % tf.name,
-            "gzip -c" if gz else "",
-        ])
-        to_file = open(to_filename, 'wb')
-
-        env = os.environ
-        env["PATH"] = "/bin:/usr/bin:/sbin:/usr/sbin"
-        process = []
-        for command in commands:
-            process.append(subprocess.Popen(
-                shlex.split(command),
-                env=env,
-                stdin=(process[-1].stdout if process else None),
-                stdout=(to_file
-                        if (len(process) == len(commands) - 1)
-                        else subprocess.PIPE)
-            ))
-            if len(process) >= 2:
-                process[-2].stdout.close()
-        process[-1].wait()
-        to_file.close()
-        tf.close()
-
     def GET(self):
-        """:returns: logs packed into TAR.GZ archive.
+        """Receives following parameters to limit the package:
+
+        - *nodes* - comma separated IDs of nodes to pack logs of
+          (logs of all nodes are packed by default)
+        - *date_after* - skip files which weren't modified after date
+          (UTC, like dates of log entries handler)
+        - *max_size* - max total size of packed files in bytes
+
+        Archive is streamed to client while it's generated.
+
+        :returns: logs packed into TAR.GZ archive.
         :http: * 200 (OK)
+               * 400 (invalid parameters specified)
         """
-        f = tempfile.TemporaryFile(mode='r+b')
-        tf = tarfile.open(fileobj=f, mode='w:gz')
-
-        for arcname, path in settings.LOGS_TO_PACK_FOR_SUPPORT.items():
-            walk = os.walk(path)
-            if not os.path.isdir(path):
-                walk = (("/", [], [path]),)
-            for root, _, files in walk:
-                for filename in files:
-                    absfilename = os.path.join(root, filename)
-                    relfilename = os.path.relpath(absfilename, path)
-                    if not re.search(r".+\.bz2", filename):
-                        lf = tempfile.NamedTemporaryFile()
-                        self.sed(absfilename, lf.name,
-                                 (True
-                                  if re.search(r".+\.gz", filename)
-                                  else False))
-                        target = os.path.normpath(
-                            os.path.join(arcname, relfilename)
-                        )
-                        tf.add(lf.name, target)
-                        lf.close()
-        tf.close()
+        user_data = web.input(nodes=None, date_after=None, max_size=None)
+
+        node_dirs = None
+        if user_data.nodes is not None:
+            try:
+                node_ids = [
+                    int(n) for n in user_data.nodes.split(',') if n.strip()
+                ]
+            except ValueError:
+                raise web.badrequest("Invalid 'nodes' value")
+            node_dirs = []
+            if node_ids:
+                for ip, fqdn in db().query(Node.ip, Node.fqdn).filter(
+                        Node.id.in_(node_ids)):
+                    node_dirs.extend(
+                        os.path.join(settings.SYSLOG_DIR, d)
+                        for d in (ip, fqdn) if d
+                    )
+
+        date_after = None
+        if user_data.date_after:
+            try:
+                date_after = calendar.timegm(time.strptime(
+                    user_data.date_after,
+                    settings.UI_LOG_DATE_FORMAT
+                ))
+            except ValueError:
+                raise web.badrequest("Invalid 'date_after' value")
+
+        max_size = None
+        if user_data.max_size is not None:
+            try:
+                max_size = int(user_data.max_size)
+            except ValueError:
+                raise web.badrequest("Invalid 'max_size' value")
+
+        bundle = LogBundle(
+            settings.LOGS_TO_PACK_FOR_SUPPORT,
+            scrubbers.get(),
+            workers=int(settings.LOG_BUNDLE_WORKERS or 0),
+            spool_size=settings.LOG_BUNDLE_SPOOL_SIZE,
+            node_dirs=node_dirs,
+            nodes_root=settings.SYSLOG_DIR,
+            date_after=date_after,
+            max_size=max_size
+        )
         filename = 'fuelweb-logs-%s.tar.gz' % (
             time.strftime('%Y-%m-%d_%H-%M-%S', time.localtime()))
         web.header('Content-Type', 'application/octet-stream')
         web.header('Content-Disposition', 'attachment; filename="%s"' % (
             filename))
-        web.header('Content-Length', f.tell())
-        f.seek(0)
-        return f
+        return iter(bundle)
 
 
 class LogSourceCollectionHandler(JSONHandler):
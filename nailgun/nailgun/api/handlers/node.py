@@ -18,13 +18,19 @@
 Handlers dealing with nodes
 """
 
+from collections import defaultdict
 from datetime import datetime
 import json
 import traceback
 
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import subqueryload
 import web
 
+from nailgun.api.handlers.base import check_etag
 from nailgun.api.handlers.base import content_json
+from nailgun.api.handlers.base import defer_unused_columns
+from nailgun.api.handlers.base import get_requested_fields
 from nailgun.api.handlers.base import JSONHandler
 from nailgun.api.models import Cluster
 from nailgun.api.models import NetworkGroup
@@ -33,7 +39,9 @@ from nailgun.api.models import NodeAttributes
 from nailgun.api.models import NodeNICInterface
 from nailgun.api.validators.network import NetAssignmentValidator
 from nailgun.api.validators.node import NodeValidator
+from nailgun.changes import feed
 from nailgun.db import db
+from nailgun.keepalive.heartbeat import heartbeats
 from nailgun.logger import logger
 from nailgun.network.manager import NetworkManager
 from nailgun.network.topology import TopoChecker
@@ -45,27 +53,91 @@ class NodeHandler(JSONHandler):
               'status', 'mac', 'fqdn', 'ip', 'manufacturer', 'platform_name',
               'pending_addition', 'pending_deletion', 'os_platform',
               'error_type', 'online', 'cluster')
+    # tables rendered node data depends on
+    etag_tables = ('nodes', 'node_roles', 'pending_node_roles', 'roles',
+                   'clusters', 'ip_addrs', 'networks', 'network_groups',
+                   'node_nic_interfaces', 'net_assignments')
     model = Node
     validator = NodeValidator
 
     @classmethod
-    def render(cls, instance, fields=None):
+    def render(cls, instance, fields=None, snapshot=None):
         json_data = None
+        if not fields:
+            fields = cls.fields + ('network_data',)
         try:
-            json_data = JSONHandler.render(instance, fields=cls.fields)
-            network_manager = NetworkManager()
-            json_data['network_data'] = network_manager.get_node_networks(
-                instance.id)
+            json_data = JSONHandler.render(
+                instance,
+                fields=[f for f in fields if f != 'network_data']
+            )
+            if 'network_data' in fields:
+                if instance.cluster_id is None:
+                    # Node doesn't belong to any cluster
+                    json_data['network_data'] = []
+                elif snapshot:
+                    json_data['network_data'] = \
+                        snapshot.get_node_networks(instance.id)
+                else:
+                    network_manager = NetworkManager()
+                    json_data['network_data'] = \
+                        network_manager.get_node_networks(instance.id)
         except Exception:
             logger.error(traceback.format_exc())
         return json_data
 
+    @classmethod
+    def eager_load(cls, query, fields=None):
+        """Adds options to load relations rendered
+        with fields in a fixed number of queries.
+        """
+        names = fields or cls.fields
+        if 'cluster' in names:
+            query = query.options(joinedload('cluster'))
+        if 'roles' in names:
+            query = query.options(subqueryload('role_list'))
+        if 'pending_roles' in names:
+            query = query.options(subqueryload('pending_role_list'))
+        return query
+
+    @classmethod
+    def render_collection(cls, nodes, fields=None):
+        """Renders list of nodes. Network data is calculated
+        from one network snapshot per cluster, so number of
+        queries doesn't depend on number of nodes.
+        """
+        if not fields:
+            fields = cls.fields + ('network_data',)
+
+        snapshots = {}
+        if 'network_data' in fields:
+            network_manager = NetworkManager()
+            clusters_nodes = defaultdict(list)
+            for node in nodes:
+                if node.cluster_id is not None:
+                    clusters_nodes[node.cluster_id].append(node)
+            for cluster_nodes in clusters_nodes.itervalues():
+                try:
+                    snapshots[cluster_nodes[0].cluster_id] = \
+                        network_manager.get_cluster_snapshot(
+                            cluster_nodes[0].cluster,
+                            nodes=cluster_nodes
+                        )
+                except Exception:
+                    logger.error(traceback.format_exc())
+
+        return [
+            cls.render(node, fields, snapshots.get(node.cluster_id))
+            for node in nodes
+        ]
+
     @content_json
     def GET(self, node_id):
         """:returns: JSONized Node object.
         :http: * 200 (OK)
+               * 304 (node isn't modified)
                * 404 (node not found in db)
         """
+        check_etag(*self.etag_tables)
         node = self.get_object_or_404(Node, node_id)
         return self.render(node)
 
@@ -104,6 +176,9 @@ class NodeHandler(JSONHandler):
             # and updated cluster_id before all other fields
             if key in ("id", "cluster_id"):
                 continue
+            if key == "meta":
+                # meta differs from the one reported by agent now
+                node.meta_digest = None
             setattr(node, key, value)
         if not node.status in ('provisioning', 'deploying') \
                 and "roles" in data or "cluster_id" in data:
@@ -148,19 +223,33 @@ class NodeCollectionHandler(JSONHandler):
         """May receive cluster_id parameter to filter list
         of nodes
 
+        May receive comma separated list of fields to render,
+        e.g. ?fields=id,status,online
+
         :returns: Collection of JSONized Node objects.
         :http: * 200 (OK)
+               * 304 (nodes aren't modified)
+               * 400 (unknown field requested)
         """
+        check_etag(*NodeHandler.etag_tables)
         user_data = web.input(cluster_id=None)
+        fields = get_requested_fields(NodeHandler.fields, ('network_data',))
+        query = defer_unused_columns(
+            db().query(Node),
+            Node,
+            fields,
+            # needed to determine admin interface
+            required=('meta', 'mac') if fields and
+            'network_data' in fields else ()
+        )
+        query = NodeHandler.eager_load(query, fields)
         if user_data.cluster_id == '':
-            nodes = db().query(Node).filter_by(
-                cluster_id=None).all()
+            nodes = query.filter_by(cluster_id=None).all()
         elif user_data.cluster_id:
-            nodes = db().query(Node).filter_by(
-                cluster_id=user_data.cluster_id).all()
+            nodes = query.filter_by(cluster_id=user_data.cluster_id).all()
         else:
-            nodes = db().query(Node).all()
-        return map(NodeHandler.render, nodes)
+            nodes = query.all()
+        return NodeHandler.render_collection(nodes, fields)
 
     @content_json
     def POST(self):
@@ -270,9 +359,31 @@ class NodeCollectionHandler(JSONHandler):
             indent=4
         ))
 
+    @classmethod
+    def _is_check_in_unchanged(cls, node, data, meta_digest):
+        """Checks if agent reported the same meta data
+        and node fields which are already stored.
+        """
+        if meta_digest is None or node.meta_digest != meta_digest:
+            return False
+        for key, value in data.iteritems():
+            if key == "meta":
+                continue
+            if (key, value) == ("status", "discover") \
+                    and node.status == "provisioning":
+                # agent doesn't update provisioning back to discover
+                continue
+            if getattr(node, key, None) != value:
+                return False
+        return True
+
     @content_json
     def PUT(self):
-        """:returns: Collection of JSONized Node objects.
+        """Agent check-ins with the same meta data and fields
+        only update node online status, check-in time is
+        written to database in batches by heartbeats registry.
+
+        :returns: Collection of JSONized Node objects.
         :http: * 200 (nodes are successfully updated)
                * 400 (invalid nodes data specified)
         """
@@ -291,15 +402,29 @@ class NodeCollectionHandler(JSONHandler):
                     or self.validator.validate_existent_node_mac_update(nd)
             else:
                 node = q.get(nd["id"])
+            meta_digest = None
             if is_agent:
-                node.timestamp = datetime.now()
+                meta_digest = Node.get_meta_digest(nd.get("meta"))
+                unchanged = self._is_check_in_unchanged(
+                    node, nd, meta_digest)
+                # timestamp is written by heartbeats registry later
+                heartbeats.beat(node.id)
                 if not node.online:
-                    node.online = True
                     msg = u"Node '{0}' is back online".format(
                         node.human_readable_name)
                     logger.info(msg)
                     notifier.notify("discover", msg, node_id=node.id)
-                db().commit()
+                    q.filter_by(id=node.id).update(
+                        {"timestamp": datetime.now(), "online": True},
+                        synchronize_session=False
+                    )
+                    feed.publish('node', node.id, node.cluster_id,
+                                 online=True)
+                    db().commit()
+                if unchanged:
+                    # hardware wasn't changed, nothing else to update
+                    nodes_updated.append(node)
+                    continue
             old_cluster_id = node.cluster_id
             if "cluster_id" in nd:
                 if nd["cluster_id"] is None and node.cluster:
@@ -317,6 +442,7 @@ class NodeCollectionHandler(JSONHandler):
                     continue
                 if key == "meta":
                     node.update_meta(value)
+                    node.meta_digest = meta_digest
                 else:
                     setattr(node, key, value)
             db().commit()
@@ -377,7 +503,7 @@ class NodeCollectionHandler(JSONHandler):
                         node.id
                     )
                     network_manager.assign_networks_to_main_interface(node.id)
-        return map(NodeHandler.render, nodes_updated)
+        return NodeHandler.render_collection(nodes_updated)
 
 
 class NodeNICsHandler(JSONHandler):
@@ -20,6 +20,7 @@ Handlers dealing with notifications
 
 import web
 
+from nailgun.api.handlers.base import check_etag
 from nailgun.api.handlers.base import content_json
 from nailgun.api.handlers.base import JSONHandler
 from nailgun.api.models import Notification
@@ -63,8 +64,10 @@ class NotificationHandler(JSONHandler):
     def GET(self, notification_id):
         """:returns: JSONized Notification object.
         :http: * 200 (OK)
+               * 304 (notification isn't modified)
                * 404 (notification not found in db)
         """
+        check_etag('notifications')
         notification = self.get_object_or_404(Notification, notification_id)
         return self.render(notification)
 
@@ -88,18 +91,86 @@ class NotificationCollectionHandler(JSONHandler):
 
     validator = NotificationValidator
 
+    @classmethod
+    def _int_param(cls, value, name):
+        if value is None:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            raise web.badrequest(
+                message="Invalid '{0}' value: {1}".format(name, value)
+            )
+
+    @classmethod
+    def _choice_param(cls, value, name, choices):
+        if value and value not in choices:
+            raise web.badrequest(
+                message="Invalid '{0}' value: {1}".format(name, value)
+            )
+        return value
+
     @content_json
     def GET(self):
-        """:returns: Collection of JSONized Notification objects.
+        """May receive status, topic and cluster_id parameters
+        to filter notifications. Notifications are paginated
+        by ID: 'before' returns page of notifications older than
+        given one (newest first), 'since_id' returns notifications
+        newer than given one (oldest first). 'limit' can't exceed
+        MAX_ITEMS_PER_PAGE.
+
+        :returns: Collection of JSONized Notification objects.
         :http: * 200 (OK)
+               * 304 (notifications aren't modified)
+               * 400 (invalid parameters specified)
         """
-        user_data = web.input(limit=settings.MAX_ITEMS_PER_PAGE)
-        limit = user_data.limit
-        query = db().query(Notification).limit(limit)
-        notifications = query.all()
+        check_etag('notifications')
+        user_data = web.input(
+            limit=settings.MAX_ITEMS_PER_PAGE,
+            since_id=None,
+            before=None,
+            status=None,
+            topic=None,
+            cluster_id=None
+        )
+        limit = self._int_param(user_data.limit, 'limit')
+        if limit < 1:
+            raise web.badrequest(
+                message="Invalid 'limit' value: {0}".format(limit)
+            )
+        # page size is capped, so client can't load the whole table
+        limit = min(limit, int(settings.MAX_ITEMS_PER_PAGE))
+        since_id = self._int_param(user_data.since_id, 'since_id')
+        before = self._int_param(user_data.before, 'before')
+        status = self._choice_param(
+            user_data.status, 'status', Notification.NOTIFICATION_STATUSES)
+        topic = self._choice_param(
+            user_data.topic, 'topic', Notification.NOTIFICATION_TOPICS)
+
+        query = db().query(Notification)
+        if status:
+            query = query.filter_by(status=status)
+        if topic:
+            query = query.filter_by(topic=topic)
+        if user_data.cluster_id == '':
+            query = query.filter_by(cluster_id=None)
+        elif user_data.cluster_id:
+            query = query.filter_by(
+                cluster_id=self._int_param(user_data.cluster_id, 'cluster_id')
+            )
+
+        if since_id is not None:
+            query = query.filter(
+                Notification.id > since_id
+            ).order_by(Notification.id)
+        else:
+            if before is not None:
+                query = query.filter(Notification.id < before)
+            query = query.order_by(Notification.id.desc())
+
         return map(
             NotificationHandler.render,
-            notifications
+            query.limit(limit).all()
         )
 
     @content_json
@@ -122,3 +193,21 @@ class NotificationCollectionHandler(JSONHandler):
             NotificationHandler.render,
             notifications_updated
         )
+
+
+class NotificationUnreadCountHandler(JSONHandler):
+    """Unread notifications count handler
+    """
+
+    @content_json
+    def GET(self):
+        """:returns: Number of unread notifications.
+        :http: * 200 (OK)
+               * 304 (notifications aren't modified)
+        """
+        check_etag('notifications')
+        return {
+            'unread': db().query(Notification).filter_by(
+                status='unread'
+            ).count()
+        }
@@ -23,10 +23,13 @@ import json
 import web
 
 from nailgun.api.handlers.base import content_json
+from nailgun.api.handlers.base import defer_unused_columns
+from nailgun.api.handlers.base import get_requested_fields
 from nailgun.api.handlers.base import JSONHandler
 from nailgun.api.models import Release
 from nailgun.api.validators.release import ReleaseValidator
 from nailgun.db import db
+from nailgun.metadata import release_metadata
 
 
 class ReleaseHandler(JSONHandler):
@@ -70,6 +73,7 @@ class ReleaseHandler(JSONHandler):
         for key, value in data.iteritems():
             setattr(release, key, value)
         db().commit()
+        release_metadata.invalidate(release.id)
         return self.render(release)
 
     def DELETE(self, release_id):
@@ -78,8 +82,10 @@ class ReleaseHandler(JSONHandler):
                * 404 (release not found in db)
         """
         release = self.get_object_or_404(Release, release_id)
+        release_id = release.id
         db().delete(release)
         db().commit()
+        release_metadata.invalidate(release_id)
         raise web.webapi.HTTPError(
             status="204 No Content",
             data=""
@@ -94,13 +100,17 @@ class ReleaseCollectionHandler(JSONHandler):
 
     @content_json
     def GET(self):
-        """:returns: Collection of JSONized Release objects.
+        """May receive comma separated list of fields to render,
+        e.g. ?fields=id,name,version
+
+        :returns: Collection of JSONized Release objects.
         :http: * 200 (OK)
+               * 400 (unknown field requested)
         """
-        return map(
-            ReleaseHandler.render,
-            db().query(Release).all()
-        )
+        fields = get_requested_fields(ReleaseHandler.fields)
+        query = defer_unused_columns(db().query(Release), Release, fields)
+        return [ReleaseHandler.render(release, fields)
+                for release in query.all()]
 
     @content_json
     def POST(self):
@@ -16,7 +16,10 @@
 
 import web
 
+from nailgun.api.handlers.base import check_etag
 from nailgun.api.handlers.base import content_json
+from nailgun.api.handlers.base import defer_unused_columns
+from nailgun.api.handlers.base import get_requested_fields
 from nailgun.api.handlers.base import JSONHandler
 from nailgun.api.models import Task
 from nailgun.db import db
@@ -46,8 +49,10 @@ class TaskHandler(JSONHandler):
     def GET(self, task_id):
         """:returns: JSONized Task object.
         :http: * 200 (OK)
+               * 304 (task isn't modified)
                * 404 (task not found in db)
         """
+        check_etag('tasks')
         task = self.get_object_or_404(Task, task_id)
         return self.render(task)
 
@@ -76,23 +81,37 @@ class TaskCollectionHandler(JSONHandler):
 
     @content_json
     def GET(self):
-        """May receive cluster_id parameter to filter list
-        of tasks
+        """May receive cluster_id, name and status parameters
+        to filter list of tasks
+
+        May receive comma separated list of fields to render,
+        e.g. ?fields=id,status,progress
 
         :returns: Collection of JSONized Task objects.
         :http: * 200 (OK)
+               * 304 (tasks aren't modified)
+               * 400 (unknown field or invalid filter specified)
                * 404 (task not found in db)
         """
-        user_data = web.input(cluster_id=None)
+        check_etag('tasks')
+        user_data = web.input(cluster_id=None, name=None, status=None)
+        fields = get_requested_fields(TaskHandler.fields)
+        query = defer_unused_columns(db().query(Task), Task, fields)
         if user_data.cluster_id == '':
-            tasks = db().query(Task).filter_by(
-                cluster_id=None).all()
+            query = query.filter_by(cluster_id=None)
         elif user_data.cluster_id:
-            tasks = db().query(Task).filter_by(
-                cluster_id=user_data.cluster_id).all()
-        else:
-            tasks = db().query(Task).all()
-        return map(
-            TaskHandler.render,
-            tasks
-        )
+            query = query.filter_by(cluster_id=user_data.cluster_id)
+        for param, choices in (
+            ('name', Task.TASK_NAMES),
+            ('status', Task.TASK_STATUSES)
+        ):
+            value = user_data[param]
+            if not value:
+                continue
+            if value not in choices:
+                raise web.badrequest(
+                    message="Invalid '{0}' value: {1}".format(param, value)
+                )
+            query = query.filter_by(**{param: value})
+        tasks = query.order_by(Task.id).all()
+        return [TaskHandler.render(task, fields) for task in tasks]
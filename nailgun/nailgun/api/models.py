@@ -14,27 +14,36 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-from copy import deepcopy
+from collections import OrderedDict
+import hashlib
+import json
 from random import choice
 import string
+import threading
 import uuid
 
 from sqlalchemy import Boolean
 from sqlalchemy import Column
 from sqlalchemy import Float
+from sqlalchemy import Index
 from sqlalchemy import Integer
 from sqlalchemy import String
 from sqlalchemy import Text
 from sqlalchemy import Unicode
 from sqlalchemy import UniqueConstraint
 from sqlalchemy import ForeignKey, Enum, DateTime
+from sqlalchemy.orm import deferred
 from sqlalchemy.orm import relationship, backref
+from sqlalchemy.orm.attributes import instance_state
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.sql.expression import text
 import web
 
+from nailgun.api.fields import copy_json
 from nailgun.api.fields import JSON
 from nailgun.db import db
 from nailgun.logger import logger
+from nailgun.metadata import compile_attributes
 from nailgun.settings import settings
 from nailgun.volumes.manager import VolumeManager
 
@@ -83,9 +92,14 @@ class Release(Base):
     state = Column(Enum(*STATES, name='release_state'),
                    nullable=False,
                    default='not_available')
-    networks_metadata = Column(JSON, default=[])
-    attributes_metadata = Column(JSON, default={})
-    volumes_metadata = Column(JSON, default={})
+    # big documents which aren't needed for releases list
+    # are loaded with separate query on first access
+    networks_metadata = deferred(
+        Column(JSON, default=[]), group='metadata')
+    attributes_metadata = deferred(
+        Column(JSON, default={}), group='metadata')
+    volumes_metadata = deferred(
+        Column(JSON, default={}), group='metadata')
     roles_metadata = Column(JSON, default={})
     role_list = relationship("Role", backref="release")
     clusters = relationship("Cluster", backref="release")
@@ -258,6 +272,8 @@ class Node(Base):
         default='discover'
     )
     meta = Column(JSON, default={})
+    # digest of meta submitted by agent, see get_meta_digest
+    meta_digest = Column(String(40))
     mac = Column(String(17), nullable=False, unique=True)
     ip = Column(String(15))
     fqdn = Column(String(255))
@@ -270,7 +286,7 @@ class Node(Base):
     changes = relationship("ClusterChanges", backref="node")
     error_type = Column(Enum(*NODE_ERRORS, name='node_error_type'))
     error_msg = Column(String(255))
-    timestamp = Column(DateTime, nullable=False)
+    timestamp = Column(DateTime, nullable=False, index=True)
     online = Column(Boolean, default=True)
     role_list = relationship("Role", secondary=NodeRoles.__table__)
     pending_role_list = relationship("Role",
@@ -361,6 +377,15 @@ class Node(Base):
             iface[param] = val
         return iface
 
+    @classmethod
+    def get_meta_digest(cls, meta):
+        """Returns digest of meta data reported by agent
+        or None if there is no meta data.
+        """
+        if meta is None:
+            return None
+        return hashlib.sha1(json.dumps(meta, sort_keys=True)).hexdigest()
+
     def update_meta(self, data):
         # helper for basic checking meta before updation
         result = []
@@ -557,12 +582,55 @@ class AttributesGenerators(object):
         return str(arg)
 
 
+class MergedAttributesCache(object):
+    """Flattened merged attributes of clusters keyed
+    by ID and version of attributes row.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.lock = threading.Lock()
+        self.items = OrderedDict()
+
+    def get(self, attributes_id, version):
+        with self.lock:
+            value = self.items.pop((attributes_id, version), None)
+            if value is not None:
+                self.items[(attributes_id, version)] = value
+        return value
+
+    def set(self, attributes_id, version, value):
+        with self.lock:
+            self.items[(attributes_id, version)] = value
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def invalidate(self, attributes_id):
+        with self.lock:
+            for key in self.items.keys():
+                if key[0] == attributes_id:
+                    del self.items[key]
+
+
+merged_attributes = MergedAttributesCache(
+    int(settings.MERGED_ATTRIBUTES_CACHE_SIZE or 64)
+)
+
+
 class Attributes(Base):
     __tablename__ = 'attributes'
     id = Column(Integer, primary_key=True)
     cluster_id = Column(Integer, ForeignKey('clusters.id'))
     editable = Column(JSON)
     generated = Column(JSON)
+    # incremented on every update of row, concurrent
+    # updates aren't rejected, the last one wins
+    version = Column(
+        Integer,
+        nullable=False,
+        default=1,
+        onupdate=text('version + 1')
+    )
 
     def generate_fields(self):
         self.generated = self.traverse(self.generated)
@@ -571,52 +639,56 @@ class Attributes(Base):
 
     @classmethod
     def traverse(cls, cdict):
-        new_dict = {}
-        if cdict:
-            for i, val in cdict.iteritems():
-                if isinstance(val, (str, unicode, int, float)):
-                    new_dict[i] = val
-                elif isinstance(val, dict) and "generator" in val:
-                    try:
-                        generator = getattr(
-                            AttributesGenerators,
-                            val["generator"]
-                        )
-                    except AttributeError:
-                        logger.error("Attribute error: %s" % val["generator"])
-                        raise
-                    else:
-                        new_dict[i] = generator(val.get("generator_arg"))
-                else:
-                    new_dict[i] = cls.traverse(val)
-        return new_dict
+        return compile_attributes(cdict)(AttributesGenerators)
 
     def merged_attrs(self):
+        """Returns editable attributes merged into generated ones.
+        Result shares unchanged subtrees with them, so it must
+        not be modified.
+        """
         return self._dict_merge(self.generated, self.editable)
 
     def merged_attrs_values(self):
-        attrs = self.merged_attrs()
-        for group_attrs in attrs.itervalues():
-            for attr, value in group_attrs.iteritems():
-                if isinstance(value, dict) and 'value' in value:
-                    group_attrs[attr] = value['value']
+        """Returns flattened merged attributes. Result is cached
+        for version of attributes row, every call gets its copy.
+        """
+        # values of not flushed changes aren't cached
+        cacheable = self.id is not None and \
+            not instance_state(self).modified
+        if cacheable:
+            attrs = merged_attributes.get(self.id, self.version)
+            if attrs is not None:
+                return copy_json(attrs)
+
+        attrs = {}
+        for group, group_attrs in self.merged_attrs().iteritems():
+            attrs[group] = dict([
+                (attr, value['value']
+                 if isinstance(value, dict) and 'value' in value
+                 else value)
+                for attr, value in group_attrs.iteritems()])
         if 'common' in attrs:
             attrs.update(attrs.pop('common'))
-        return attrs
+
+        if cacheable:
+            merged_attributes.set(self.id, self.version, attrs)
+        return copy_json(attrs)
 
     def _dict_merge(self, a, b):
         '''recursively merges dict's. not just simple a['key'] = b['key'], if
         both a and bhave a key who's value is a dict then dict_merge is called
         on both values and the result stored in the returned dictionary.
+        Nothing is copied: subtrees which aren't changed by merge are
+        shared with a and b.
         '''
         if not isinstance(b, dict):
             return b
-        result = deepcopy(a)
+        result = dict(a)
         for k, v in b.iteritems():
             if k in result and isinstance(result[k], dict):
                     result[k] = self._dict_merge(result[k], v)
             else:
-                result[k] = deepcopy(v)
+                result[k] = v
         return result
 
 
@@ -670,7 +742,7 @@ class Task(Base):
         default='running'
     )
     progress = Column(Integer, default=0)
-    cache = Column(JSON, default={})
+    cache = deferred(Column(JSON, default={}))
     result = Column(JSON, default={})
     parent_id = Column(Integer, ForeignKey('tasks.id'))
     subtasks = relationship(
@@ -705,6 +777,14 @@ class Task(Base):
         return task
 
 
+Index(
+    'tasks_cluster_id_name_status',
+    Task.__table__.c.cluster_id,
+    Task.__table__.c.name,
+    Task.__table__.c.status
+)
+
+
 class Notification(Base):
     __tablename__ = 'notifications'
 
@@ -740,6 +820,13 @@ class Notification(Base):
     datetime = Column(DateTime, nullable=False)
 
 
+Index(
+    'notifications_status_id',
+    Notification.__table__.c.status,
+    Notification.__table__.c.id
+)
+
+
 class L2Topology(Base):
     __tablename__ = 'l2_topologies'
     id = Column(Integer, primary_key=True)
@@ -52,11 +52,16 @@ from nailgun.api.handlers.tasks import TaskCollectionHandler
 
 from nailgun.api.handlers.notifications import NotificationHandler
 from nailgun.api.handlers.notifications import NotificationCollectionHandler
+from nailgun.api.handlers.notifications \
+    import NotificationUnreadCountHandler
+
+from nailgun.api.handlers.changes import ChangeFeedHandler
 
 from nailgun.api.handlers.logs import LogEntryCollectionHandler
 from nailgun.api.handlers.logs import LogPackageHandler
 from nailgun.api.handlers.logs import LogSourceCollectionHandler
 from nailgun.api.handlers.logs import LogSourceByNodeCollectionHandler
+from nailgun.api.handlers.logs import LogTailHandler
 
 from nailgun.api.handlers.registration import FuelKeyHandler
 
@@ -117,11 +122,18 @@ urls = (
 
     r'/notifications/?$',
     'NotificationCollectionHandler',
+    r'/notifications/unread/count/?$',
+    'NotificationUnreadCountHandler',
     r'/notifications/(?P<notification_id>\d+)/?$',
     'NotificationHandler',
 
+    r'/changes/?$',
+    'ChangeFeedHandler',
+
     r'/logs/?$',
     'LogEntryCollectionHandler',
+    r'/logs/tail/?$',
+    'LogTailHandler',
     r'/logs/package/?$',
     'LogPackageHandler',
     r'/logs/sources/?$',
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from collections import deque
+import threading
+import time
+import uuid
+
+from sqlalchemy import event
+
+from nailgun.db import db
+from nailgun.settings import settings
+
+
+class ChangeFeed(object):
+    """Feed of task, node and notification changes. Changes are
+    published by code which mutates state and become visible
+    when transaction of publishing thread is committed. Each
+    change gets a sequence number, clients wait for changes newer
+    than the last number they've seen instead of polling.
+    Only the last 'size' changes are kept in memory. Sequence
+    numbers start over when process is restarted, so clients get
+    them in cursors prefixed with random epoch of the process.
+    """
+
+    def __init__(self, size):
+        self.epoch = uuid.uuid4().hex
+        self.seq = 0
+        self.changes = deque(maxlen=size)
+        self.cond = threading.Condition()
+        self.local = threading.local()
+
+    def _staged(self):
+        if not hasattr(self.local, 'changes'):
+            self.local.changes = []
+        return self.local.changes
+
+    def publish(self, change_type, obj_id, cluster_id=None, **data):
+        """Stages change until current transaction is committed.
+
+        :param change_type: 'task', 'node' or 'notification'.
+        :param obj_id: ID of changed object.
+        :param cluster_id: ID of cluster object belongs to.
+        :param data: changed attributes.
+        """
+        self._staged().append({
+            'type': change_type,
+            'id': obj_id,
+            'cluster': cluster_id,
+            'data': data
+        })
+
+    def committed(self, session):
+        staged = self._staged()
+        if not staged:
+            return
+        with self.cond:
+            for change in staged:
+                self.seq += 1
+                change['seq'] = self.seq
+                self.changes.append(change)
+            self.cond.notify_all()
+        del staged[:]
+
+    def rolled_back(self, session):
+        del self._staged()[:]
+
+    def cursor(self, seq):
+        return '{0}:{1}'.format(self.epoch, seq)
+
+    def parse_cursor(self, cursor):
+        """:returns: sequence number in cursor or None if cursor
+            was returned by another process (e.g. before restart).
+        :raises: ValueError if cursor is malformed.
+        """
+        epoch, seq = cursor.split(':')
+        seq = int(seq)
+        if seq < 0:
+            raise ValueError("Negative sequence number")
+        return seq if epoch == self.epoch else None
+
+    def _since(self, since, types, cluster_id):
+        if since is None or since > self.seq or (
+                self.changes and since < self.changes[0]['seq'] - 1):
+            # changes were lost or server was restarted,
+            # client should reload everything
+            return None
+        return [
+            c for c in self.changes
+            if c['seq'] > since
+            and (not types or c['type'] in types)
+            and (cluster_id is None or c['cluster'] == cluster_id)
+        ]
+
+    def wait(self, since, timeout, types=None, cluster_id=None):
+        """Waits for changes newer than given sequence number.
+
+        :param since: last sequence number seen by client,
+            None if it's unknown to this process.
+        :param timeout: max number of seconds to wait.
+        :param types: change types to wait for, all if empty.
+        :param cluster_id: wait only for changes of this cluster.
+        :returns: dict with cursor of the last change, list of
+            changes and 'reset' flag which is set if client missed
+            changes.
+        """
+        deadline = time.time() + timeout
+        with self.cond:
+            while True:
+                changes = self._since(since, types, cluster_id)
+                remaining = deadline - time.time()
+                if changes is None or changes or remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            return {
+                'cursor': self.cursor(self.seq),
+                'changes': changes or [],
+                'reset': changes is None
+            }
+
+
+feed = ChangeFeed(int(settings.CHANGE_FEED_SIZE or 1000))
+
+event.listen(db.session_factory, 'after_commit', feed.committed)
+event.listen(db.session_factory, 'after_rollback', feed.rolled_back)
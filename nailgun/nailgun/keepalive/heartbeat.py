@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from datetime import datetime
+import threading
+import traceback
+
+from sqlalchemy import bindparam
+
+from nailgun.api.models import Node
+from nailgun.db import db
+from nailgun.logger import logger
+from nailgun.settings import settings
+
+
+class HeartbeatRegistry(object):
+    """Check-in times of nodes kept in memory. Agents check
+    in every minute, so instead of writing node timestamp on
+    every check-in, timestamps are collected here and written
+    to database in batches. Registry runs its own flusher thread,
+    so check-ins are saved even if KeepAliveThread isn't running.
+    """
+
+    def __init__(self, interval=None):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.flusher = None
+        self.stopped = None
+
+    def get_interval(self):
+        return self.interval or \
+            settings.KEEPALIVE.get('flush_interval') or \
+            settings.KEEPALIVE['interval']
+
+    def beat(self, node_id, timestamp=None):
+        with self.lock:
+            self.pending[node_id] = timestamp or datetime.now()
+            if self.flusher is None or not self.flusher.is_alive():
+                self.stopped = threading.Event()
+                self.flusher = threading.Thread(
+                    target=self._flush_periodically,
+                    args=(self.stopped,),
+                    name='HEARTBEATS_FLUSHER'
+                )
+                self.flusher.daemon = True
+                self.flusher.start()
+
+    def stop(self):
+        """Stops flusher thread. Check-ins which aren't written
+        yet are kept and flusher is started again by next beat().
+        """
+        with self.lock:
+            flusher, self.flusher = self.flusher, None
+            if flusher is not None:
+                self.stopped.set()
+        if flusher is not None:
+            flusher.join()
+
+    def _flush_periodically(self, stopped):
+        while not stopped.wait(self.get_interval()):
+            try:
+                self.flush()
+            except Exception:
+                logger.error(traceback.format_exc())
+            finally:
+                db.remove()
+
+    def last_seen(self, node_id):
+        """Returns check-in time of node which
+        is not written to database yet or None.
+        """
+        with self.lock:
+            return self.pending.get(node_id)
+
+    def flush(self):
+        """Writes collected timestamps to database
+        with a single executemany UPDATE.
+
+        :returns: number of updated nodes.
+        """
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return 0
+
+        nodes = Node.__table__
+        try:
+            db().execute(
+                nodes.update().where(
+                    nodes.c.id == bindparam('node_id')
+                ).values(
+                    timestamp=bindparam('seen')
+                ),
+                [
+                    {'node_id': node_id, 'seen': seen}
+                    for node_id, seen in pending.iteritems()
+                ]
+            )
+            db().commit()
+        except Exception:
+            db().rollback()
+            # newer check-ins are kept
+            with self.lock:
+                for node_id, seen in pending.iteritems():
+                    self.pending.setdefault(node_id, seen)
+            raise
+        return len(pending)
+
+
+heartbeats = HeartbeatRegistry()
@@ -16,14 +16,16 @@
 
 from datetime import datetime
 from datetime import timedelta
-from itertools import repeat
-from sqlalchemy.sql import not_
 import threading
 import time
 import traceback
 
+from sqlalchemy import and_
+
 from nailgun.api.models import Node
+from nailgun.changes import feed
 from nailgun.db import db
+from nailgun.keepalive.heartbeat import heartbeats
 from nailgun.logger import logger
 from nailgun import notifier
 from nailgun.settings import settings
@@ -36,9 +38,25 @@ class KeepAliveThread(threading.Thread):
         self.stop_status_checking = threading.Event()
         self.interval = interval or settings.KEEPALIVE['interval']
         self.timeout = timeout or settings.KEEPALIVE['timeout']
+        self.flush_interval = min(
+            settings.KEEPALIVE.get('flush_interval') or self.interval,
+            self.interval
+        )
+
+    def _deadline(self):
+        return datetime.now() - timedelta(seconds=self.timeout)
 
     def reset_nodes_timestamp(self):
-        db().query(Node).update({'timestamp': datetime.now()})
+        """Gives online nodes which were not seen while nailgun
+        was down the whole timeout to check in again.
+        """
+        nodes = Node.__table__
+        db().execute(
+            nodes.update().where(and_(
+                nodes.c.online,
+                nodes.c.timestamp < self._deadline()
+            )).values(timestamp=datetime.now())
+        )
         db().commit()
 
     def join(self, timeout=None):
@@ -46,18 +64,19 @@ class KeepAliveThread(threading.Thread):
         super(KeepAliveThread, self).join(timeout)
 
     def sleep(self, interval=None):
-        map(
-            lambda i: not self.stop_status_checking.isSet() and time.sleep(i),
-            repeat(1, interval or self.interval)
-        )
+        self.stop_status_checking.wait(interval or self.interval)
 
     def run(self):
         while True:
             try:
                 self.reset_nodes_timestamp()
+                next_check = 0
                 while not self.stop_status_checking.isSet():
-                    self.update_status_nodes()
-                    self.sleep()
+                    heartbeats.flush()
+                    if time.time() >= next_check:
+                        self.update_status_nodes()
+                        next_check = time.time() + self.interval
+                    self.sleep(self.flush_interval)
             except Exception:
                 logger.error(traceback.format_exc())
                 time.sleep(1)
@@ -65,20 +84,39 @@ class KeepAliveThread(threading.Thread):
             if self.stop_status_checking.isSet():
                 break
 
+        try:
+            heartbeats.flush()
+        except Exception:
+            logger.error(traceback.format_exc())
+
     def update_status_nodes(self):
-        to_update = db().query(Node).filter(
-            not_(Node.status == 'provisioning')
-        ).filter(
-            datetime.now() > (Node.timestamp + timedelta(seconds=self.timeout))
-        ).filter_by(
-            online=True
-        )
-        for node_db in to_update:
+        """Switches nodes which didn't check in for timeout
+        to offline. Check-ins collected in memory are written
+        to database first, so they are taken into account.
+        """
+        heartbeats.flush()
+        nodes = Node.__table__
+        gone_nodes = db().execute(
+            nodes.update().where(and_(
+                nodes.c.online,
+                nodes.c.status != 'provisioning',
+                nodes.c.timestamp < self._deadline()
+            )).values(
+                online=False
+            ).returning(
+                nodes.c.id,
+                nodes.c.name,
+                nodes.c.mac,
+                nodes.c.cluster_id
+            )
+        ).fetchall()
+
+        for node_id, name, mac, cluster_id in gone_nodes:
+            feed.publish('node', node_id, cluster_id, online=False)
             notifier.notify(
                 "error",
-                u"Node '{0}' has gone away".format(
-                    node_db.human_readable_name),
-                node_id=node_db.id
+                u"Node '{0}' has gone away".format(name or mac),
+                node_id=node_id
             )
-        to_update.update({"online": False})
         db().commit()
+        notifier.flush()
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Support bundle of logs
+"""
+
+from collections import deque
+from cStringIO import StringIO
+from functools import partial
+import gzip
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import tarfile
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+
+class Spool(object):
+    """File-like object keeping written data in memory until it
+    exceeds max_size, then data is moved to a temporary file.
+    """
+
+    def __init__(self, max_size, dir=None):
+        self.max_size = max_size
+        self.dir = dir
+        self.chunks = []
+        self.size = 0
+        self.file = None
+
+    def write(self, data):
+        self.size += len(data)
+        if self.file:
+            self.file.write(data)
+            return
+        self.chunks.append(data)
+        if self.size > self.max_size:
+            self.file = tempfile.NamedTemporaryFile(
+                dir=self.dir, delete=False)
+            self.file.write(''.join(self.chunks))
+            self.chunks = []
+
+    def result(self):
+        """:returns: (size, data, path) tuple, either data or
+            path to temporary file is set.
+        """
+        if self.file:
+            self.file.close()
+            return self.size, None, self.file.name
+        return self.size, ''.join(self.chunks), None
+
+
+def scrub_file(scrubber, path, gz, spool_size, spool_dir):
+    """Scrubs credentials in log file. It's executed in worker
+    processes, so it shouldn't touch database.
+
+    :returns: (size, data, path) tuple, see Spool.result.
+    """
+    spool = Spool(spool_size, spool_dir)
+    opener = gzip.open if gz else open
+    with opener(path, 'rb') as from_file:
+        to_file = gzip.GzipFile(fileobj=spool, mode='wb') if gz else spool
+        for line in from_file:
+            to_file.write(scrubber.scrub(line))
+        if gz:
+            to_file.close()
+    return spool.result()
+
+
+class StreamBuffer(object):
+    """Write-only file object tar stream is written to,
+    written data is taken away by chunks.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(data)
+
+    def take(self):
+        data, self.chunks = ''.join(self.chunks), []
+        return data
+
+
+class FixedSizeReader(object):
+    """Reads exactly 'size' bytes from file padding it with
+    zeroes if file was truncated while it's read, so tar stream
+    isn't broken by rotated logs.
+    """
+
+    def __init__(self, f, size):
+        self.f = f
+        self.left = size
+
+    def read(self, size):
+        size = min(size, self.left)
+        data = self.f.read(size)
+        if len(data) < size:
+            data += '\0' * (size - len(data))
+        self.left -= size
+        return data
+
+
+class LogBundle(object):
+    """Logs packed into tar.gz archive which is generated while
+    it's sent to client. Credentials are scrubbed by a pool of
+    worker processes, files are read directly into the archive
+    if there is nothing to scrub.
+    """
+
+    def __init__(self, sources, scrubber, workers=0, spool_size=None,
+                 node_dirs=None, nodes_root=None, date_after=None,
+                 max_size=None):
+        """:param sources: dict of archive names and paths.
+        :param scrubber: CredentialScrubber.
+        :param workers: number of worker processes, files are
+            scrubbed in the current process if it's less than 2.
+        :param spool_size: max size of scrubbed file kept in memory.
+        :param node_dirs: only these dirs are packed from nodes_root.
+        :param nodes_root: dir with logs of nodes.
+        :param date_after: skip files not modified after timestamp.
+        :param max_size: max total size of packed files.
+        """
+        self.sources = sources
+        self.scrubber = scrubber
+        self.workers = workers
+        self.spool_size = spool_size or 16 * 1024 * 1024
+        self.node_dirs = None
+        if node_dirs is not None:
+            self.node_dirs = [
+                os.path.join(os.path.normpath(d), '') for d in node_dirs
+            ]
+        self.nodes_root = None
+        if nodes_root:
+            self.nodes_root = os.path.join(os.path.normpath(nodes_root), '')
+        self.date_after = date_after
+        self.max_size = max_size
+
+    def _skip_node_file(self, path):
+        if self.node_dirs is None or not self.nodes_root or \
+                not path.startswith(self.nodes_root):
+            return False
+        return not any(path.startswith(d) for d in self.node_dirs)
+
+    def files(self):
+        """Yields (arcname, path, stat) of files to pack.
+        """
+        total = 0
+        for arcname, path in sorted(self.sources.items()):
+            walk = os.walk(path)
+            if not os.path.isdir(path):
+                walk = (("/", [], [path]),)
+            for root, dirs, files in walk:
+                dirs.sort()
+                for filename in sorted(files):
+                    if re.search(r".+\.bz2", filename):
+                        continue
+                    absfilename = os.path.join(root, filename)
+                    if self._skip_node_file(absfilename):
+                        continue
+                    try:
+                        stat = os.stat(absfilename)
+                    except OSError:
+                        continue
+                    if self.date_after and stat.st_mtime < self.date_after:
+                        continue
+                    if self.max_size is not None and \
+                            total + stat.st_size > self.max_size:
+                        continue
+                    total += stat.st_size
+                    relfilename = os.path.relpath(absfilename, path)
+                    target = os.path.normpath(
+                        os.path.join(arcname, relfilename)
+                    )
+                    yield target, absfilename, stat
+
+    def _scrubbed(self, files):
+        """Yields (arcname, path, stat, get) where get() returns
+        result of scrub_file. Files are scrubbed in order, workers
+        are kept at most two files per worker ahead of the stream.
+        """
+        spool_dir = tempfile.mkdtemp(prefix='nailgun-bundle-')
+        args = lambda path: (
+            self.scrubber,
+            path,
+            bool(re.search(r".+\.gz", os.path.basename(path))),
+            self.spool_size,
+            spool_dir
+        )
+        pool = None
+        try:
+            if self.workers < 2:
+                for arcname, path, stat in files:
+                    yield arcname, path, stat, partial(
+                        scrub_file, *args(path))
+                return
+
+            pool = multiprocessing.Pool(self.workers)
+            pending = deque()
+            for arcname, path, stat in files:
+                pending.append((arcname, path, stat, pool.apply_async(
+                    scrub_file, args(path)).get))
+                if len(pending) >= self.workers * 2:
+                    yield pending.popleft()
+            while pending:
+                yield pending.popleft()
+        finally:
+            if pool:
+                pool.terminate()
+            shutil.rmtree(spool_dir, ignore_errors=True)
+
+    def _tarinfo(self, arcname, stat, size):
+        tarinfo = tarfile.TarInfo(arcname)
+        tarinfo.size = size
+        tarinfo.mtime = stat.st_mtime
+        tarinfo.mode = stat.st_mode & 0o7777
+        return tarinfo
+
+    def _add_scrubbed(self, tf, arcname, stat, result):
+        size, data, tmp_path = result
+        tarinfo = self._tarinfo(arcname, stat, size)
+        if tmp_path:
+            try:
+                with open(tmp_path, 'rb') as f:
+                    tf.addfile(tarinfo, f)
+            finally:
+                os.unlink(tmp_path)
+        else:
+            tf.addfile(tarinfo, StringIO(data))
+
+    def _add_raw(self, tf, arcname, path, stat):
+        with open(path, 'rb') as f:
+            tf.addfile(
+                self._tarinfo(arcname, stat, stat.st_size),
+                FixedSizeReader(f, stat.st_size)
+            )
+
+    def __iter__(self):
+        buf = StreamBuffer()
+        tf = tarfile.open(fileobj=buf, mode='w|gz')
+        files = self.files()
+        if self.scrubber.regexp is None:
+            entries = ((a, p, s, None) for a, p, s in files)
+        else:
+            entries = self._scrubbed(files)
+        for arcname, path, stat, get_result in entries:
+            try:
+                if get_result is None:
+                    self._add_raw(tf, arcname, path, stat)
+                else:
+                    self._add_scrubbed(tf, arcname, stat, get_result())
+            except (IOError, OSError, EOFError) as e:
+                logger.warning("Unable to pack %r: %s", path, e)
+            data = buf.take()
+            if data:
+                yield data
+        tf.close()
+        yield buf.take()
@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Byte-offset index of log files
+"""
+
+from array import array
+from bisect import bisect_left
+from bisect import bisect_right
+from collections import OrderedDict
+import hashlib
+from itertools import islice
+from itertools import izip
+import logging
+import os
+import threading
+import traceback
+import zlib
+
+from nailgun.logs.parsers import log_parsers
+from nailgun.logs.parsers import LogParser
+from nailgun.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LogIndex(object):
+    """Index of entries of a single log file. For every entry
+    offset and length in bytes (including continuation lines of
+    multiline entries), timestamp and level are kept, so entries
+    can be selected by position, time window and level without
+    parsing the file. Index is extended incrementally as the file
+    grows and rebuilt when the file is rotated or truncated.
+
+    Index is kept in memory and mirrored to a sidecar file in
+    LOG_INDEX_DIR (if it's writable), so it survives restarts.
+    Sidecar starts with a header (magic, then inode, indexed size,
+    parser state, number of entries and checksum of the file head)
+    followed by fixed-size records (offset, length, timestamp,
+    level).
+    """
+
+    magic = 'NGLOGIX1'
+    # bytes of file head checksum is calculated from
+    head_size = 256
+    record_size = 4
+    header_size = 5
+
+    # parser states
+    CLOSED, OPEN, DEAD = range(3)
+
+    def __init__(self, path, log_config):
+        self.path = path
+        # held while index is updated
+        self.lock = threading.Lock()
+        # held while arrays are replaced, so snapshots
+        # aren't blocked by parsing of the file
+        self.swap_lock = threading.Lock()
+        # thread building index in background
+        self.indexer = None
+        self.parser = log_parsers.get(log_config)
+        self.sidecar = None
+        index_dir = settings.LOG_INDEX_DIR
+        if index_dir:
+            self.sidecar = os.path.join(
+                index_dir,
+                '{0}.idx'.format(self.config_digest(path, log_config))
+            )
+        self._reset()
+        self._load()
+
+    @classmethod
+    def config_digest(cls, path, log_config):
+        return hashlib.sha1(
+            path + LogParser.digest(log_config)
+        ).hexdigest()
+
+    def _reset(self):
+        self.inode = None
+        self.size = 0
+        self.state = self.CLOSED
+        self.head_crc = 0
+        self.offsets = array('l')
+        self.lengths = array('l')
+        self.timestamps = array('l')
+        self.level_codes = array('l')
+        self.monotonic = True
+        # number of records mirrored to sidecar
+        self.saved = 0
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @property
+    def ready(self):
+        """False while index is built in background."""
+        return self.indexer is None or not self.indexer.is_alive()
+
+    def lag(self):
+        """:returns: number of bytes of file which aren't indexed."""
+        stat = os.stat(self.path)
+        if self.inode != stat.st_ino or stat.st_size < self.size:
+            return stat.st_size
+        return stat.st_size - self.size
+
+    def _head_crc(self, f):
+        f.seek(0)
+        return zlib.crc32(f.read(self.head_size)) & 0xffffffff
+
+    def _load(self):
+        if not self.sidecar or not os.path.exists(self.sidecar):
+            return
+        try:
+            with open(self.sidecar, 'rb') as f:
+                if f.read(len(self.magic)) != self.magic:
+                    raise ValueError("Invalid magic")
+                header = array('l')
+                header.fromfile(f, self.header_size)
+                inode, size, state, count, head_crc = header
+                records = array('l')
+                records.fromfile(f, count * self.record_size)
+        except (IOError, EOFError, ValueError) as e:
+            logger.warning("Unable to load log index %r: %s",
+                           self.sidecar, e)
+            return
+        self.inode, self.size, self.state, self.head_crc = \
+            inode, size, state, head_crc
+        self.offsets = records[0::self.record_size]
+        self.lengths = records[1::self.record_size]
+        self.timestamps = records[2::self.record_size]
+        self.level_codes = records[3::self.record_size]
+        self.monotonic = all(
+            a <= b for a, b in izip(
+                self.timestamps,
+                islice(self.timestamps, 1, None)
+            )
+        )
+        self.saved = count
+
+    def _save(self):
+        if not self.sidecar:
+            return
+        try:
+            if not os.path.isdir(os.path.dirname(self.sidecar)):
+                os.makedirs(os.path.dirname(self.sidecar))
+            mode = 'r+b' if self.saved and \
+                os.path.exists(self.sidecar) else 'w+b'
+            if mode == 'w+b':
+                self.saved = 0
+            with open(self.sidecar, mode) as f:
+                # last saved record may be extended by continuation lines
+                start = max(self.saved - 1, 0)
+                f.seek(
+                    len(self.magic) +
+                    (self.header_size + start * self.record_size) *
+                    array('l').itemsize
+                )
+                records = array('l')
+                for i in xrange(start, len(self)):
+                    records.extend((
+                        self.offsets[i],
+                        self.lengths[i],
+                        self.timestamps[i],
+                        self.level_codes[i]
+                    ))
+                records.tofile(f)
+                f.truncate()
+                # header is written last, so records which aren't
+                # counted in it are ignored if we fail in between
+                f.seek(0)
+                f.write(self.magic)
+                array('l', (
+                    self.inode,
+                    self.size,
+                    self.state,
+                    len(self),
+                    self.head_crc
+                )).tofile(f)
+            self.saved = len(self)
+        except (IOError, OSError) as e:
+            logger.warning("Unable to save log index %r: %s",
+                           self.sidecar, e)
+            self.sidecar = None
+
+    def update(self):
+        """Indexes lines appended to the file since the last
+        update. Index is rebuilt if file was replaced or truncated.
+        Only complete lines are indexed.
+        """
+        with self.lock:
+            with open(self.path, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                head_crc = self._head_crc(f)
+                if self.inode != stat.st_ino or stat.st_size < self.size \
+                        or (self.size and self.head_crc != head_crc and
+                            self.size >= self.head_size):
+                    with self.swap_lock:
+                        self._reset()
+                        self.inode = stat.st_ino
+                if stat.st_size == self.size:
+                    return
+                if self.size < self.head_size:
+                    self.head_crc = head_crc
+                f.seek(self.size)
+                pos = self.size
+                for line in f:
+                    if not line.endswith('\n'):
+                        break
+                    self._add_line(pos, line)
+                    pos += len(line)
+                self.size = pos
+            self._save()
+
+    def _add_line(self, pos, line):
+        entry = line.rstrip('\n')
+        m = None
+        if not self.parser.skip(entry):
+            m = self.parser.match(entry)
+        if m is None:
+            if self.state == self.OPEN:
+                self.lengths[-1] += len(line)
+            return
+        try:
+            timestamp = self.parser.parse_date(m.group('date'))
+        except ValueError:
+            logger.debug("Unable to parse date from log entry."
+                         " Date format: %r, date part of entry: %r",
+                         self.parser.date_parser.date_format,
+                         m.group('date'))
+            # continuation lines of this entry are dropped too
+            self.state = self.DEAD
+            return
+        if self.timestamps and timestamp < self.timestamps[-1]:
+            self.monotonic = False
+        self.offsets.append(pos)
+        self.lengths.append(len(line))
+        self.timestamps.append(timestamp)
+        self.level_codes.append(
+            self.parser.level_codes.get(self.parser.level(m), -1)
+        )
+        self.state = self.OPEN if self.parser.multiline else self.CLOSED
+
+    def snapshot(self):
+        """:returns: LogIndexSnapshot of entries indexed so far."""
+        with self.swap_lock:
+            return LogIndexSnapshot(self)
+
+
+class LogIndexSnapshot(object):
+    """Entries of LogIndex indexed at the moment it's taken. It
+    isn't affected by rebuilding of index (which replaces arrays)
+    or by entries appended later, so it can be queried without
+    holding index lock while the file is read.
+    """
+
+    def __init__(self, index):
+        self.parser = index.parser
+        self.inode = index.inode
+        self.size = index.size
+        self.ready = index.ready
+        self.monotonic = index.monotonic
+        self.offsets = index.offsets
+        self.lengths = index.lengths
+        self.timestamps = index.timestamps
+        self.level_codes = index.level_codes
+        # arrays are extended one by one while index is updated,
+        # only entries which are complete before size are taken
+        self.count = bisect_left(
+            self.offsets,
+            self.size,
+            0,
+            min(len(self.offsets), len(self.lengths),
+                len(self.timestamps), len(self.level_codes))
+        )
+
+    def __len__(self):
+        return self.count
+
+    def find(self, from_offset=0, levels=None,
+             date_after=None, date_before=None, start=0, stop=None,
+             oldest_first=False):
+        """Yields positions of entries matching filters in index,
+        newest first unless oldest_first is set.
+
+        :param from_offset: skip entries which start before it.
+        :param levels: allowed levels, all if None.
+        :param date_after: timestamp of the earliest entry.
+        :param date_before: timestamp of the latest entry.
+        :param start: the first position to look at.
+        :param stop: position to stop at (exclusive).
+        :param oldest_first: yield positions in ascending order.
+        """
+        count = len(self) if stop is None else min(stop, len(self))
+        first = max(
+            start,
+            bisect_left(self.offsets, from_offset, 0, count)
+        )
+        last = count
+        if self.monotonic:
+            if date_after is not None:
+                first = max(
+                    first,
+                    bisect_left(self.timestamps, date_after, 0, count)
+                )
+            if date_before is not None:
+                last = bisect_right(
+                    self.timestamps, date_before, first, count)
+        codes = None
+        if levels is not None:
+            codes = set(
+                self.parser.level_codes[l] for l in levels
+                if l in self.parser.level_codes
+            )
+        if oldest_first:
+            positions = xrange(first, last)
+        else:
+            positions = xrange(last - 1, first - 1, -1)
+        for i in positions:
+            if codes is not None and self.level_codes[i] not in codes:
+                continue
+            timestamp = self.timestamps[i]
+            if date_after is not None and timestamp < date_after:
+                continue
+            if date_before is not None and timestamp > date_before:
+                continue
+            yield i
+
+    def read(self, f, i):
+        """Reads entry from log file.
+
+        :param f: log file opened for reading.
+        :param i: position of entry in index.
+        :returns: (timestamp, level, text) tuple or None if file
+            was rewritten in place and entry isn't there anymore.
+        """
+        f.seek(self.offsets[i])
+        lines = f.read(self.lengths[i]).rstrip('\n').split('\n')
+        m = self.parser.match(lines[0])
+        if m is None:
+            return None
+        text = m.group('text')
+        continuation = [
+            line for line in lines[1:] if not self.parser.skip(line)
+        ]
+        if continuation:
+            text += '\n' + '\n'.join(continuation)
+        return (self.timestamps[i], self.parser.level(m), text)
+
+
+class LogIndexRegistry(object):
+    """Indexes of recently viewed log files.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.lock = threading.Lock()
+        self.indexes = OrderedDict()
+
+    def get(self, path, log_config):
+        """Returns index of log file. Index is updated in calling
+        thread if less than LOG_INDEX_SYNC_SIZE bytes aren't indexed.
+        Otherwise (e.g. file is viewed for the first time) it's built
+        in background and isn't ready until it's done, so callers
+        don't wait for parsing of the whole file.
+
+        :param path: log file path.
+        :param log_config: log source from settings.LOGS.
+        :returns: LogIndex
+        """
+        key = LogIndex.config_digest(path, log_config)
+        with self.lock:
+            index = self.indexes.pop(key, None)
+            if index is None:
+                index = LogIndex(path, log_config)
+            self.indexes[key] = index
+            while len(self.indexes) > self.size:
+                self.indexes.popitem(last=False)
+            if index.ready and index.lag() > \
+                    int(settings.LOG_INDEX_SYNC_SIZE or 1048576):
+                index.indexer = threading.Thread(
+                    target=self._update,
+                    args=(index,),
+                    name='LOG_INDEXER'
+                )
+                index.indexer.daemon = True
+                index.indexer.start()
+            ready = index.ready
+        if ready:
+            index.update()
+        return index
+
+    @classmethod
+    def _update(cls, index):
+        try:
+            index.update()
+        except Exception:
+            logger.error(traceback.format_exc())
+
+
+log_indexes = LogIndexRegistry(int(settings.LOG_INDEX_CACHE_SIZE or 8))
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Parsers of log entries
+"""
+
+import calendar
+from datetime import datetime
+import hashlib
+import re
+import threading
+import time
+
+
+class DateParser(object):
+    """Parses dates of log entries into UTC timestamps. Formats
+    consisting of numeric %Y, %m, %d, %H, %M, %S directives and
+    literal separators are parsed by slicing the string at fixed
+    positions, other formats fall back to time.strptime.
+    """
+
+    widths = {'Y': 4, 'm': 2, 'd': 2, 'H': 2, 'M': 2, 'S': 2}
+    order = 'YmdHMS'
+
+    def __init__(self, date_format):
+        self.date_format = date_format
+        self.length, self.fields, self.literals = \
+            self._compile(date_format)
+
+    @classmethod
+    def _compile(cls, date_format):
+        pos = 0
+        fields = {}
+        literals = []
+        tokens = re.split(r'(%.)', date_format)
+        for token in tokens:
+            if not token:
+                continue
+            if token.startswith('%'):
+                directive = token[1]
+                if directive not in cls.widths or directive in fields:
+                    return None, None, None
+                width = cls.widths[directive]
+                fields[directive] = (pos, pos + width)
+                pos += width
+            else:
+                literals.append((pos, token))
+                pos += len(token)
+        if set(fields) != set(cls.order):
+            return None, None, None
+        return pos, [fields[d] for d in cls.order], literals
+
+    def parse(self, value):
+        """Returns UTC timestamp of date.
+
+        :raises: ValueError if date doesn't match format.
+        """
+        if self.fields is None:
+            return calendar.timegm(time.strptime(value, self.date_format))
+        if len(value) != self.length:
+            raise ValueError(
+                "Date '{0}' doesn't match format '{1}'".format(
+                    value, self.date_format))
+        for pos, literal in self.literals:
+            if value[pos:pos + len(literal)] != literal:
+                raise ValueError(
+                    "Date '{0}' doesn't match format '{1}'".format(
+                        value, self.date_format))
+        parts = []
+        for start, end in self.fields:
+            part = value[start:end]
+            if not part.isdigit():
+                raise ValueError(
+                    "Date '{0}' doesn't match format '{1}'".format(
+                        value, self.date_format))
+            parts.append(int(part))
+        # datetime validates ranges the same way strptime does
+        return calendar.timegm(datetime(*parts).utctimetuple())
+
+
+class LogParser(object):
+    """Compiled log source format.
+    """
+
+    def __init__(self, log_config):
+        self.regexp = re.compile(log_config['regexp'])
+        self.skip_regexp = None
+        if log_config.get('skip_regexp'):
+            self.skip_regexp = re.compile(log_config['skip_regexp'])
+        self.date_parser = DateParser(log_config['date_format'])
+        self.multiline = bool(log_config.get('multiline'))
+        self.levels = list(log_config['levels'])
+        self.level_codes = dict(
+            (level, code) for code, level in enumerate(self.levels)
+        )
+
+    @classmethod
+    def digest(cls, log_config):
+        return hashlib.sha1(repr((
+            log_config['regexp'],
+            log_config.get('skip_regexp'),
+            log_config['date_format'],
+            bool(log_config.get('multiline')),
+            list(log_config['levels'])
+        ))).hexdigest()
+
+    def skip(self, line):
+        return not line or bool(
+            self.skip_regexp and self.skip_regexp.match(line))
+
+    def match(self, line):
+        return self.regexp.match(line)
+
+    def parse_date(self, value):
+        return self.date_parser.parse(value)
+
+    @classmethod
+    def level(cls, match):
+        return match.group('level').upper() or 'INFO'
+
+
+class LogParserRegistry(object):
+    """Parsers of log sources. Parser is compiled once for
+    every distinct format from settings.LOGS and LOG_FORMATS.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.parsers = {}
+
+    def get(self, log_config):
+        """Returns parser of log source.
+
+        :param log_config: log source from settings.LOGS.
+        :returns: LogParser
+        :raises: re.error if source has invalid regular expression.
+        """
+        key = LogParser.digest(log_config)
+        parser = self.parsers.get(key)
+        if parser is None:
+            with self.lock:
+                parser = self.parsers.get(key)
+                if parser is None:
+                    parser = self.parsers[key] = LogParser(log_config)
+        return parser
+
+
+log_parsers = LogParserRegistry()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Masking of credentials in logs
+"""
+
+import re
+import threading
+
+from nailgun.api.models import RedHatAccount
+from nailgun.db import db
+from nailgun.revisions import revisions
+
+
+class CredentialScrubber(object):
+    """Replaces Red Hat account usernames and passwords in log
+    text with 'username' and 'password' words. All credentials are
+    matched with a single compiled pattern in one pass.
+    """
+
+    def __init__(self, credentials):
+        """:param credentials: list of (value, replacement) tuples,
+            earlier replacement wins if values are equal.
+        """
+        self.replacements = {}
+        for value, replacement in reversed(credentials):
+            if isinstance(value, unicode):
+                value = value.encode('utf-8')
+            if value:
+                self.replacements[value] = replacement
+        self.regexp = None
+        if self.replacements:
+            # longer values first, so the whole of them is replaced
+            self.regexp = re.compile('|'.join(
+                re.escape(value) for value in
+                sorted(self.replacements, key=len, reverse=True)
+            ))
+
+    def _replace(self, match):
+        return self.replacements[match.group(0)]
+
+    def scrub(self, text):
+        if self.regexp is None:
+            return text
+        return self.regexp.sub(self._replace, text)
+
+
+class ScrubberCache(object):
+    """Scrubber for current Red Hat accounts. It's rebuilt only
+    when red_hat_accounts table is changed.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.revision = None
+        self.scrubber = None
+
+    def get(self):
+        """:returns: CredentialScrubber
+        """
+        revision = revisions.get(RedHatAccount.__tablename__)
+        with self.lock:
+            if self.scrubber is not None and self.revision == revision:
+                return self.scrubber
+        accounts = db().query(
+            RedHatAccount.username,
+            RedHatAccount.password
+        ).all()
+        scrubber = CredentialScrubber(
+            [(username, 'username') for username, _ in accounts] +
+            [(password, 'password') for _, password in accounts]
+        )
+        with self.lock:
+            self.revision = revision
+            self.scrubber = scrubber
+        return scrubber
+
+
+scrubbers = ScrubberCache()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Following of growing log files
+"""
+
+from collections import OrderedDict
+import threading
+import time
+
+from nailgun.logs.index import log_indexes
+from nailgun.settings import settings
+
+
+class LogTail(object):
+    """Follower of a log file shared by all its viewers. File is
+    checked with a cheap stat (and parsing of appended lines) at
+    most once per poll interval no matter how many clients wait
+    for it, waiting clients are woken up when entries appear.
+    Rotation and truncation are handled by the index, which is
+    rebuilt when inode changes or file shrinks.
+    """
+
+    def __init__(self, path, log_config, poll_interval):
+        self.path = path
+        self.log_config = log_config
+        self.poll_interval = poll_interval
+        self.cond = threading.Condition()
+        self.polled = 0
+        self.snapshot = None
+
+    def poll(self):
+        """:returns: LogIndexSnapshot of file taken within poll
+            interval.
+        """
+        with self.cond:
+            if self.snapshot is not None and \
+                    time.time() - self.polled < self.poll_interval:
+                return self.snapshot
+            self.polled = time.time()
+        try:
+            snapshot = log_indexes.get(
+                self.path, self.log_config).snapshot()
+        except IOError:
+            # file is being rotated, new one isn't created yet
+            if self.snapshot is None:
+                raise
+            return self.snapshot
+        with self.cond:
+            self.snapshot = snapshot
+            self.cond.notify_all()
+        return snapshot
+
+    def wait(self, inode, position, timeout):
+        """Waits for entries following given position.
+
+        :param inode: inode of file client has read.
+        :param position: number of entries client has read.
+        :param timeout: max number of seconds to wait.
+        :returns: (snapshot, first, last) tuple, entries from first
+            to last (exclusive) positions of index snapshot are new
+            for client. First is 0 if file was rotated. Snapshot of
+            index which isn't ready is returned at once.
+        """
+        deadline = time.time() + timeout
+        while True:
+            index = self.poll()
+            if not index.ready:
+                return index, 0, 0
+            count = len(index)
+            if index.inode != inode or count < position:
+                return index, 0, count
+            if count > position or time.time() >= deadline:
+                return index, position, count
+            with self.cond:
+                self.cond.wait(
+                    min(self.poll_interval, max(deadline - time.time(), 0))
+                )
+
+
+class LogTailRegistry(object):
+    """Followers of log files keyed by log file path and format.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.lock = threading.Lock()
+        self.tails = OrderedDict()
+
+    def get(self, path, log_config, poll_interval):
+        key = (path, log_config['id'])
+        with self.lock:
+            tail = self.tails.pop(key, None)
+            if tail is None:
+                tail = LogTail(path, log_config, poll_interval)
+            tail.log_config = log_config
+            tail.poll_interval = poll_interval
+            self.tails[key] = tail
+            while len(self.tails) > self.size:
+                self.tails.popitem(last=False)
+        return tail
+
+
+log_tails = LogTailRegistry(int(settings.LOG_INDEX_CACHE_SIZE or 8))
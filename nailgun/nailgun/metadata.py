@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Compiled release metadata. Volumes and attributes templates
+of release are parsed once, nodes and clusters of release use
+compiled structures instead of walking JSON documents.
+"""
+
+import hashlib
+import json
+import threading
+
+from nailgun.logger import logger
+
+
+def _constant(value):
+    return lambda generators: value
+
+
+def _volume_generator(name, args):
+    args = tuple(args)
+    return lambda call_generator: call_generator(name, *args)
+
+
+def _attribute_generator(name, arg):
+    def generate(generators):
+        try:
+            generator = getattr(generators, name)
+        except AttributeError:
+            logger.error("Attribute error: %s" % name)
+            raise
+        return generator(arg)
+    return generate
+
+
+def compile_template(template):
+    '''Compile volumes template into function which takes
+    generator caller and returns copy of template with
+    expanded generators. Template is walked only once,
+    so expansion just makes generator calls.
+    '''
+    if isinstance(template, dict):
+        items = []
+        for key, val in template.iteritems():
+            if type(val) in (str, unicode, int, float):
+                items.append((key, _constant(val)))
+            elif isinstance(val, dict):
+                if 'generator' in val:
+                    items.append((key, _volume_generator(
+                        val['generator'], val.get('generator_args', []))))
+                else:
+                    items.append((key, compile_template(val)))
+            elif isinstance(val, list):
+                items.append((key, compile_template(val)))
+
+        return lambda call_generator: dict([
+            (key, expand(call_generator)) for key, expand in items])
+    elif isinstance(template, list):
+        expanders = [compile_template(item) for item in template]
+        return lambda call_generator: [
+            expand(call_generator) for expand in expanders]
+
+    return lambda call_generator: {}
+
+
+def compile_attributes(template):
+    '''Compile attributes template into function which takes
+    class with attributes generators and returns copy of
+    template with generated values.
+    '''
+    items = []
+    if template:
+        for key, val in template.iteritems():
+            if isinstance(val, (str, unicode, int, float)):
+                items.append((key, _constant(val)))
+            elif isinstance(val, dict) and 'generator' in val:
+                items.append((key, _attribute_generator(
+                    val['generator'], val.get('generator_arg'))))
+            else:
+                items.append((key, compile_attributes(val)))
+
+    return lambda generators: dict([
+        (key, expand(generators)) for key, expand in items])
+
+
+class ReleaseMetadata(object):
+    """Compiled volumes and attributes metadata of release
+    """
+
+    def __init__(self, release_id, digest,
+                 volumes_metadata, attributes_metadata):
+        self.release_id = release_id
+        self.digest = digest
+        # documents compiled metadata was built from
+        self.sources = (volumes_metadata, attributes_metadata)
+
+        volumes_metadata = volumes_metadata or {}
+        self.role_volumes = volumes_metadata.get('volumes_roles_mapping', {})
+        self.vgs = dict([
+            (vg.get('id'), vg) for vg in volumes_metadata.get('volumes', [])])
+        self.vg_templates = dict([
+            (vg_id, compile_template(vg))
+            for vg_id, vg in self.vgs.iteritems()])
+        self.generated_attributes = compile_attributes(
+            (attributes_metadata or {}).get('generated'))
+        self.roles_vgs = {}
+
+    @classmethod
+    def get_digest(cls, volumes_metadata, attributes_metadata):
+        return hashlib.sha1(json.dumps(
+            [volumes_metadata, attributes_metadata], sort_keys=True
+        )).hexdigest()
+
+    def get_roles_volumes(self, roles):
+        """Returns IDs of volume groups for roles in order
+        of volumes_roles_mapping. Empty list is returned
+        if there are no volumes for given roles.
+        """
+        key = tuple(roles)
+        vgs = self.roles_vgs.get(key)
+        if vgs is None:
+            vgs = []
+            for role in roles:
+                for vg in self.role_volumes.get(role) or []:
+                    if vg not in vgs:
+                        vgs.append(vg)
+            self.roles_vgs[key] = vgs
+        return vgs
+
+
+class ReleaseMetadataCache(object):
+    """Compiled metadata of releases keyed by release ID and
+    checked against digest of release documents. Documents of
+    release loaded by session are hashed only once, so all
+    nodes of release share compiled metadata for free.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.releases = {}
+
+    def get(self, release):
+        """Returns compiled metadata of release.
+
+        :param release: Release object.
+        :returns: ReleaseMetadata
+        """
+        sources = (release.volumes_metadata, release.attributes_metadata)
+        with self.lock:
+            metadata = self.releases.get(release.id)
+        if metadata is not None and \
+                metadata.sources[0] is sources[0] and \
+                metadata.sources[1] is sources[1]:
+            return metadata
+
+        digest = ReleaseMetadata.get_digest(*sources)
+        if metadata is not None and metadata.digest == digest:
+            metadata.sources = sources
+            return metadata
+
+        metadata = ReleaseMetadata(release.id, digest, *sources)
+        with self.lock:
+            self.releases[release.id] = metadata
+        return metadata
+
+    def invalidate(self, release_id):
+        with self.lock:
+            self.releases.pop(release_id, None)
+
+
+release_metadata = ReleaseMetadataCache()
@@ -14,8 +14,6 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-from itertools import chain
-from itertools import ifilter
 from itertools import imap
 from itertools import islice
 import math
@@ -38,6 +36,7 @@ from nailgun.api.models import Vlan
 from nailgun.db import db
 from nailgun.errors import errors
 from nailgun.logger import logger
+from nailgun.network.snapshot import NetworkSnapshot
 from nailgun.settings import settings
 
 
@@ -72,7 +71,7 @@ class NetworkManager(object):
         ).first()
         if not admin_net and fail_if_not_found:
             raise errors.AdminNetworkNotFound()
-        return admin_net.id
+        return admin_net.id if admin_net else None
 
     def create_network_groups(self, cluster_id):
         '''Method for creation of network groups for cluster.
@@ -229,31 +228,27 @@ class NetworkManager(object):
         :returns: None
         '''
         admin_net_id = self.get_admin_network_id()
-        node_admin_ips = db().query(IPAddr).filter_by(
+        node_admin_ips_count = db().query(IPAddr).filter_by(
             node=node_id,
             network=admin_net_id
-        ).all()
+        ).count()
 
-        if not node_admin_ips or len(node_admin_ips) < num:
+        if node_admin_ips_count < num:
             admin_net = db().query(Network).get(admin_net_id)
             logger.debug(
                 u"Trying to assign admin ips: node=%s count=%s",
                 node_id,
-                num - len(node_admin_ips)
+                num - node_admin_ips_count
             )
             free_ips = self.get_free_ips(
                 admin_net.network_group.id,
-                num=num - len(node_admin_ips)
+                num=num - node_admin_ips_count
             )
             logger.info(len(free_ips))
-            for ip in free_ips:
-                ip_db = IPAddr(
-                    node=node_id,
-                    ip_addr=ip,
-                    network=admin_net_id
-                )
-                db().add(ip_db)
-            db().commit()
+            self._insert_ips(
+                admin_net_id,
+                [(node_id, ip) for ip in free_ips]
+            )
 
     def assign_ips(self, nodes_ids, network_name):
         """Idempotent assignment IP addresses to nodes.
@@ -264,6 +259,9 @@ class NetworkManager(object):
         it remains unchanged. If one of the nodes is the
         node from other cluster, this func will fail.
 
+        Free addresses for all nodes are allocated in a single
+        pass and stored with one bulk insert.
+
         :param node_ids: List of nodes IDs in database.
         :type  node_ids: list
         :param network_name: Network name
@@ -272,10 +270,14 @@ class NetworkManager(object):
         :raises: Exception, errors.AssignIPError
         """
 
-        cluster_id = db().query(Node).get(nodes_ids[0]).cluster_id
+        nodes_clusters = dict(
+            db().query(Node.id, Node.cluster_id).filter(
+                Node.id.in_(nodes_ids)
+            )
+        )
+        cluster_id = nodes_clusters.get(nodes_ids[0])
         for node_id in nodes_ids:
-            node = db().query(Node).get(node_id)
-            if node.cluster_id != cluster_id:
+            if nodes_clusters.get(node_id) != cluster_id:
                 raise Exception(
                     u"Node id='{0}' doesn't belong to cluster_id='{1}'".format(
                         node_id,
@@ -293,42 +295,35 @@ class NetworkManager(object):
                 (network_name, cluster_id)
             )
 
-        for node_id in nodes_ids:
-            node_ips = imap(
-                lambda i: i.ip_addr,
-                self._get_ips_except_admin(
-                    node_id=node_id,
-                    network_id=network.id
-                )
-            )
+        nodes_with_ips = set()
+        for ip in db().query(IPAddr).filter(
+            IPAddr.node.in_(nodes_ids)
+        ).filter_by(network=network.id):
             # check if any of node_ips in required ranges
-
-            ip_already_assigned = False
-
-            for ip in node_ips:
-                if self.check_ip_belongs_to_net(ip, network):
-                    logger.info(
-                        u"Node id='{0}' already has an IP address "
-                        "inside '{1}' network.".format(
-                            node_id,
-                            network.name
-                        )
+            if ip.node not in nodes_with_ips and \
+                    self.check_ip_belongs_to_net(ip.ip_addr, network):
+                logger.info(
+                    u"Node id='{0}' already has an IP address "
+                    "inside '{1}' network.".format(
+                        ip.node,
+                        network.name
                     )
-                    ip_already_assigned = True
-                    break
-
-            if ip_already_assigned:
-                continue
-
-            # IP address has not been assigned, let's do it
-            free_ip = self.get_free_ips(network.network_group.id)[0]
-            ip_db = IPAddr(
-                network=network.id,
-                node=node_id,
-                ip_addr=free_ip
-            )
-            db().add(ip_db)
-            db().commit()
+                )
+                nodes_with_ips.add(ip.node)
+
+        nodes_to_assign = [
+            node_id for node_id in nodes_ids
+            if node_id not in nodes_with_ips
+        ]
+        if not nodes_to_assign:
+            return
+
+        # IP addresses have not been assigned, let's do it
+        free_ips = self.get_free_ips(
+            network.network_group.id,
+            num=len(nodes_to_assign)
+        )
+        self._insert_ips(network.id, zip(nodes_to_assign, free_ips))
 
     def assign_vip(self, cluster_id, network_name):
         """Idempotent assignment VirtualIP addresses to cluster.
@@ -380,11 +375,29 @@ class NetworkManager(object):
         else:
             # IP address has not been assigned, let's do it
             vip = self.get_free_ips(network.network_group.id)[0]
-            ne_db = IPAddr(network=network.id, ip_addr=vip)
-            db().add(ne_db)
-            db().commit()
+            self._insert_ips(network.id, [(None, vip)])
         return vip
 
+    def _insert_ips(self, network_id, nodes_ips):
+        """Stores IP addresses with one multi-row insert.
+
+        :param network_id: Network database ID.
+        :type  network_id: int
+        :param nodes_ips: Pairs of node ID (None for VIP) and IP address.
+        :type  nodes_ips: list
+        :returns: None
+        """
+        if not nodes_ips:
+            return
+        db().execute(
+            IPAddr.__table__.insert(),
+            [
+                {'network': network_id, 'node': node_id, 'ip_addr': ip}
+                for node_id, ip in nodes_ips
+            ]
+        )
+        db().commit()
+
     def clear_vlans(self):
         """Removes from DB all Vlans without Networks assigned to them.
         """
@@ -394,31 +407,6 @@ class NetworkManager(object):
         )
         db().commit()
 
-    @classmethod
-    def _chunked_range(cls, iterable, chunksize=64):
-        """We want to be able to iterate over iterable chunk by chunk.
-        We instantiate iter object from itarable. We then yield
-        iter instance slice in infinite loop. Iter slice starts
-        from the last used position and finishes on the position
-        which is offset with chunksize from the last used position.
-
-        :param iterable: Iterable object.
-        :type  iterable: iterable
-        :param chunksize: Size of chunk to iterate through.
-        :type  chunksize: int
-        :yields: iterator
-        :raises: StopIteration
-        """
-        it = iter(iterable)
-        while True:
-            s = islice(it, chunksize)
-            # Here we check if iterator is not empty calling
-            # next() method which raises StopInteration if
-            # iter is empty. If iter is not empty we yield
-            # iterator which is concatenation of fisrt element in
-            # slice and the ramained elements.
-            yield chain([s.next()], s)
-
     def check_ip_belongs_to_net(self, ip_addr, network):
         addr = IPAddress(ip_addr)
         ipranges = imap(
@@ -430,60 +418,41 @@ class NetworkManager(object):
                 return True
         return False
 
-    def _iter_free_ips(self, network_group):
+    def _get_used_ips(self):
+        """Returns set of all IP addresses stored in database.
+        Addresses are loaded with a single query so that
+        candidates can be checked in memory.
+        """
+        return set(
+            ip_addr for (ip_addr,) in db().query(IPAddr.ip_addr)
+        )
+
+    def _iter_free_ips(self, network_group, used_ips=None):
         """Represents iterator over free IP addresses
         in all ranges for given Network Group
         """
-        for ip_addr in ifilter(
-            lambda ip: db().query(IPAddr).filter_by(
-                ip_addr=str(ip)
-            ).first() is None and not ip == network_group.gateway,
-            chain(*[
-                IPRange(ir.first, ir.last)
-                for ir in network_group.ip_ranges
-            ])
-        ):
-            yield ip_addr
+        if used_ips is None:
+            used_ips = self._get_used_ips()
+        # ranges can intersect so we don't want to yield
+        # the same address twice
+        used_ips = set(used_ips)
+        used_ips.add(network_group.gateway)
+        for ip_range in network_group.ip_ranges:
+            for ip in IPRange(ip_range.first, ip_range.last):
+                ip_addr = str(ip)
+                if ip_addr not in used_ips:
+                    used_ips.add(ip_addr)
+                    yield ip_addr
 
     def get_free_ips(self, network_group_id, num=1):
         """Returns list of free IP addresses for given Network Group
         """
         ng = db().query(NetworkGroup).get(network_group_id)
-        free_ips = []
-        for ip in self._iter_free_ips(ng):
-            free_ips.append(str(ip))
-            if len(free_ips) == num:
-                break
+        free_ips = list(islice(self._iter_free_ips(ng), num))
         if len(free_ips) < num:
             raise errors.OutOfIPs()
         return free_ips
 
-    def _get_free_ips_from_range(self, iterable, num=1):
-        """Method for receiving free IP addresses from range.
-
-        :param iterable: Iterable object with IP addresses.
-        :type  iterable: iterable
-        :param num: Number of IP addresses to return.
-        :type  num: int
-        :returns: List of free IP addresses from given range.
-        :raises: errors.OutOfIPs
-        """
-        free_ips = []
-        for chunk in self._chunked_range(iterable):
-            from_range = set(chunk)
-            diff = from_range - set(
-                [i.ip_addr for i in db().query(IPAddr).
-                 filter(IPAddr.ip_addr.in_(from_range))]
-            )
-            while len(free_ips) < num:
-                try:
-                    free_ips.append(diff.pop())
-                except KeyError:
-                    break
-            if len(free_ips) == num:
-                return free_ips
-        raise errors.OutOfIPs()
-
     def _get_ips_except_admin(self, node_id=None, network_id=None):
         """Method for receiving IP addresses for node or network
         excluding Admin Network IP address.
@@ -573,6 +542,22 @@ class NetworkManager(object):
                 main_nic.assigned_networks.append(ng_db)
             db().commit()
 
+    def get_cluster_snapshot(self, cluster, nodes=None):
+        """Method for loading network data of cluster nodes
+        in a fixed number of queries.
+
+        :param cluster: Cluster object.
+        :type  cluster: Cluster
+        :param nodes: Nodes to load data for (all cluster nodes if None).
+        :type  nodes: list
+        :returns: NetworkSnapshot object.
+        """
+        return NetworkSnapshot(
+            cluster,
+            admin_net_id=self.get_admin_network_id(False),
+            nodes=nodes
+        )
+
     def get_node_networks(self, node_id):
         """Method for receiving network data for a given node.
 
@@ -586,66 +571,8 @@ class NetworkManager(object):
             # Node doesn't belong to any cluster, so it should not have nets
             return []
 
-        ips = self._get_ips_except_admin(node_id=node_id)
-        network_data = []
-        network_ids = []
-        for i in ips:
-            net = db().query(Network).get(i.network)
-            interface = self._get_interface_by_network_name(
-                node_db.id,
-                net.name
-            )
-
-            # Get prefix from netmask instead of cidr
-            # for public network
-            if net.name == 'public':
-                network_group = db().query(NetworkGroup).get(
-                    net.network_group_id)
-
-                # Convert netmask to prefix
-                prefix = str(IPNetwork(
-                    '0.0.0.0/' + network_group.netmask).prefixlen)
-                netmask = network_group.netmask
-            else:
-                prefix = str(IPNetwork(net.cidr).prefixlen)
-                netmask = str(IPNetwork(net.cidr).netmask)
-
-            network_data.append({
-                'name': net.name,
-                'vlan': net.vlan_id,
-                'ip': i.ip_addr + '/' + prefix,
-                'netmask': netmask,
-                'brd': str(IPNetwork(net.cidr).broadcast),
-                'gateway': net.gateway,
-                'dev': interface.name})
-            network_ids.append(net.id)
-
-        # And now let's add networks w/o IP addresses
-        nets = db().query(Network).join(NetworkGroup).\
-            filter(NetworkGroup.cluster_id == cluster_db.id)
-        if network_ids:
-            nets = nets.filter(not_(Network.id.in_(network_ids)))
-
-        # For now, we pass information about all networks,
-        #    so these vlans will be created on every node we call this func for
-        # However it will end up with errors if we precreate vlans in VLAN mode
-        #   in fixed network. We are skipping fixed nets in Vlan mode.
-        for net in nets.order_by(Network.id).all():
-            interface = self._get_interface_by_network_name(
-                node_db.id,
-                net.name
-            )
-
-            if net.name == 'fixed' and cluster_db.net_manager == 'VlanManager':
-                continue
-            network_data.append({
-                'name': net.name,
-                'vlan': net.vlan_id,
-                'dev': interface.name})
-
-        network_data.append(self._get_admin_network(node_db))
-
-        return network_data
+        snapshot = self.get_cluster_snapshot(cluster_db, nodes=[node_db])
+        return snapshot.get_node_networks(node_db.id)
 
     def _update_attrs(self, node_data):
         node_db = db().query(Node).get(node_data['id'])
@@ -739,19 +666,6 @@ class NetworkManager(object):
         """
         return self.get_all_cluster_networkgroups(node_id)
 
-    def _get_admin_network(self, node):
-        """Node contain mac address which sent ohai,
-        when node was loaded. By this mac address
-        we can identify interface name for admin network.
-        """
-        for interface in node.meta.get('interfaces', []):
-            if interface['mac'] == node.mac:
-                return {
-                    'name': u'admin',
-                    'dev': interface['name']}
-
-        raise errors.CanNotFindInterface()
-
     def _get_interface_by_network_name(self, node_id, network_name):
         """Return network device which has appointed
         network with specified network name
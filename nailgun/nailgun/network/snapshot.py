@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from collections import defaultdict
+
+from netaddr import IPNetwork
+from sqlalchemy.sql import not_
+
+from nailgun.api.models import IPAddr
+from nailgun.api.models import Network
+from nailgun.api.models import NetworkAssignment
+from nailgun.api.models import NetworkGroup
+from nailgun.api.models import Node
+from nailgun.api.models import NodeNICInterface
+from nailgun.db import db
+from nailgun.errors import errors
+
+
+class NetworkSnapshot(object):
+    """Network data of cluster nodes loaded in a fixed
+    number of queries. Networks, network groups, IPs,
+    NICs and network assignments are fetched once and
+    all node networks are computed in memory.
+    """
+
+    def __init__(self, cluster, admin_net_id=None, nodes=None):
+        '''Loads network data for cluster.
+
+        :param cluster: Cluster object.
+        :type  cluster: Cluster
+        :param admin_net_id: Admin Network ID, its IPs are skipped.
+        :type  admin_net_id: int
+        :param nodes: Nodes to load data for (all cluster nodes if None).
+        :type  nodes: list
+        '''
+        self.cluster = cluster
+
+        if nodes is None:
+            nodes = db().query(Node).filter_by(
+                cluster_id=cluster.id
+            ).order_by(Node.id).all()
+        self.nodes = dict((n.id, n) for n in nodes)
+
+        self.network_groups = dict(
+            (ng.id, ng) for ng in db().query(NetworkGroup).filter_by(
+                cluster_id=cluster.id
+            )
+        )
+        self.networks = db().query(Network).join(NetworkGroup).\
+            filter(NetworkGroup.cluster_id == cluster.id).\
+            order_by(Network.id).all()
+        self.networks_by_id = dict((n.id, n) for n in self.networks)
+
+        self.ips = defaultdict(list)
+        self.interfaces = defaultdict(list)
+        if not self.nodes:
+            return
+
+        ips = db().query(IPAddr).filter(
+            IPAddr.node.in_(self.nodes.keys())
+        ).order_by(IPAddr.id)
+        if admin_net_id:
+            ips = ips.filter(not_(IPAddr.network == admin_net_id))
+        for ip in ips:
+            self.ips[ip.node].append(ip)
+
+        nics = db().query(NodeNICInterface).filter(
+            NodeNICInterface.node_id.in_(self.nodes.keys())
+        ).order_by(NodeNICInterface.id).all()
+
+        # network group names assigned to every interface
+        assigned = defaultdict(list)
+        if nics:
+            assignments = db().query(
+                NetworkAssignment.interface_id,
+                NetworkGroup.name
+            ).join(
+                NetworkGroup,
+                NetworkGroup.id == NetworkAssignment.network_id
+            ).filter(
+                NetworkAssignment.interface_id.in_([n.id for n in nics])
+            ).order_by(NetworkAssignment.id)
+            for interface_id, ng_name in assignments:
+                assigned[interface_id].append(ng_name)
+
+        for nic in nics:
+            self.interfaces[nic.node_id].append(
+                (nic, assigned[nic.id])
+            )
+
+    def get_network(self, network_id):
+        """Returns Network object by ID. Networks which
+        don't belong to cluster are loaded from database.
+        """
+        network = self.networks_by_id.get(network_id)
+        if not network:
+            network = db().query(Network).get(network_id)
+            self.networks_by_id[network_id] = network
+        return network
+
+    def get_interface_by_network_name(self, node_id, network_name):
+        """Return network device which has appointed
+        network with specified network name
+        """
+        for interface, assigned_names in self.interfaces[node_id]:
+            if network_name in assigned_names:
+                return interface
+
+        raise errors.CanNotFindInterface()
+
+    def get_admin_network(self, node_id):
+        """Node contain mac address which sent ohai,
+        when node was loaded. By this mac address
+        we can identify interface name for admin network.
+        """
+        node = self.nodes[node_id]
+        for interface in node.meta.get('interfaces', []):
+            if interface['mac'] == node.mac:
+                return {
+                    'name': u'admin',
+                    'dev': interface['name']}
+
+        raise errors.CanNotFindInterface()
+
+    def get_node_networks(self, node_id):
+        """Method for receiving network data for a given node.
+
+        :param node_id: Node database ID.
+        :type  node_id: int
+        :returns: List of network info for node.
+        """
+        network_data = []
+        network_ids = set()
+        for i in self.ips[node_id]:
+            net = self.get_network(i.network)
+            interface = self.get_interface_by_network_name(
+                node_id,
+                net.name
+            )
+
+            # Get prefix from netmask instead of cidr
+            # for public network
+            if net.name == 'public':
+                network_group = self.network_groups.get(
+                    net.network_group_id) or net.network_group
+
+                # Convert netmask to prefix
+                prefix = str(IPNetwork(
+                    '0.0.0.0/' + network_group.netmask).prefixlen)
+                netmask = network_group.netmask
+            else:
+                prefix = str(IPNetwork(net.cidr).prefixlen)
+                netmask = str(IPNetwork(net.cidr).netmask)
+
+            network_data.append({
+                'name': net.name,
+                'vlan': net.vlan_id,
+                'ip': i.ip_addr + '/' + prefix,
+                'netmask': netmask,
+                'brd': str(IPNetwork(net.cidr).broadcast),
+                'gateway': net.gateway,
+                'dev': interface.name})
+            network_ids.add(net.id)
+
+        # And now let's add networks w/o IP addresses
+
+        # For now, we pass information about all networks,
+        #    so these vlans will be created on every node we call this func for
+        # However it will end up with errors if we precreate vlans in VLAN mode
+        #   in fixed network. We are skipping fixed nets in Vlan mode.
+        for net in self.networks:
+            if net.id in network_ids:
+                continue
+            interface = self.get_interface_by_network_name(
+                node_id,
+                net.name
+            )
+
+            if net.name == 'fixed' and \
+                    self.cluster.net_manager == 'VlanManager':
+                continue
+            network_data.append({
+                'name': net.name,
+                'vlan': net.vlan_id,
+                'dev': interface.name})
+
+        network_data.append(self.get_admin_network(node_id))
+
+        return network_data
@@ -15,42 +15,296 @@
 #    under the License.
 
 from datetime import datetime
+import threading
+import time
+import traceback
 
+from sqlalchemy import event
+
+from nailgun.api.models import Cluster
+from nailgun.api.models import Node
 from nailgun.api.models import Notification
 from nailgun.api.models import Task
+from nailgun.changes import feed
 from nailgun.db import db
 from nailgun.errors import errors
 from nailgun.logger import logger
+from nailgun.settings import settings
+
+
+class NotificationSink(object):
+    """Buffer of notifications. Notifications are kept in memory
+    and deduplicated by (node_id, task, message). Buffered ones
+    are written with a single multi-row insert by sink's own
+    flusher thread through a separate session, so a failed insert
+    never rolls back transaction of the thread which notified.
+    Thread which notified waits for the flusher after its own
+    transaction is committed.
+    """
+
+    # batch is dropped after this number of failed writes
+    max_attempts = 3
+
+    def __init__(self, interval=None):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.keys = set()
+        self.cond = threading.Condition()
+        self.requested = 0
+        self.done = 0
+        self.writing = False
+        self.flusher = None
+        self.local = threading.local()
+
+    def get_interval(self):
+        return self.interval or \
+            float(settings.NOTIFICATIONS_FLUSH_INTERVAL or 1)
+
+    @classmethod
+    def _key(cls, notification):
+        if notification['node_id'] and notification['task_uuid']:
+            return (
+                notification['node_id'],
+                notification['task_uuid'],
+                notification['message']
+            )
+
+    def _buffer(self, notification):
+        key = self._key(notification)
+        with self.lock:
+            if key:
+                if key in self.keys:
+                    return
+                self.keys.add(key)
+            self.buffer.append(notification)
+
+    def add(self, notification):
+        self._buffer(notification)
+        # flushed once transaction of this thread is committed
+        self.local.added = True
+        self._start_flusher()
+
+    def take(self):
+        with self.lock:
+            batch, self.buffer = self.buffer, []
+            self.keys = set()
+        return batch
+
+    def requeue(self, batch):
+        batch = [n for n in batch if n['attempts'] < self.max_attempts]
+        with self.lock:
+            buffered, self.buffer = self.buffer, []
+            self.keys = set()
+        for notification in batch + buffered:
+            self._buffer(notification)
+
+    def _start_flusher(self):
+        with self.cond:
+            if self.flusher is None or not self.flusher.is_alive():
+                self.flusher = threading.Thread(
+                    target=self._flush_periodically,
+                    name='NOTIFICATIONS_FLUSHER'
+                )
+                self.flusher.daemon = True
+                self.flusher.start()
+
+    def _flush_periodically(self):
+        while True:
+            with self.cond:
+                if self.done == self.requested:
+                    self.cond.wait(self.get_interval())
+                requested = self.requested
+                self.writing = True
+            try:
+                self.write_buffered()
+            except Exception:
+                logger.error(traceback.format_exc())
+            finally:
+                with self.cond:
+                    self.writing = False
+                    self.done = requested
+                    self.cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Asks flusher thread to write notifications buffered
+        so far and waits until it's done, at most timeout
+        seconds (NOTIFICATIONS_FLUSH_TIMEOUT by default).
+        Inserts check foreign keys, which wait for transactions
+        holding referenced rows, so it must not be called before
+        calling thread commits its changes.
+
+        :returns: False if notifications weren't written in time.
+        """
+        if timeout is None:
+            timeout = float(settings.NOTIFICATIONS_FLUSH_TIMEOUT or 10)
+        deadline = time.time() + timeout
+        self._start_flusher()
+        with self.cond:
+            if not self.writing and not self.buffer:
+                return True
+            self.requested += 1
+            requested = self.requested
+            self.cond.notify_all()
+            while self.done < requested and self.flusher.is_alive():
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    logger.warning("Notifications aren't written "
+                                   "in %s seconds", timeout)
+                    return False
+                self.cond.wait(min(remaining, 1))
+        return True
+
+    def committed(self, session):
+        if not getattr(self.local, 'added', False) or \
+                threading.current_thread() is self.flusher:
+            return
+        self.local.added = False
+        self.flush()
+
+    def write_buffered(self):
+        """Writes buffered notifications in a separate session.
+        Batch is requeued if the session fails to commit.
+
+        :returns: number of written notifications.
+        """
+        batch = self.take()
+        if not batch:
+            return 0
+        for notification in batch:
+            notification['attempts'] += 1
+        session = db.session_factory()
+        try:
+            written = self.write(session, batch)
+            session.commit()
+        except Exception:
+            session.rollback()
+            self.requeue(batch)
+            raise
+        finally:
+            session.close()
+        return written
+
+    def write(self, session, batch):
+        """Writes notifications using session. Notifications
+        which already exist for the same node and task are skipped,
+        references to deleted nodes and clusters are cleared.
+        """
+        def ids(key):
+            return set(n[key] for n in batch if n[key])
+
+        tasks = {}
+        if ids('task_uuid'):
+            tasks = dict(session.query(Task.uuid, Task.id).filter(
+                Task.uuid.in_(ids('task_uuid'))))
+        nodes = set()
+        if ids('node_id'):
+            nodes = set(node_id for (node_id,) in session.query(
+                Node.id).filter(Node.id.in_(ids('node_id'))))
+        clusters = set()
+        if ids('cluster_id'):
+            clusters = set(cluster_id for (cluster_id,) in session.query(
+                Cluster.id).filter(Cluster.id.in_(ids('cluster_id'))))
+
+        existing = set()
+        if tasks and nodes:
+            existing = set(session.query(
+                Notification.node_id,
+                Notification.task_id,
+                Notification.message
+            ).filter(
+                Notification.task_id.in_(tasks.values())
+            ).filter(
+                Notification.node_id.in_(nodes)
+            ))
+
+        rows = []
+        for notification in batch:
+            node_id = notification['node_id']
+            if node_id not in nodes:
+                node_id = None
+            cluster_id = notification['cluster_id']
+            if cluster_id not in clusters:
+                cluster_id = None
+            task_id = tasks.get(notification['task_uuid'])
+            if node_id and task_id and \
+                    (node_id, task_id, notification['message']) in existing:
+                continue
+            rows.append({
+                'topic': notification['topic'],
+                'message': notification['message'],
+                'cluster_id': cluster_id,
+                'node_id': node_id,
+                'task_id': task_id,
+                'status': 'unread',
+                'datetime': notification['datetime']
+            })
+            logger.info(
+                "Notification: topic: %s message: %s" % (
+                    notification['topic'],
+                    notification['message']
+                )
+            )
+        if not rows:
+            return 0
+
+        # ids are taken from sequence in advance, so changes
+        # are published with them and insert stays multi-row
+        ids = session.execute(
+            "SELECT nextval('notifications_id_seq') "
+            "FROM generate_series(1, :count)",
+            {'count': len(rows)}
+        )
+        for row, (notification_id,) in zip(rows, ids):
+            row['id'] = notification_id
+            feed.publish(
+                'notification',
+                notification_id,
+                row['cluster_id'],
+                topic=row['topic'],
+                message=row['message'],
+                node=row['node_id']
+            )
+        session.execute(Notification.__table__.insert(), rows)
+        return len(rows)
+
+
+sink = NotificationSink()
+
+
+def flush_committed(session):
+    sink.committed(session)
+
+
+event.listen(db.session_factory, 'after_commit', flush_committed)
+
+
+def flush():
+    """Writes buffered notifications to database. Calling
+    thread must not have uncommitted changes.
+    """
+    return sink.flush()
 
 
 def notify(topic, message,
            cluster_id=None, node_id=None, task_uuid=None):
+    """Puts notification into buffer, it's written to
+    database by flusher thread once transaction of calling
+    thread is committed, on the next flush() call or in
+    NOTIFICATIONS_FLUSH_INTERVAL seconds.
+    """
     if topic == 'discover' and node_id is None:
         raise errors.CannotFindNodeIDForDiscovering(
             "No node id in discover notification")
-    task = None
-    if task_uuid:
-        task = db().query(Task).filter_by(uuid=task_uuid).first()
-
-    exist = None
-    if node_id and task:
-        exist = db().query(Notification).filter_by(
-            node_id=node_id,
-            message=message,
-            task=task
-        ).first()
-
-    if not exist:
-        notification = Notification()
-        notification.topic = topic
-        notification.message = message
-        notification.cluster_id = cluster_id
-        notification.node_id = node_id
-        if task:
-            notification.task_id = task.id
-        notification.datetime = datetime.now()
-        db().add(notification)
-        db().commit()
-        logger.info(
-            "Notification: topic: %s message: %s" % (topic, message)
-        )
+    if topic not in Notification.NOTIFICATION_TOPICS:
+        raise ValueError("Unknown notification topic: {0}".format(topic))
+
+    sink.add({
+        'topic': topic,
+        'message': message,
+        'cluster_id': int(cluster_id) if cluster_id else None,
+        'node_id': int(node_id) if node_id else None,
+        'task_uuid': task_uuid,
+        'datetime': datetime.now(),
+        'attempts': 0
+    })
@@ -27,6 +27,11 @@ from netaddr import IPNetwork
 from sqlalchemy import and_
 
 
+# Version of deployment info format in which common
+# attributes are not merged into every node
+COMPACT_FORMAT_VERSION = 2
+
+
 class Priority(object):
     """Node with priority 0 will be deployed first.
     We have step equal 100 because we want to allow
@@ -52,34 +57,47 @@ class OrchestratorSerializer(object):
     """Base class for orchestrator searilization."""
 
     @classmethod
-    def serialize(cls, cluster):
+    def serialize(cls, cluster, compact=False):
         """Method generates facts which
-        through an orchestrator passes to puppet
+        through an orchestrator passes to puppet.
+
+        In compact mode attributes common for all nodes are
+        passed once and every node holds only its own facts,
+        see expand() for conversion into per-node facts.
         """
-        common_attrs = cls.get_common_attrs(cluster)
-        nodes = cls.serialize_nodes(cls.get_nodes_to_serialization(cluster))
+        # Network data of all cluster nodes is loaded once
+        # and then used for every serialized node
+        snapshot = NetworkManager().get_cluster_snapshot(cluster)
+        common_attrs = cls.get_common_attrs(cluster, snapshot)
+        nodes = cls.serialize_nodes(
+            cls.get_nodes_to_serialization(cluster), snapshot)
 
         if cluster.net_manager == 'VlanManager':
-            cls.add_vlan_interfaces(nodes)
+            cls.add_vlan_interfaces(nodes, snapshot)
 
         cls.set_deployment_priorities(nodes)
 
-        # Merge attributes of nodes with common attributes
-        def merge(dict1, dict2):
-            return dict(dict1.items() + dict2.items())
-
-        return map(
-            lambda node: merge(node, common_attrs),
-            nodes)
+        deployment_info = {
+            'version': COMPACT_FORMAT_VERSION,
+            'common': common_attrs,
+            'nodes': nodes
+        }
+        if compact:
+            return deployment_info
+        return expand(deployment_info)
 
     @classmethod
-    def get_common_attrs(cls, cluster):
+    def get_common_attrs(cls, cluster, snapshot=None):
         """Common attributes for all facts
         """
         attrs = cls.serialize_cluster_attrs(cluster)
 
-        attrs['controller_nodes'] = cls.controller_nodes(cluster.id)
-        attrs['nodes'] = cls.node_list(cls.get_nodes_to_serialization(cluster))
+        attrs['nodes'] = cls.node_list(
+            cls.get_nodes_to_serialization(cluster), snapshot)
+        # Controllers are the same nodes which are
+        # already serialized, so just copy them
+        attrs['controller_nodes'] = [
+            dict(node) for node in cls.by_role(attrs['nodes'], 'controller')]
 
         for node in attrs['nodes']:
             if node['role'] in 'cinder':
@@ -128,7 +146,7 @@ class OrchestratorSerializer(object):
         return attrs
 
     @classmethod
-    def add_vlan_interfaces(cls, nodes):
+    def add_vlan_interfaces(cls, nodes, snapshot=None):
         """We shouldn't pass to orchetrator fixed network
         when network manager is VlanManager, but we should specify
         fixed_interface (private_interface in terms of fuel) as result
@@ -136,10 +154,12 @@ class OrchestratorSerializer(object):
         """
         netmanager = NetworkManager()
         for node in nodes:
-            node_db = db().query(Node).get(node['uid'])
-
-            fixed_interface = netmanager._get_interface_by_network_name(
-                node_db.id, 'fixed')
+            if snapshot:
+                fixed_interface = snapshot.get_interface_by_network_name(
+                    int(node['uid']), 'fixed')
+            else:
+                fixed_interface = netmanager._get_interface_by_network_name(
+                    int(node['uid']), 'fixed')
 
             node['vlan_interface'] = fixed_interface.name
 
@@ -194,7 +214,16 @@ class OrchestratorSerializer(object):
         return ctrl_nodes
 
     @classmethod
-    def serialize_nodes(cls, nodes):
+    def get_network_data(cls, node, snapshot=None):
+        """Network data for node, taken from cluster
+        network snapshot if it is given
+        """
+        if snapshot is None:
+            return node.network_data
+        return snapshot.get_node_networks(node.id)
+
+    @classmethod
+    def serialize_nodes(cls, nodes, snapshot=None):
         """Serialize node for each role.
         For example if node has two roles then
         in orchestrator will be passed two serialized
@@ -203,17 +232,17 @@ class OrchestratorSerializer(object):
         serialized_nodes = []
         for node in nodes:
             for role in set(node.pending_roles + node.roles):
-                serialized_node = cls.serialize_node(node, role)
+                serialized_node = cls.serialize_node(node, role, snapshot)
                 serialized_nodes.append(serialized_node)
 
         return serialized_nodes
 
     @classmethod
-    def serialize_node(cls, node, role):
+    def serialize_node(cls, node, role, snapshot=None):
         """Serialize node, then it will be
         merged with common attributes
         """
-        network_data = node.network_data
+        network_data = cls.get_network_data(node, snapshot)
         interfaces = cls.configure_interfaces(network_data)
         cls.__add_hw_interfaces(interfaces, node.meta['interfaces'])
         node_attrs = {
@@ -235,14 +264,14 @@ class OrchestratorSerializer(object):
         return node_attrs
 
     @classmethod
-    def node_list(cls, nodes):
+    def node_list(cls, nodes, snapshot=None):
         """Generate nodes list. Represents
         as "nodes" parameter in facts.
         """
         node_list = []
 
         for node in nodes:
-            network_data = node.network_data
+            network_data = cls.get_network_data(node, snapshot)
 
             for role in node.roles:
                 node_list.append({
@@ -378,10 +407,11 @@ class OrchestratorSerializer(object):
 class OrchestratorHASerializer(OrchestratorSerializer):
 
     @classmethod
-    def node_list(cls, nodes):
+    def node_list(cls, nodes, snapshot=None):
         """Node list
         """
-        node_list = super(OrchestratorHASerializer, cls).node_list(nodes)
+        node_list = super(OrchestratorHASerializer, cls).node_list(
+            nodes, snapshot)
 
         for node in node_list:
             node['swift_zone'] = node['uid']
@@ -389,11 +419,11 @@ class OrchestratorHASerializer(OrchestratorSerializer):
         return node_list
 
     @classmethod
-    def get_common_attrs(cls, cluster):
+    def get_common_attrs(cls, cluster, snapshot=None):
         """Common attributes for all facts
         """
         common_attrs = super(OrchestratorHASerializer, cls).get_common_attrs(
-            cluster)
+            cluster, snapshot)
 
         netmanager = NetworkManager()
         common_attrs['management_vip'] = netmanager.assign_vip(
@@ -453,7 +483,7 @@ class OrchestratorHASerializer(OrchestratorSerializer):
             n['priority'] = other_nodes_prior
 
 
-def serialize(cluster):
+def serialize(cluster, compact=False):
     """Serialization depends on deployment mode
     """
     cluster.prepare_for_deployment()
@@ -464,4 +494,19 @@ def serialize(cluster):
         # Same serializer for all ha
         serializer = OrchestratorHASerializer
 
-    return serializer.serialize(cluster)
+    return serializer.serialize(cluster, compact=compact)
+
+
+def expand(deployment_info):
+    """Converts deployment info in compact format into
+    list of node facts merged with common attributes.
+    Deployment info in old format is returned as is.
+    """
+    if isinstance(deployment_info, list):
+        return deployment_info
+
+    common_attrs = deployment_info['common']
+    return [
+        dict(node.items() + common_attrs.items())
+        for node in deployment_info['nodes']
+    ]
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from collections import defaultdict
+import hashlib
+import threading
+import uuid
+
+from sqlalchemy import event
+from sqlalchemy.sql.expression import Update
+from sqlalchemy.sql.expression import UpdateBase
+
+from nailgun.db import db
+from nailgun.db import engine
+
+
+class TableRevisions(object):
+    """Change counters of database tables. Every INSERT, UPDATE
+    and DELETE statement marks its table as changed, counters of
+    marked tables are bumped when the transaction is committed.
+    Counters live in memory, so every process gets its own random
+    token and tags built before restart never match again.
+    """
+
+    # bookkeeping columns which aren't rendered by API,
+    # statements updating only them don't change revision
+    untracked = {
+        'nodes': frozenset(['timestamp'])
+    }
+
+    def __init__(self):
+        self.token = uuid.uuid4().hex
+        self.lock = threading.Lock()
+        self.counters = defaultdict(int)
+        self.local = threading.local()
+
+    def _pending(self):
+        if not hasattr(self.local, 'tables'):
+            self.local.tables = set()
+        return self.local.tables
+
+    def executed(self, conn, clauseelement, multiparams, params, result):
+        if not isinstance(clauseelement, UpdateBase):
+            return
+        table = clauseelement.table.name
+        if isinstance(clauseelement, Update) and clauseelement.parameters:
+            columns = set(
+                getattr(c, 'key', c) for c in clauseelement.parameters
+            )
+            if columns <= self.untracked.get(table, frozenset()):
+                return
+        self._pending().add(table)
+
+    def committed(self, session):
+        tables = self._pending()
+        if not tables:
+            return
+        with self.lock:
+            for table in tables:
+                self.counters[table] += 1
+        tables.clear()
+
+    def rolled_back(self, session):
+        self._pending().clear()
+
+    def get(self, table):
+        with self.lock:
+            return self.counters[table]
+
+    def etag(self, tables, *extra):
+        """Returns entity tag of a resource built from current
+        revisions of tables it's rendered from.
+
+        :param tables: names of tables resource depends on.
+        :param extra: anything else affecting the response,
+            e.g. query string.
+        :returns: quoted entity tag.
+        """
+        with self.lock:
+            state = [(t, self.counters[t]) for t in sorted(tables)]
+        digest = hashlib.sha1(
+            repr((self.token, state, extra))
+        ).hexdigest()
+        return '"%s"' % digest
+
+
+revisions = TableRevisions()
+
+event.listen(engine, 'after_execute', revisions.executed)
+event.listen(db.session_factory, 'after_commit', revisions.committed)
+event.listen(db.session_factory, 'after_rollback', revisions.rolled_back)
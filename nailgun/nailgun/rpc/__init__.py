@@ -15,10 +15,13 @@
 #    under the License.
 
 import json
+import Queue
+import threading
+import time
 
 from kombu import Connection
 from kombu import Exchange
-from kombu import Queue
+from kombu import Queue as KombuQueue
 
 from nailgun.logger import logger
 from nailgun.settings import settings
@@ -40,7 +43,7 @@ naily_exchange = Exchange(
     durable=True
 )
 
-naily_queue = Queue(
+naily_queue = KombuQueue(
     'naily',
     exchange=naily_exchange,
     routing_key='naily'
@@ -52,21 +55,151 @@ nailgun_exchange = Exchange(
     durable=True
 )
 
-nailgun_queue = Queue(
+nailgun_queue = KombuQueue(
     'nailgun',
     exchange=nailgun_exchange,
     routing_key='nailgun'
 )
 
 
+class LazyMessage(object):
+    """Message representation for logging. It is dumped
+    only if record is really emitted and truncated to limit.
+    """
+
+    def __init__(self, message, limit=None):
+        self.message = message
+        self.limit = limit
+
+    def __str__(self):
+        dumped = json.dumps(self.message)
+        if self.limit and len(dumped) > self.limit:
+            return "{0}... ({1} bytes total)".format(
+                dumped[:self.limit],
+                len(dumped)
+            )
+        return dumped
+
+
+class ProducerPool(object):
+    """Process-wide pool of persistent AMQP connections
+    with producers. Connections are opened on demand and
+    reused by following casts, connection errors lead to
+    reconnection and republishing of message.
+    """
+
+    def __init__(self, url, limit=4, max_retries=3):
+        self.url = url
+        self.limit = limit
+        self.max_retries = max_retries
+        self._free = Queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self.stats = {
+            'published': 0,
+            'errors': 0,
+            'reconnects': 0,
+            'publish_time_total': 0.0,
+            'publish_time_max': 0.0
+        }
+
+    def _create(self):
+        connection = Connection(self.url)
+        producer = connection.Producer(serializer='json')
+        return connection, producer
+
+    def acquire(self):
+        try:
+            return self._free.get_nowait()
+        except Queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.limit:
+                self._created += 1
+                try:
+                    return self._create()
+                except Exception:
+                    self._created -= 1
+                    raise
+        return self._free.get()
+
+    def release(self, item):
+        self._free.put(item)
+
+    def discard(self, item):
+        connection, producer = item
+        try:
+            connection.release()
+        except Exception:
+            logger.debug("Failed to close broken AMQP connection",
+                         exc_info=True)
+        with self._lock:
+            self._created -= 1
+
+    def close(self):
+        while True:
+            try:
+                item = self._free.get_nowait()
+            except Queue.Empty:
+                break
+            self.discard(item)
+
+    def _on_connection_error(self, exc, interval):
+        with self._lock:
+            self.stats['reconnects'] += 1
+        logger.warning(
+            "AMQP connection error: %s, reconnecting in %s seconds",
+            exc, interval
+        )
+
+    def publish(self, message, exchange, routing_key, declare=None):
+        item = self.acquire()
+        connection, producer = item
+        started = time.time()
+        try:
+            publish = connection.ensure(
+                producer,
+                producer.publish,
+                errback=self._on_connection_error,
+                max_retries=self.max_retries
+            )
+            publish(message,
+                    exchange=exchange,
+                    routing_key=routing_key,
+                    declare=declare or [])
+        except Exception:
+            with self._lock:
+                self.stats['errors'] += 1
+            self.discard(item)
+            raise
+        elapsed = time.time() - started
+        with self._lock:
+            self.stats['published'] += 1
+            self.stats['publish_time_total'] += elapsed
+            self.stats['publish_time_max'] = max(
+                self.stats['publish_time_max'], elapsed)
+        self.release(item)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats['connections'] = self._created
+        return stats
+
+
+producer_pool = ProducerPool(
+    conn_str,
+    limit=int(settings.RPC_PRODUCER_POOL_SIZE or 4),
+    max_retries=int(settings.RPC_PUBLISH_MAX_RETRIES or 3)
+)
+
+
 def cast(name, message):
     logger.debug(
-        "RPC cast to orchestrator:\n{0}".format(
-            json.dumps(message, indent=4)
-        )
+        "RPC cast to orchestrator:\n%s",
+        LazyMessage(message, int(settings.RPC_LOG_MESSAGE_LIMIT or 0))
     )
-    with Connection(conn_str) as conn:
-        with conn.Producer(serializer='json') as producer:
-            producer.publish(message,
-                             exchange=naily_exchange, routing_key=name,
-                             declare=[naily_queue])
+    producer_pool.publish(message,
+                          exchange=naily_exchange,
+                          routing_key=name,
+                          declare=[naily_queue])
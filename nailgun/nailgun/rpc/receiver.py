@@ -16,14 +16,18 @@
 
 import itertools
 import json
+import threading
+import time
 import traceback
 
+from sqlalchemy import case
 from sqlalchemy import or_
 
 from nailgun.api.models import IPAddr
 from nailgun.api.models import Node
 from nailgun.api.models import Release
 from nailgun.api.models import Task
+from nailgun.changes import feed
 from nailgun.db import db
 from nailgun.logger import logger
 from nailgun.network.manager import NetworkManager
@@ -38,6 +42,11 @@ class TaskNotFound(Exception):
 
 class NailgunReceiver(object):
 
+    # progress-only deployment updates waiting to be applied:
+    # task uuid -> (last apply time, nodes progress, task progress)
+    _progress_buffer = {}
+    _progress_lock = threading.Lock()
+
     @classmethod
     def remove_nodes_resp(cls, **kwargs):
         logger.info(
@@ -60,6 +69,8 @@ class NailgunReceiver(object):
                     str(node)
                 )
                 break
+            feed.publish('node', node_db.id, node_db.cluster_id,
+                         deleted=True)
             db().delete(node_db)
 
         for node in inaccessible_nodes:
@@ -69,6 +80,8 @@ class NailgunReceiver(object):
                 logger.warn(
                     u'Node %s not answered by RPC, removing from db',
                     node_db.human_readable_name)
+                feed.publish('node', node_db.id, node_db.cluster_id,
+                             deleted=True)
                 db().delete(node_db)
 
         for node in error_nodes:
@@ -82,6 +95,8 @@ class NailgunReceiver(object):
             node_db.pending_deletion = False
             node_db.status = 'error'
             db().add(node_db)
+            feed.publish('node', node_db.id, node_db.cluster_id,
+                         status='error', pending_deletion=False)
             node['name'] = node_db.name
         db().commit()
 
@@ -144,11 +159,9 @@ class NailgunReceiver(object):
                     cluster_name
                 )
             )
+            notifier.flush()
 
         elif task.status in ('error',):
-            cluster.status = 'error'
-            db().add(cluster)
-            db().commit()
             if not task.message:
                 task.message = "Failed to delete nodes:\n{0}".format(
                     cls._generate_error_message(
@@ -156,11 +169,180 @@ class NailgunReceiver(object):
                         error_types=('deletion',)
                     )
                 )
+            cluster.status = 'error'
+            db().add(cluster)
+            db().commit()
             notifier.notify(
                 "error",
                 task.message,
                 cluster.id
             )
+            notifier.flush()
+
+    @classmethod
+    def _is_progress_only(cls, kwargs):
+        if kwargs.get('status') not in (None, 'running') or \
+                kwargs.get('error'):
+            return False
+        return all(
+            set(node.keys()) <= set(['uid', 'progress'])
+            for node in kwargs.get('nodes') or []
+        )
+
+    @classmethod
+    def _coalesce_progress(cls, kwargs):
+        """Merges progress-only deployment updates of a task
+        received within DEPLOY_PROGRESS_COALESCE_WINDOW seconds.
+
+        :param kwargs: deploy_resp arguments.
+        :returns: arguments to apply now or None if update is
+            buffered. Buffered progress is applied with the next
+            update received after window or with any other update.
+        """
+        window = float(settings.DEPLOY_PROGRESS_COALESCE_WINDOW or 0)
+        if not window:
+            return kwargs
+
+        task_uuid = kwargs.get('task_uuid')
+        now = time.time()
+        with cls._progress_lock:
+            last_applied, nodes, progress = cls._progress_buffer.pop(
+                task_uuid, (0, {}, None))
+
+            if cls._is_progress_only(kwargs):
+                for node in kwargs.get('nodes') or []:
+                    if 'progress' in node:
+                        nodes[node['uid']] = node['progress']
+                if kwargs.get('progress') is not None:
+                    progress = kwargs['progress']
+                if now - last_applied < window:
+                    cls._progress_buffer[task_uuid] = (
+                        last_applied, nodes, progress)
+                    return None
+                cls._progress_buffer[task_uuid] = (now, {}, None)
+                return dict(
+                    kwargs,
+                    progress=progress,
+                    nodes=[
+                        {'uid': uid, 'progress': node_progress}
+                        for uid, node_progress in nodes.iteritems()
+                    ]
+                )
+
+            if kwargs.get('status') not in ('ready', 'error'):
+                cls._progress_buffer[task_uuid] = (now, {}, None)
+            if nodes:
+                # buffered progress goes first to be
+                # overridden by fields of current update
+                kwargs = dict(kwargs, nodes=[
+                    {'uid': uid, 'progress': node_progress}
+                    for uid, node_progress in nodes.iteritems()
+                ] + list(kwargs.get('nodes') or []))
+            return kwargs
+
+    @classmethod
+    def _update_nodes(cls, task, nodes):
+        """Applies nodes updates with a single UPDATE query.
+        Fields which differ between nodes are set with CASE.
+        """
+        update_fields = (
+            'error_msg',
+            'error_type',
+            'status',
+            'progress',
+            'online'
+        )
+
+        merged = {}
+        for node in nodes:
+            merged.setdefault(int(node['uid']), {}).update(node)
+        if not merged:
+            return
+
+        existing = dict(
+            (node_id, (name, error_msg))
+            for node_id, name, error_msg in db().query(
+                Node.id, Node.name, Node.error_msg
+            ).filter(Node.id.in_(merged.keys()))
+        )
+
+        values = {}
+        for uid, node in merged.iteritems():
+            if uid not in existing:
+                logger.warning(
+                    u"No node found with uid '{0}' - nothing changed".format(
+                        uid
+                    )
+                )
+                continue
+            name, error_msg = existing[uid]
+
+            node_values = dict(
+                (param, node[param])
+                for param in update_fields if param in node
+            )
+            if (node.get('status') == 'error' and 'progress' in node) \
+                    or node.get('online') is False:
+                # If failure occurred with node
+                # it's progress should be 100
+                node_values['progress'] = 100
+                error_msg = node_values.get('error_msg', error_msg)
+                # Setting node error_msg for offline nodes
+                if node.get('online') is False and not error_msg:
+                    error_msg = node_values['error_msg'] = \
+                        u"Node is offline"
+                # Notification on particular node failure
+                notifier.notify(
+                    "error",
+                    u"Failed to deploy node '{0}': {1}".format(
+                        name,
+                        error_msg or "Unknown error"
+                    ),
+                    cluster_id=task.cluster_id,
+                    node_id=uid,
+                    task_uuid=task.uuid
+                )
+
+            for param, value in node_values.iteritems():
+                logger.debug(
+                    u"Updating node {0} - set {1} to {2}".format(
+                        uid,
+                        param,
+                        value
+                    )
+                )
+                values.setdefault(param, {})[uid] = value
+
+        if not values:
+            return
+
+        node_ids = set()
+        update = {}
+        for param, nodes_values in values.iteritems():
+            node_ids.update(nodes_values.keys())
+            if len(set(nodes_values.values())) == 1:
+                update[param] = nodes_values.values()[0]
+            else:
+                update[param] = case(
+                    nodes_values,
+                    value=Node.id,
+                    else_=getattr(Node, param)
+                )
+        db().query(Node).filter(
+            Node.id.in_(node_ids)
+        ).update(update, synchronize_session=False)
+        for uid in node_ids:
+            feed.publish(
+                'node',
+                uid,
+                task.cluster_id,
+                **dict(
+                    (param, nodes_values[uid])
+                    for param, nodes_values in values.iteritems()
+                    if uid in nodes_values
+                )
+            )
+        db().commit()
 
     @classmethod
     def deploy_resp(cls, **kwargs):
@@ -168,6 +350,11 @@ class NailgunReceiver(object):
             "RPC method deploy_resp received: %s" %
             json.dumps(kwargs)
         )
+        kwargs = cls._coalesce_progress(kwargs)
+        if kwargs is None:
+            logger.debug("Progress update is buffered")
+            return
+
         task_uuid = kwargs.get('task_uuid')
         nodes = kwargs.get('nodes') or []
         message = kwargs.get('error')
@@ -187,83 +374,14 @@ class NailgunReceiver(object):
             status = task.status
 
         # First of all, let's update nodes in database
-        for node in nodes:
-            node_db = db().query(Node).get(node['uid'])
-
-            if not node_db:
-                logger.warning(
-                    u"No node found with uid '{0}' - nothing changed".format(
-                        node['uid']
-                    )
-                )
-                continue
-
-            update_fields = (
-                'error_msg',
-                'error_type',
-                'status',
-                'progress',
-                'online'
-            )
-            for param in update_fields:
-                if param in node:
-                    logger.debug(
-                        u"Updating node {0} - set {1} to {2}".format(
-                            node['uid'],
-                            param,
-                            node[param]
-                        )
-                    )
-                    setattr(node_db, param, node[param])
-
-                    if param == 'progress' and node.get('status') == 'error' \
-                            or node.get('online') is False:
-                        # If failure occurred with node
-                        # it's progress should be 100
-                        node_db.progress = 100
-                        # Setting node error_msg for offline nodes
-                        if node.get('online') is False \
-                                and not node_db.error_msg:
-                            node_db.error_msg = u"Node is offline"
-                        # Notification on particular node failure
-                        notifier.notify(
-                            "error",
-                            u"Failed to deploy node '{0}': {1}".format(
-                                node_db.name,
-                                node_db.error_msg or "Unknown error"
-                            ),
-                            cluster_id=task.cluster_id,
-                            node_id=node['uid'],
-                            task_uuid=task_uuid
-                        )
-
-            db().add(node_db)
-            db().commit()
+        cls._update_nodes(task, nodes)
 
         # We should calculate task progress by nodes info
         task = db().query(Task).filter_by(uuid=task_uuid).first()
-        coeff = settings.PROVISIONING_PROGRESS_COEFF or 0.3
         if nodes and not progress:
-            nodes_progress = []
-            nodes_db = db().query(Node).filter_by(
-                cluster_id=task.cluster_id).all()
-            for node in nodes_db:
-                if node.status == "discover":
-                    nodes_progress.append(0)
-                elif not node.online:
-                    nodes_progress.append(100)
-                elif node.status in ['provisioning', 'provisioned'] or \
-                        node.needs_reprovision:
-                    nodes_progress.append(float(node.progress) * coeff)
-                elif node.status in ['deploying', 'ready'] or \
-                        node.needs_redeploy:
-                    nodes_progress.append(
-                        100.0 * coeff + float(node.progress) * (1.0 - coeff)
-                    )
-            if nodes_progress:
-                progress = int(
-                    float(sum(nodes_progress)) / len(nodes_progress)
-                )
+            nodes_progress = TaskHelper.get_nodes_progress(task.cluster_id)
+            if nodes_progress is not None:
+                progress = nodes_progress
 
         # Let's check the whole task status
         if status in ('error',):
@@ -734,6 +852,7 @@ class NailgunReceiver(object):
             release.name
         )
         notifier.notify("done", success_msg)
+        notifier.flush()
 
     @classmethod
     def _download_release_error(
@@ -747,3 +866,4 @@ class NailgunReceiver(object):
         # TODO(NAME): remove this ugly checks
         if error_message != 'Task aborted':
             notifier.notify('error', error_message)
+        notifier.flush()
@@ -14,7 +14,9 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import Queue
 import threading
+import time
 import traceback
 
 from kombu import Connection
@@ -24,29 +26,183 @@ from nailgun.db import db
 from nailgun.logger import logger
 import nailgun.rpc as rpc
 from nailgun.rpc.receiver import NailgunReceiver
+from nailgun.settings import settings
+
+
+class ConsumerStats(object):
+    """Thread-safe counters of RPC consumer: handled
+    and redelivered messages and handler latency
+    per receiver method.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.received = 0
+        self.redelivered = 0
+        self.methods = {}
+
+    def message_received(self, redelivered=False):
+        with self.lock:
+            self.received += 1
+            if redelivered:
+                self.redelivered += 1
+
+    def message_handled(self, method, elapsed, failed=False):
+        with self.lock:
+            stats = self.methods.setdefault(method, {
+                'count': 0,
+                'errors': 0,
+                'time_total': 0.0,
+                'time_max': 0.0
+            })
+            stats['count'] += 1
+            if failed:
+                stats['errors'] += 1
+            stats['time_total'] += elapsed
+            stats['time_max'] = max(stats['time_max'], elapsed)
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                'received': self.received,
+                'redelivered': self.redelivered,
+                'methods': dict(
+                    (method, dict(stats))
+                    for method, stats in self.methods.iteritems()
+                )
+            }
+
+
+class RPCWorkerPool(object):
+    """Pool of threads handling messages in parallel.
+    Messages are routed to workers by task uuid, so
+    messages of the same task are handled in order
+    they were received. Handled messages are put into
+    done queue to be acknowledged by consumer thread.
+    """
+
+    def __init__(self, size, handler):
+        self.handler = handler
+        self.done = Queue.Queue()
+        self.queues = [Queue.Queue() for i in xrange(size)]
+        self.workers = [
+            threading.Thread(target=self._work, args=(queue,))
+            for queue in self.queues
+        ]
+        for worker in self.workers:
+            worker.daemon = True
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+
+    def stop(self):
+        for queue in self.queues:
+            queue.put(None)
+        for worker in self.workers:
+            worker.join()
+
+    def dispatch(self, body, msg):
+        key = (body.get("args") or {}).get("task_uuid")
+        queue = self.queues[hash(key) % len(self.queues)]
+        queue.put((body, msg))
+
+    def qsize(self):
+        return sum(queue.qsize() for queue in self.queues)
+
+    def _work(self, queue):
+        while True:
+            item = queue.get()
+            if item is None:
+                break
+            body, msg = item
+            try:
+                self.handler(body)
+            finally:
+                self.done.put(msg)
+                db.remove()
 
 
 class RPCConsumer(ConsumerMixin):
 
-    def __init__(self, connection, receiver):
+    def __init__(self, connection, receiver,
+                 prefetch_count=None, workers=1):
         self.connection = connection
         self.receiver = receiver
+        self.prefetch_count = prefetch_count
+        self.stats = ConsumerStats()
+        self.pool = None
+        if workers > 1:
+            self.pool = RPCWorkerPool(workers, self.handle_msg)
 
     def get_consumers(self, Consumer, channel):
-        return [Consumer(queues=[rpc.nailgun_queue],
-                         callbacks=[self.consume_msg])]
+        consumer = Consumer(queues=[rpc.nailgun_queue],
+                            callbacks=[self.consume_msg])
+        if self.prefetch_count:
+            consumer.qos(prefetch_count=self.prefetch_count)
+        return [consumer]
 
-    def consume_msg(self, body, msg):
-        callback = getattr(self.receiver, body["method"])
+    def on_iteration(self):
+        self.ack_handled()
+
+    def ack_handled(self):
+        """Acknowledges messages handled by worker pool.
+        Should be called from consumer thread only.
+        """
+        if not self.pool:
+            return
+        while True:
+            try:
+                msg = self.pool.done.get_nowait()
+            except Queue.Empty:
+                break
+            msg.ack()
+
+    def handle_msg(self, body):
+        started = time.time()
+        failed = False
         try:
+            callback = getattr(self.receiver, body["method"])
             callback(**body["args"])
             db().commit()
         except Exception:
+            failed = True
             logger.error(traceback.format_exc())
             db().rollback()
         finally:
-            msg.ack()
             db().expire_all()
+            self.stats.message_handled(
+                body.get("method"),
+                time.time() - started,
+                failed
+            )
+
+    def consume_msg(self, body, msg):
+        self.stats.message_received(
+            (msg.delivery_info or {}).get("redelivered", False)
+        )
+        if self.pool:
+            self.ack_handled()
+            self.pool.dispatch(body, msg)
+            return
+        try:
+            self.handle_msg(body)
+        finally:
+            msg.ack()
+
+    def run(self):
+        if self.pool:
+            self.pool.start()
+        try:
+            super(RPCConsumer, self).run()
+        finally:
+            if self.pool:
+                self.pool.stop()
+
+    def get_stats(self):
+        stats = self.stats.as_dict()
+        stats['queue_depth'] = self.pool.qsize() if self.pool else 0
+        return stats
 
 
 class RPCKombuThread(threading.Thread):
@@ -56,6 +212,7 @@ class RPCKombuThread(threading.Thread):
         self.stoprequest = threading.Event()
         self.receiver = rcvr_class
         self.connection = None
+        self.consumer = None
 
     def join(self, timeout=None):
         self.stoprequest.set()
@@ -64,7 +221,15 @@ class RPCKombuThread(threading.Thread):
         self.consumer.should_stop = True
         super(RPCKombuThread, self).join(timeout)
 
+    def get_stats(self):
+        return self.consumer.get_stats() if self.consumer else {}
+
     def run(self):
         with Connection(rpc.conn_str) as conn:
-            self.consumer = RPCConsumer(conn, self.receiver)
+            self.consumer = RPCConsumer(
+                conn,
+                self.receiver,
+                prefetch_count=int(settings.RPC_CONSUMER_PREFETCH or 0),
+                workers=int(settings.RPC_CONSUMER_WORKERS or 1)
+            )
             self.consumer.run()
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from multiprocessing.pool import ThreadPool
+import re
+import shlex
+import subprocess
+import threading
+
+from nailgun.api.models import Task
+from nailgun.db import db
+from nailgun.logger import logger
+
+
+class PuppetCertCleaner(object):
+    """Removes certificates of deleted nodes from puppet master.
+    Hostnames are passed to clean command in batches, a bounded
+    number of commands is running in parallel. If batch fails,
+    its hostnames are cleaned one by one, so every failed host
+    gets its own output. Command stops at the first failed host,
+    so certificates of hosts before it are already removed and
+    their retries report that certificate isn't found, such
+    hosts are counted as cleaned.
+    """
+
+    # output of clean command for missing certificate
+    not_found = re.compile(r'could not find', re.IGNORECASE)
+
+    def __init__(self, command, workers=4, batch_size=20):
+        '''
+        :param command: clean command, hostnames are appended to it.
+        :param workers: number of commands running in parallel.
+        :param batch_size: max number of hostnames passed to command.
+        '''
+        if isinstance(command, basestring):
+            command = shlex.split(command)
+        self.command = list(command)
+        self.workers = max(workers, 1)
+        self.batch_size = max(batch_size, 1)
+
+    def run_command(self, hostnames):
+        """Runs clean command for hostnames.
+
+        :returns: tuple of exit code (None if command can't
+            be started) and command output.
+        """
+        cmd = self.command + list(hostnames)
+        try:
+            proc = subprocess.Popen(
+                cmd,
+                shell=False,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT
+            )
+            output = proc.communicate()[0]
+        except OSError as exc:
+            logger.warning("'%s' can't be executed: %s",
+                           ' '.join(cmd), exc)
+            return None, str(exc)
+        logger.info("'%s' executed with code %s, output: '%s'",
+                    ' '.join(cmd), proc.returncode, output)
+        return proc.returncode, output
+
+    def clean_batch(self, hostnames):
+        """Cleans certificates of hostnames.
+
+        :returns: dict with error of every failed hostname.
+            Hostnames which have no certificate aren't failed.
+        """
+        code, output = self.run_command(hostnames)
+        if code == 0:
+            return {}
+        if len(hostnames) == 1:
+            if self.not_found.search(output):
+                return {}
+            return {hostnames[0]: output.strip() or
+                    u"Exit code {0}".format(code)}
+
+        failed = {}
+        for hostname in hostnames:
+            failed.update(self.clean_batch([hostname]))
+        return failed
+
+    def clean(self, hostnames):
+        """Cleans certificates of hostnames.
+
+        :returns: dict with lists of cleaned hostnames
+            and errors of failed ones.
+        """
+        hostnames = sorted(set(hostnames))
+        batches = [
+            hostnames[i:i + self.batch_size]
+            for i in xrange(0, len(hostnames), self.batch_size)
+        ]
+        failed = {}
+        if batches:
+            pool = ThreadPool(min(self.workers, len(batches)))
+            try:
+                for batch_failed in pool.imap_unordered(
+                        self.clean_batch, batches):
+                    failed.update(batch_failed)
+            finally:
+                pool.close()
+                pool.join()
+
+        return {
+            'cleaned': [h for h in hostnames if h not in failed],
+            'failed': failed
+        }
+
+    def report(self, task_uuid, results):
+        """Saves cleaning results into task result.
+        """
+        task = db().query(Task).filter_by(uuid=task_uuid).first()
+        if not task:
+            logger.warning("Can't save puppet certs cleaning results: "
+                           "no task with UUID %s found", task_uuid)
+            return
+        result = dict(task.result or {})
+        result['puppet_certs'] = results
+        task.result = result
+        db().commit()
+
+    def start(self, task_uuid, hostnames):
+        """Cleans certificates in background thread
+        and saves results into task result.
+
+        :returns: started thread.
+        """
+        thread = threading.Thread(
+            target=self._run, args=(task_uuid, list(hostnames)))
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def _run(self, task_uuid, hostnames):
+        try:
+            results = self.clean(hostnames)
+            if results['failed']:
+                logger.warning("Failed to remove node certs from puppet: "
+                               "%s", results['failed'])
+            self.report(task_uuid, results)
+        except Exception:
+            logger.exception("Puppet certs cleaning failed")
+            db().rollback()
+        finally:
+            db.remove()
@@ -29,6 +29,7 @@ from nailgun.api.models import NodeAttributes
 from nailgun.db import db
 from nailgun.network.manager import NetworkManager
 from nailgun import notifier
+from nailgun.orchestrator.serializers import expand
 from nailgun.rpc.receiver import NailgunReceiver
 from nailgun.settings import settings
 
@@ -128,7 +129,7 @@ class FakeDeploymentThread(FakeAmpqThread):
 
         kwargs = {
             'task_uuid': self.task_uuid,
-            'nodes': self.data['args']['deployment_info'],
+            'nodes': expand(self.data['args']['deployment_info']),
             'status': 'running'
         }
 
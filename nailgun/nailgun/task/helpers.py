@@ -14,11 +14,22 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from collections import defaultdict
 import os
 import shutil
 
+from sqlalchemy import and_
+from sqlalchemy import case
+from sqlalchemy import exists
+from sqlalchemy import func
+from sqlalchemy import not_
+from sqlalchemy import or_
+
 from nailgun.api.models import IPAddr
+from nailgun.api.models import Node
+from nailgun.api.models import PendingNodeRoles
 from nailgun.api.models import Task
+from nailgun.changes import feed
 from nailgun.db import db
 from nailgun.logger import logger
 from nailgun.network.manager import NetworkManager
@@ -46,28 +57,68 @@ class TaskHelper(object):
 
     @classmethod
     def prepare_syslog_dir(cls, node, prefix=None):
-        logger.debug("Preparing syslog directories for node: %s", node.fqdn)
+        cls.prepare_syslog_dirs([node], prefix)
+
+    @classmethod
+    def prepare_syslog_dirs(cls, nodes, prefix=None):
+        """Prepares syslog directories of nodes in one pass
+        and reloads rsyslog once.
+
+        :param nodes: list of Node objects.
+        :param prefix: root of remote logs, SYSLOG_DIR by default.
+        """
+        layouts = cls.make_syslog_layouts(nodes, prefix)
+        for layout in layouts:
+            cls.apply_syslog_layout(layout)
+        if layouts:
+            os.system(
+                settings.SYSLOG_RELOAD_COMMAND or
+                "/usr/bin/pkill -HUP rsyslog")
+
+    @classmethod
+    def make_syslog_layouts(cls, nodes, prefix=None):
+        """Computes syslog directories of nodes. Admin IPs
+        of all nodes are fetched with single query.
+
+        :returns: list of dicts with paths of bootstrap ('old'),
+            backup ('bak') and node ('new') directories and
+            admin IP symlinks ('links') pointing to 'target'.
+        """
         if not prefix:
             prefix = settings.SYSLOG_DIR
-        logger.debug("prepare_syslog_dir prefix=%s", prefix)
-
-        old = os.path.join(prefix, str(node.ip))
-        bak = os.path.join(prefix, "%s.bak" % str(node.fqdn))
-        new = os.path.join(prefix, str(node.fqdn))
+        logger.debug("make_syslog_layouts prefix=%s", prefix)
+        if not nodes:
+            return []
 
         netmanager = NetworkManager()
         admin_net_id = netmanager.get_admin_network_id()
-        links = map(
-            lambda i: os.path.join(prefix, i.ip_addr),
-            db().query(IPAddr.ip_addr).
-            filter_by(node=node.id).
-            filter_by(network=admin_net_id).all()
-        )
+        admin_ips = defaultdict(list)
+        for node_id, ip_addr in db().query(
+            IPAddr.node, IPAddr.ip_addr
+        ).filter(
+            IPAddr.node.in_([n.id for n in nodes])
+        ).filter_by(
+            network=admin_net_id
+        ).order_by(IPAddr.id):
+            admin_ips[node_id].append(os.path.join(prefix, ip_addr))
 
-        logger.debug("prepare_syslog_dir old=%s", old)
-        logger.debug("prepare_syslog_dir new=%s", new)
-        logger.debug("prepare_syslog_dir bak=%s", bak)
-        logger.debug("prepare_syslog_dir links=%s", str(links))
+        return [{
+            'old': os.path.join(prefix, str(node.ip)),
+            'bak': os.path.join(prefix, "%s.bak" % str(node.fqdn)),
+            'new': os.path.join(prefix, str(node.fqdn)),
+            'target': str(node.fqdn),
+            'links': admin_ips[node.id]
+        } for node in nodes]
+
+    @classmethod
+    def apply_syslog_layout(cls, layout):
+        old = layout['old']
+        bak = layout['bak']
+        new = layout['new']
+        logger.debug("Preparing syslog directory %s", new)
+        logger.debug("apply_syslog_layout old=%s", old)
+        logger.debug("apply_syslog_layout bak=%s", bak)
+        logger.debug("apply_syslog_layout links=%s", layout['links'])
 
         # backup directory if it exists
         if os.path.isdir(new):
@@ -96,7 +147,7 @@ class TaskHelper(object):
             os.makedirs(new)
 
         # creating symlinks
-        for l in links:
+        for l in layout['links']:
             if os.path.islink(l) or os.path.isfile(l):
                 logger.debug("%s already exists. "
                              "Trying to unlink", l)
@@ -106,9 +157,7 @@ class TaskHelper(object):
                              "Trying to remove", l)
                 shutil.rmtree(l)
             logger.debug("Creating symlink %s -> %s", l, new)
-            os.symlink(str(node.fqdn), l)
-
-        os.system("/usr/bin/pkill -HUP rsyslog")
+            os.symlink(layout['target'], l)
 
     @classmethod
     def update_task_status(cls, uuid, status, progress, msg="",
@@ -122,8 +171,10 @@ class TaskHelper(object):
         previous_status = task.status
         data = {'status': status, 'progress': progress,
                 'message': msg, 'result': result}
+        changed = False
         for key, value in data.iteritems():
-            if value is not None:
+            if value is not None and getattr(task, key) != value:
+                changed = True
                 setattr(task, key, value)
                 logger.info(
                     u"Task {0} ({1}) {2} is set to {3}".format(
@@ -133,7 +184,20 @@ class TaskHelper(object):
                         value
                     )
                 )
+        if not changed:
+            # nothing to propagate to cluster and parent task
+            return
         db().add(task)
+        feed.publish(
+            'task',
+            task.id,
+            task.cluster_id,
+            uuid=task.uuid,
+            name=task.name,
+            status=task.status,
+            progress=task.progress,
+            message=task.message
+        )
         db().commit()
 
         if previous_status != status and task.cluster_id:
@@ -145,6 +209,44 @@ class TaskHelper(object):
             logger.debug("Updating parent task: %s", task.parent.uuid)
             cls.update_parent_task(task.parent.uuid)
 
+    @classmethod
+    def get_nodes_progress(cls, cluster_id):
+        """Calculates deployment progress of cluster nodes
+        with a single aggregate query.
+
+        :param cluster_id: Cluster ID.
+        :returns: progress in percents or None if there
+            are no nodes taking part in deployment.
+        """
+        coeff = settings.PROVISIONING_PROGRESS_COEFF or 0.3
+        not_deleting = not_(func.coalesce(Node.pending_deletion, False))
+        has_pending_roles = exists().where(PendingNodeRoles.node == Node.id)
+        needs_reprovision = and_(
+            Node.status == 'error',
+            Node.error_type == 'provision',
+            not_deleting
+        )
+        needs_redeploy = and_(
+            or_(Node.status == 'error', has_pending_roles),
+            not_deleting
+        )
+        node_progress = case([
+            (Node.status == 'discover', 0),
+            (not_(func.coalesce(Node.online, False)), 100),
+            (or_(Node.status.in_(['provisioning', 'provisioned']),
+                 needs_reprovision),
+             Node.progress * coeff),
+            (or_(Node.status.in_(['deploying', 'ready']),
+                 needs_redeploy),
+             100.0 * coeff + Node.progress * (1.0 - coeff))
+        ])
+        progress = db().query(func.avg(node_progress)).filter(
+            Node.cluster_id == cluster_id
+        ).scalar()
+        if progress is None:
+            return None
+        return int(float(progress))
+
     @classmethod
     def update_parent_task(cls, uuid):
         task = db().query(Task).filter_by(uuid=uuid).first()
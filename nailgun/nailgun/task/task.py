@@ -15,8 +15,6 @@
 #    under the License.
 
 import json
-import shlex
-import subprocess
 
 import netaddr
 from sqlalchemy.orm import ColumnProperty
@@ -34,6 +32,7 @@ from nailgun.network.manager import NetworkManager
 from nailgun.orchestrator.serializers import serialize
 import nailgun.rpc as rpc
 from nailgun.settings import settings
+from nailgun.task.certs import PuppetCertCleaner
 from nailgun.task.fake import FAKE_THREADS
 from nailgun.task.helpers import TaskHelper
 
@@ -126,7 +125,10 @@ class DeploymentTask(object):
             'respond_to': 'deploy_resp',
             'args': {
                 'task_uuid': task.uuid,
-                'deployment_info': serialize(task.cluster)
+                'deployment_info': serialize(
+                    task.cluster,
+                    compact=bool(int(settings.COMPACT_DEPLOYMENT_INFO or 0))
+                )
             }
         }
 
@@ -269,8 +271,9 @@ class ProvisionTask(object):
                     node_data['interfaces_extra'][i['name']]['onboot'] = 'yes'
 
             nodes_data.append(node_data)
-            if not USE_FAKE:
-                TaskHelper.prepare_syslog_dir(node)
+
+        if not USE_FAKE:
+            TaskHelper.prepare_syslog_dirs(nodes)
 
         message = {
             'method': 'provision',
@@ -368,45 +371,28 @@ class DeletionTask(object):
         # only real tasks
         engine_nodes = []
         if not USE_FAKE:
+            hostnames = []
             for node in nodes_to_delete_constant:
                 slave_name = TaskHelper.make_slave_name(node['id'])
                 logger.debug("Pending node to be removed from cobbler %s",
                              slave_name)
                 engine_nodes.append(slave_name)
-                try:
-                    node_db = db().query(Node).get(node['id'])
-                    if node_db and node_db.fqdn:
-                        node_hostname = node_db.fqdn
-                    else:
-                        node_hostname = TaskHelper.make_slave_fqdn(node['id'])
-                    logger.info("Removing node cert from puppet: %s",
-                                node_hostname)
-                    cmd = "puppet cert clean {0}".format(node_hostname)
-                    proc = subprocess.Popen(
-                        shlex.split(cmd),
-                        shell=False,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE
-                    )
-                    p_stdout, p_stderr = proc.communicate()
-                    logger.info(
-                        "'{0}' executed, STDOUT: '{1}',"
-                        " STDERR: '{2}'".format(
-                            cmd,
-                            p_stdout,
-                            p_stderr
-                        )
-                    )
-                except OSError:
-                    logger.warning(
-                        "'{0}' returned non-zero exit code".format(
-                            cmd
-                        )
-                    )
-                except Exception as e:
-                    logger.warning("Exception occurred while trying to \
-                            remove the system from Cobbler: '{0}'".format(
-                        e.message))
+                node_db = db().query(Node).get(node['id'])
+                if node_db and node_db.fqdn:
+                    hostnames.append(node_db.fqdn)
+                else:
+                    hostnames.append(TaskHelper.make_slave_fqdn(node['id']))
+
+            if hostnames:
+                logger.info("Removing node certs from puppet: %s",
+                            ', '.join(hostnames))
+                PuppetCertCleaner(
+                    settings.PUPPET_CERT_CLEAN_COMMAND or
+                    "puppet cert clean",
+                    workers=int(settings.PUPPET_CERT_CLEAN_WORKERS or 4),
+                    batch_size=int(
+                        settings.PUPPET_CERT_CLEAN_BATCH_SIZE or 20)
+                ).start(task_uuid, hostnames)
 
         msg_delete = {
             'method': 'remove_nodes',
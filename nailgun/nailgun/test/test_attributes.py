@@ -14,11 +14,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from copy import deepcopy
 import json
 
 from nailgun.api.models import Attributes
 from nailgun.api.models import Cluster
 from nailgun.api.models import Release
+from nailgun.db import db
 from nailgun.test.base import BaseHandlers
 from nailgun.test.base import reverse
 
@@ -186,6 +188,54 @@ class TestAttributes(BaseHandlers):
                 else:
                     self.assertEquals(orig_value, value)
 
+    def test_attributes_merged_values_cache(self):
+        cluster = self.env.create_cluster(api=True)
+        cluster_db = self.db.query(Cluster).get(cluster['id'])
+        editable = deepcopy(cluster_db.attributes.editable)
+        generated = deepcopy(cluster_db.attributes.generated)
+
+        attrs = cluster_db.attributes.merged_attrs_values()
+        attrs['foo'] = 'bar'
+        self.assertNotIn('foo', cluster_db.attributes.merged_attrs_values())
+        self.assertEquals(editable, cluster_db.attributes.editable)
+        self.assertEquals(generated, cluster_db.attributes.generated)
+
+        resp = self.app.put(
+            reverse(
+                'ClusterAttributesHandler',
+                kwargs={'cluster_id': cluster['id']}),
+            params=json.dumps({
+                'editable': {
+                    'common': {'foo': {'value': 'bar'}}
+                },
+            }),
+            headers=self.default_headers
+        )
+        self.assertEquals(200, resp.status)
+        self.db.refresh(cluster_db.attributes)
+        self.assertEquals(
+            'bar', cluster_db.attributes.merged_attrs_values()['foo'])
+
+    def test_attributes_concurrent_update(self):
+        cluster = self.env.create_cluster(api=True)
+        attributes = self.db.query(Cluster).get(cluster['id']).attributes
+        version = attributes.version
+
+        # the same row is updated by another request meanwhile
+        session = db.session_factory()
+        try:
+            session.query(Attributes).get(attributes.id).editable = {
+                'common': {'foo': {'value': 'bar'}}
+            }
+            session.commit()
+        finally:
+            session.close()
+
+        attributes.editable = {'common': {'foo': {'value': 'baz'}}}
+        self.db.commit()
+        self.assertEquals(version + 2, attributes.version)
+        self.assertEquals('baz', attributes.merged_attrs_values()['foo'])
+
     def _compare(self, d1, d2):
         if isinstance(d1, dict) and isinstance(d2, dict):
             for s_field, s_value in d1.iteritems():
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+import threading
+import time
+import uuid
+
+from mock import patch
+
+from nailgun.api.handlers.base import long_poll_waiters
+from nailgun.api.models import Notification
+from nailgun.api.models import Task
+from nailgun.changes import feed
+from nailgun import notifier
+from nailgun.settings import settings
+from nailgun.task.helpers import TaskHelper
+from nailgun.test.base import BaseHandlers
+from nailgun.test.base import reverse
+
+
+class TestChangeFeed(BaseHandlers):
+
+    def get_changes(self, expect_errors=False, **params):
+        query = '&'.join('{0}={1}'.format(k, v) for k, v in params.items())
+        return self.app.get(
+            reverse('ChangeFeedHandler') + '?' + query,
+            headers=self.default_headers,
+            expect_errors=expect_errors
+        )
+
+    def create_task(self, cluster_id=None):
+        task = Task(
+            uuid=str(uuid.uuid4()),
+            name='deploy',
+            cluster_id=cluster_id
+        )
+        self.db.add(task)
+        self.db.commit()
+        return task
+
+    def test_start_following(self):
+        resp = self.get_changes()
+        self.assertEquals(200, resp.status)
+        response = json.loads(resp.body)
+        self.assertEquals(feed.cursor(feed.seq), response['cursor'])
+        self.assertEquals([], response['changes'])
+        self.assertFalse(response['reset'])
+
+    def test_task_status_change(self):
+        task = self.create_task()
+        seq = feed.seq
+
+        TaskHelper.update_task_status(task.uuid, 'running', 10)
+
+        response = json.loads(
+            self.get_changes(since=feed.cursor(seq), timeout=0).body)
+        self.assertEquals(1, len(response['changes']))
+        change = response['changes'][0]
+        self.assertEquals('task', change['type'])
+        self.assertEquals(task.id, change['id'])
+        self.assertEquals('running', change['data']['status'])
+        self.assertEquals(10, change['data']['progress'])
+        self.assertEquals(feed.cursor(seq + 1), response['cursor'])
+
+    def test_filter_by_type(self):
+        task = self.create_task()
+        seq = feed.seq
+
+        TaskHelper.update_task_status(task.uuid, 'running', 10)
+
+        response = json.loads(self.get_changes(
+            since=feed.cursor(seq), timeout=0, types='node').body)
+        self.assertEquals([], response['changes'])
+
+    def test_rolled_back_changes_not_published(self):
+        seq = feed.seq
+        feed.publish('node', 1, online=False)
+        self.db.rollback()
+        self.db.commit()
+        self.assertEquals(seq, feed.seq)
+
+    def test_waiting_client_woken_up(self):
+        seq = feed.seq
+        result = {}
+
+        def wait():
+            result.update(feed.wait(seq, 10))
+
+        waiter = threading.Thread(target=wait)
+        waiter.start()
+        feed.publish('node', 1, online=False)
+        self.db.commit()
+        waiter.join(10)
+
+        self.assertFalse(waiter.is_alive())
+        self.assertEquals(1, len(result['changes']))
+        self.assertEquals({'online': False}, result['changes'][0]['data'])
+
+    def test_no_waiting_when_waiters_limit_reached(self):
+        seq = feed.seq
+        started = time.time()
+        with patch.dict(settings.config, {'LONG_POLL_MAX_WAITERS': 1}):
+            self.assertTrue(long_poll_waiters.acquire())
+            try:
+                response = json.loads(
+                    self.get_changes(since=feed.cursor(seq), timeout=10).body)
+            finally:
+                long_poll_waiters.release()
+        self.assertTrue(time.time() - started < 5)
+        self.assertEquals([], response['changes'])
+
+    def test_notification_published_with_id(self):
+        seq = feed.seq
+        notifier.notify('done', 'Environment is deployed')
+        notifier.flush()
+
+        notification = self.db.query(Notification).filter_by(
+            message='Environment is deployed'
+        ).one()
+        response = json.loads(self.get_changes(
+            since=feed.cursor(seq), timeout=0, types='notification').body)
+        self.assertEquals(
+            [notification.id],
+            [change['id'] for change in response['changes']]
+        )
+
+    def test_reset_when_changes_missed(self):
+        response = json.loads(
+            self.get_changes(since=feed.cursor(feed.seq + 1), timeout=0).body)
+        self.assertTrue(response['reset'])
+
+    def test_reset_after_restart(self):
+        # cursor returned before restart, new process
+        # already has more changes than the client has seen
+        cursor = 'a' * len(feed.epoch) + ':0'
+        feed.publish('node', 1, online=False)
+        self.db.commit()
+
+        response = json.loads(
+            self.get_changes(since=cursor, timeout=0).body)
+        self.assertTrue(response['reset'])
+        self.assertEquals([], response['changes'])
+        self.assertEquals(feed.cursor(feed.seq), response['cursor'])
+
+    def test_invalid_params(self):
+        for since in ('abc', '0', feed.cursor(-1)):
+            resp = self.get_changes(since=since, expect_errors=True)
+            self.assertEquals(400, resp.status)
+        resp = self.get_changes(
+            since=feed.cursor(0), types='foo', expect_errors=True)
+        self.assertEquals(400, resp.status)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+
+from nailgun.db import db
+from nailgun.test.base import BaseHandlers
+from nailgun.test.base import reverse
+
+
+class TestConditionalGet(BaseHandlers):
+
+    def get(self, url, etag=None):
+        headers = dict(self.default_headers)
+        if etag:
+            headers['If-None-Match'] = etag
+        return self.app.get(url, headers=headers)
+
+    def test_not_modified_collection(self):
+        self.env.create_node(api=False)
+        url = reverse('NodeCollectionHandler')
+        resp = self.get(url)
+        self.assertEquals(200, resp.status)
+        etag = resp.headers['ETag']
+
+        resp = self.get(url, etag)
+        self.assertEquals(304, resp.status)
+        self.assertEquals(etag, resp.headers['ETag'])
+        self.assertEquals('', resp.body)
+
+    def test_etag_changes_after_update(self):
+        node = self.env.create_node(api=False)
+        url = reverse('NodeCollectionHandler')
+        etag = self.get(url).headers['ETag']
+
+        node.name = 'renamed'
+        db().commit()
+
+        resp = self.get(url, etag)
+        self.assertEquals(200, resp.status)
+        self.assertNotEquals(etag, resp.headers['ETag'])
+        self.assertEquals('renamed', json.loads(resp.body)[0]['name'])
+
+    def test_etag_not_changed_by_other_tables(self):
+        url = reverse('TaskCollectionHandler')
+        etag = self.get(url).headers['ETag']
+
+        self.env.create_notification()
+
+        self.assertEquals(304, self.get(url, etag).status)
+
+    def test_etag_depends_on_query(self):
+        url = reverse('NotificationCollectionHandler')
+        etag = self.get(url).headers['ETag']
+
+        resp = self.get(url + '?status=unread', etag)
+        self.assertEquals(200, resp.status)
+        self.assertNotEquals(etag, resp.headers['ETag'])
+
+    def test_rolled_back_changes_ignored(self):
+        node = self.env.create_node(api=False)
+        url = reverse('NodeHandler', kwargs={'node_id': node.id})
+        etag = self.get(url).headers['ETag']
+
+        node.name = 'renamed'
+        db().flush()
+        db().rollback()
+
+        self.assertEquals(304, self.get(url, etag).status)
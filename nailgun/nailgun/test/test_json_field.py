@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+
+from nailgun.api.fields import JSONCache
+from nailgun.api.models import Task
+from nailgun.test.base import BaseHandlers
+
+
+class TestJSONCache(BaseHandlers):
+
+    def test_cached_documents_are_copied(self):
+        cache = JSONCache(2)
+        raw = json.dumps({'interfaces': [{'name': 'eth0'}]})
+        first = cache.loads(raw)
+        first['interfaces'][0]['name'] = 'eth1'
+        second = cache.loads(raw)
+        self.assertEquals(second, {'interfaces': [{'name': 'eth0'}]})
+        self.assertEquals((cache.hits, cache.misses), (1, 1))
+
+    def test_cache_size_limit(self):
+        cache = JSONCache(2)
+        for i in xrange(3):
+            cache.loads(json.dumps([i]))
+        self.assertEquals(len(cache.items), 2)
+        cache.loads(json.dumps([0]))
+        self.assertEquals(cache.misses, 4)
+
+    def test_short_documents_not_cached(self):
+        cache = JSONCache(2, min_length=100)
+        cache.loads(json.dumps({'a': 1}))
+        self.assertEquals(len(cache.items), 0)
+
+    def test_deferred_task_cache(self):
+        task = Task(name='deploy', cache={'args': {'nodes': []}})
+        self.db.add(task)
+        self.db.commit()
+        self.db.expire_all()
+        task = self.db.query(Task).get(task.id)
+        self.assertNotIn('cache', task.__dict__)
+        self.assertEquals(task.cache, {'args': {'nodes': []}})
@@ -16,6 +16,7 @@
 
 import time
 
+from nailgun.api.models import Notification
 from nailgun.keepalive.watcher import KeepAliveThread
 from nailgun.test.base import BaseHandlers
 
@@ -58,3 +59,22 @@ class TestKeepalive(BaseHandlers):
         time.sleep(self.watcher.interval + 2)
         self.env.refresh_nodes()
         self.assertEqual(node.online, True)
+
+    def test_offline_node_notified_once(self):
+        node = self.env.create_node(status="discover",
+                                    name="Dead or alive")
+        self.env.wait_for_true(
+            self.check_online,
+            args=[node, False],
+            timeout=self.timeout)
+        time.sleep(self.watcher.interval + 1)
+
+        notifications = self.db.query(Notification).filter_by(
+            node_id=node.id,
+            topic="error"
+        ).all()
+        self.assertEquals(len(notifications), 1)
+        self.assertEquals(
+            notifications[0].message,
+            u"Node 'Dead or alive' has gone away"
+        )
@@ -21,15 +21,21 @@ import shutil
 from StringIO import StringIO
 import tarfile
 import tempfile
+import threading
 import time
 
+from mock import patch
+
 from nailgun.test.base import BaseHandlers
 from nailgun.test.base import reverse
 
 from nailgun.settings import settings
 
+from nailgun.api.handlers.base import long_poll_waiters
 from nailgun.api.handlers.logs import read_backwards
 from nailgun.api.models import RedHatAccount
+from nailgun.logs.index import log_indexes
+from nailgun.logs.index import LogIndex
 
 
 class TestLogs(BaseHandlers):
@@ -140,7 +146,6 @@ class TestLogs(BaseHandlers):
         self.assertEquals(response['entries'], log_entries)
 
     def test_multiline_log_entry(self):
-        settings.LOGS[0]['multiline'] = True
         log_entries = [
             [
                 time.strftime(settings.UI_LOG_DATE_FORMAT),
@@ -161,16 +166,150 @@ class TestLogs(BaseHandlers):
         self.env.create_cluster(api=False)
         self._create_logfile_for_node(settings.LOGS[0], log_entries)
 
+        with patch.dict(settings.LOGS[0], {'multiline': True}):
+            resp = self.app.get(
+                reverse('LogEntryCollectionHandler'),
+                params={'source': settings.LOGS[0]['id']},
+                headers=self.default_headers
+            )
+        self.assertEquals(200, resp.status)
+        response = json.loads(resp.body)
+        response['entries'].reverse()
+        self.assertEquals(response['entries'], log_entries)
+
+    def test_log_entries_filtered_by_date_and_level(self):
+        log_entries = [
+            ['2013-01-01 10:00:00', 'INFO', 'text1'],
+            ['2013-01-01 11:00:00', 'DEBUG', 'text2'],
+            ['2013-01-01 12:00:00', 'ERROR', 'text3'],
+        ]
+        self._create_logfile_for_node(settings.LOGS[0], log_entries)
+
+        with patch.dict(settings.LOGS[0],
+                        {'levels': ['DEBUG', 'INFO', 'ERROR']}):
+            resp = self.app.get(
+                reverse('LogEntryCollectionHandler'),
+                params={
+                    'source': settings.LOGS[0]['id'],
+                    'date_after': '2013-01-01 10:30:00',
+                    'date_before': '2013-01-01 12:00:00'
+                },
+                headers=self.default_headers
+            )
+            self.assertEquals(200, resp.status)
+            response = json.loads(resp.body)
+            self.assertEquals(response['entries'],
+                              [log_entries[2], log_entries[1]])
+
+            resp = self.app.get(
+                reverse('LogEntryCollectionHandler'),
+                params={'source': settings.LOGS[0]['id'], 'level': 'INFO'},
+                headers=self.default_headers
+            )
+            self.assertEquals(200, resp.status)
+            response = json.loads(resp.body)
+            self.assertEquals(response['entries'],
+                              [log_entries[2], log_entries[0]])
+
+    def test_log_index_extended_on_append(self):
+        log_entries = [
+            ['2013-01-01 10:00:00', 'INFO', 'text1'],
+        ]
+        self._create_logfile_for_node(settings.LOGS[0], log_entries)
         resp = self.app.get(
             reverse('LogEntryCollectionHandler'),
             params={'source': settings.LOGS[0]['id']},
             headers=self.default_headers
         )
-        self.assertEquals(200, resp.status)
+        to_byte = json.loads(resp.body)['to']
+        self.assertEquals(
+            to_byte, os.path.getsize(settings.LOGS[0]['path']))
+
+        new_entry = ['2013-01-01 11:00:00', 'INFO', 'text2']
+        with open(settings.LOGS[0]['path'], 'a') as f:
+            f.write(':'.join(new_entry) + '\n')
+        resp = self.app.get(
+            reverse('LogEntryCollectionHandler'),
+            params={'source': settings.LOGS[0]['id'], 'to': to_byte},
+            headers=self.default_headers
+        )
         response = json.loads(resp.body)
-        response['entries'].reverse()
-        self.assertEquals(response['entries'], log_entries)
-        settings.LOGS[0]['multiline'] = False
+        self.assertEquals(response['entries'], [new_entry])
+        self.assertTrue(response['has_more'])
+
+    @patch.dict(settings.config, {'LOG_INDEX_SYNC_SIZE': 1})
+    def test_log_entries_read_backwards_while_indexing(self):
+        log_entries = [
+            ['2013-01-01 10:00:00', 'INFO', 'text1'],
+            ['2013-01-01 11:00:00', 'ERROR', 'text2'],
+        ]
+        self._create_logfile_for_node(settings.LOGS[0], log_entries)
+        params = {'source': settings.LOGS[0]['id']}
+
+        def get(handler):
+            resp = self.app.get(
+                reverse(handler),
+                params=params,
+                headers=self.default_headers
+            )
+            self.assertEquals(200, resp.status)
+            return json.loads(resp.body)
+
+        indexing = threading.Event()
+        update = LogIndex.update
+
+        def blocked_update(index):
+            indexing.wait(10)
+            update(index)
+
+        with patch.object(LogIndex, 'update', blocked_update):
+            response = get('LogEntryCollectionHandler')
+            self.assertEquals(response['entries'], log_entries[::-1])
+            self.assertEquals(
+                response['to'], os.path.getsize(settings.LOGS[0]['path']))
+            response = get('LogTailHandler')
+            self.assertEquals(response['entries'], log_entries[::-1])
+            self.assertIsNone(response['cursor'])
+            indexing.set()
+
+        self.env.wait_for_true(
+            lambda: log_indexes.get(
+                settings.LOGS[0]['path'], settings.LOGS[0]).ready,
+            timeout=10
+        )
+        response = get('LogTailHandler')
+        self.assertEquals(response['entries'], log_entries[::-1])
+        self.assertIsNotNone(response['cursor'])
+
+    def test_log_file_rotated_after_indexing(self):
+        log_config = settings.LOGS[0]
+        self._create_logfile_for_node(log_config, [
+            ['2013-01-01 10:00:00', 'INFO', 'old text %d' % i]
+            for i in xrange(10)
+        ])
+        log_entries = [
+            ['2013-01-01 11:00:00', 'INFO', 'text1'],
+        ]
+        get_index = log_indexes.get
+
+        def get_and_rotate(path, log_config):
+            index = get_index(path, log_config)
+            os.rename(path, path + '.1')
+            with open(path, 'w') as f:
+                for log_entry in log_entries:
+                    f.write(':'.join(log_entry) + '\n')
+            return index
+
+        for handler in ('LogEntryCollectionHandler', 'LogTailHandler'):
+            with patch.object(log_indexes, 'get', get_and_rotate):
+                resp = self.app.get(
+                    reverse(handler),
+                    params={'source': log_config['id']},
+                    headers=self.default_headers
+                )
+            self.assertEquals(200, resp.status)
+            response = json.loads(resp.body)
+            self.assertEquals(response['entries'], log_entries)
 
     def test_backward_reader(self):
         f = tempfile.TemporaryFile(mode='r+')
@@ -242,6 +381,41 @@ class TestLogs(BaseHandlers):
         f.close()
         m.close()
 
+    def test_log_package_handler_filtered_by_node(self):
+        node = self.env.create_node(api=False, ip='10.20.30.40')
+        other_node = self.env.create_node(api=False, ip='10.20.30.41')
+        remote_dir = os.path.join(self.log_dir, 'remote')
+        for n in (node, other_node):
+            os.makedirs(os.path.join(remote_dir, n.ip))
+            with open(os.path.join(remote_dir, n.ip, 'node.log'), 'w') as f:
+                f.write(n.ip)
+
+        settings.LOGS_TO_PACK_FOR_SUPPORT = {'logs': self.log_dir}
+        with patch.dict(settings.config, {'SYSLOG_DIR': remote_dir}):
+            resp = self.app.get(
+                reverse('LogPackageHandler'),
+                params={'nodes': str(node.id)}
+            )
+        self.assertEquals(200, resp.status)
+        tf = tarfile.open(fileobj=StringIO(resp.body), mode='r:gz')
+        self.assertEquals(
+            tf.getnames(),
+            [os.path.join('logs', 'remote', node.ip, 'node.log')]
+        )
+        m = tf.extractfile(tf.getnames()[0])
+        self.assertEquals(m.read(), node.ip)
+        m.close()
+
+    def test_log_package_handler_invalid_params(self):
+        for params in ({'nodes': 'a'}, {'max_size': 'a'},
+                       {'date_after': 'a'}):
+            resp = self.app.get(
+                reverse('LogPackageHandler'),
+                params=params,
+                expect_errors=True
+            )
+            self.assertEquals(400, resp.status)
+
     def test_log_package_handler_sensitive(self):
         account = RedHatAccount()
         account.username = "REDHATUSERNAME"
@@ -321,3 +495,119 @@ class TestLogs(BaseHandlers):
         response = json.loads(resp.body)
         response['entries'].reverse()
         self.assertEquals(response['entries'], response_log_entries)
+
+    def test_scrubber_updated_on_account_change(self):
+        account = RedHatAccount()
+        account.username = "REDHATUSERNAME"
+        account.password = "REDHATPASSWORD"
+        account.license_type = "rhsm"
+        self.db.add(account)
+        self.db.commit()
+
+        log_entries = [
+            [
+                time.strftime(settings.UI_LOG_DATE_FORMAT),
+                'LEVEL111',
+                'begin REDHATUSERNAME NEWUSERNAME end',
+            ],
+        ]
+        self._create_logfile_for_node(settings.LOGS[0], log_entries)
+
+        def get_text():
+            resp = self.app.get(
+                reverse('LogEntryCollectionHandler'),
+                params={'source': settings.LOGS[0]['id']},
+                headers=self.default_headers
+            )
+            self.assertEquals(200, resp.status)
+            return json.loads(resp.body)['entries'][0][2]
+
+        self.assertEquals(get_text(), 'begin username NEWUSERNAME end')
+
+        account.username = "NEWUSERNAME"
+        self.db.commit()
+        self.assertEquals(get_text(), 'begin REDHATUSERNAME username end')
+
+    @patch.dict(settings.config, {'LOG_TAIL_POLL_INTERVAL': 0.001})
+    def test_log_tail_handler(self):
+        log_entries = [
+            ['2013-01-01 10:00:00', 'INFO', 'text1'],
+        ]
+        self._create_logfile_for_node(settings.LOGS[0], log_entries)
+
+        def tail(**params):
+            params.update({'source': settings.LOGS[0]['id'], 'timeout': 0})
+            resp = self.app.get(
+                reverse('LogTailHandler'),
+                params=params,
+                headers=self.default_headers
+            )
+            self.assertEquals(200, resp.status)
+            return json.loads(resp.body)
+
+        response = tail()
+        self.assertEquals(response['entries'], log_entries)
+        cursor = response['cursor']
+
+        response = tail(cursor=cursor)
+        self.assertEquals(response['entries'], [])
+        self.assertEquals(response['cursor'], cursor)
+
+        new_entries = [
+            ['2013-01-01 11:00:00', 'INFO', 'text2'],
+            ['2013-01-01 12:00:00', 'INFO', 'text3'],
+        ]
+        with open(settings.LOGS[0]['path'], 'a') as f:
+            for entry in new_entries:
+                f.write(':'.join(entry) + '\n')
+        response = tail(cursor=cursor, max_entries=1)
+        self.assertEquals(response['entries'], new_entries[:1])
+        self.assertTrue(response['has_more'])
+        response = tail(cursor=response['cursor'])
+        self.assertEquals(response['entries'], new_entries[1:])
+        self.assertFalse(response['has_more'])
+        self.assertFalse(response['rotated'])
+
+        # rotation
+        os.rename(settings.LOGS[0]['path'],
+                  settings.LOGS[0]['path'] + '.1')
+        self._create_logfile_for_node(settings.LOGS[0], log_entries)
+        response = tail(cursor=response['cursor'])
+        self.assertEquals(response['entries'], log_entries)
+        self.assertTrue(response['rotated'])
+
+    def test_log_tail_handler_invalid_cursor(self):
+        self._create_logfile_for_node(settings.LOGS[0], [])
+        resp = self.app.get(
+            reverse('LogTailHandler'),
+            params={'source': settings.LOGS[0]['id'], 'cursor': 'abc'},
+            headers=self.default_headers,
+            expect_errors=True
+        )
+        self.assertEquals(400, resp.status)
+
+    @patch.dict(settings.config, {'LONG_POLL_MAX_WAITERS': 1})
+    def test_log_tail_handler_no_waiting_when_waiters_limit_reached(self):
+        self._create_logfile_for_node(
+            settings.LOGS[0], [['2013-01-01 10:00:00', 'INFO', 'text1']])
+        params = {'source': settings.LOGS[0]['id']}
+        resp = self.app.get(
+            reverse('LogTailHandler'),
+            params=params,
+            headers=self.default_headers
+        )
+        params.update(cursor=json.loads(resp.body)['cursor'], timeout=10)
+
+        started = time.time()
+        self.assertTrue(long_poll_waiters.acquire())
+        try:
+            resp = self.app.get(
+                reverse('LogTailHandler'),
+                params=params,
+                headers=self.default_headers
+            )
+        finally:
+            long_poll_waiters.release()
+        self.assertEquals(200, resp.status)
+        self.assertEquals(json.loads(resp.body)['entries'], [])
+        self.assertTrue(time.time() - started < 5)
@@ -31,6 +31,7 @@ from nailgun.api.models import Network
 from nailgun.api.models import NetworkGroup
 from nailgun.api.models import NodeNICInterface
 from nailgun.api.models import Vlan
+from nailgun.errors import errors
 from nailgun.settings import settings
 from nailgun.test.base import BaseHandlers
 from nailgun.test.base import fake_tasks
@@ -196,6 +197,61 @@ class TestNetworkManager(BaseHandlers):
         fixed_nets = filter(lambda net: net['name'] == 'fixed', network_data)
         self.assertEquals(fixed_nets, [])
 
+    def test_cluster_snapshot_node_networks(self):
+        self.env.create(
+            cluster_kwargs={'net_manager': 'VlanManager'},
+            nodes_kwargs=[
+                {"pending_addition": True},
+                {"pending_addition": True},
+            ]
+        )
+        cluster_db = self.env.clusters[0]
+        nodes_ids = [n.id for n in self.env.nodes]
+        self.env.network_manager.assign_ips(nodes_ids, 'management')
+
+        networks = self.db.query(Network).join(NetworkGroup).filter(
+            NetworkGroup.cluster_id == cluster_db.id).all()
+        management = filter(lambda n: n.name == 'management', networks)[0]
+        management_cidr = IPNetwork(management.cidr)
+
+        snapshot = self.env.network_manager.get_cluster_snapshot(cluster_db)
+        for node in self.env.nodes:
+            network_data = dict(
+                (net['name'], net)
+                for net in snapshot.get_node_networks(node.id))
+
+            # fixed network isn't sent in VlanManager mode
+            self.assertEquals(
+                sorted(network_data.keys()),
+                sorted([n.name for n in networks if n.name != 'fixed'] +
+                       ['admin']))
+
+            interfaces = [i['name'] for i in node.meta['interfaces']]
+            for net in networks:
+                if net.name == 'fixed':
+                    continue
+                self.assertEquals(network_data[net.name]['vlan'], net.vlan_id)
+                self.assertIn(network_data[net.name]['dev'], interfaces)
+
+            ip = self.db.query(IPAddr).filter_by(
+                node=node.id, network=management.id).one()
+            self.assertEquals(
+                network_data['management']['ip'],
+                '{0}/{1}'.format(ip.ip_addr, management_cidr.prefixlen))
+            self.assertEquals(
+                network_data['management']['netmask'],
+                str(management_cidr.netmask))
+            self.assertEquals(
+                network_data['management']['brd'],
+                str(management_cidr.broadcast))
+            self.assertNotIn('ip', network_data['storage'])
+
+            admin_dev = filter(
+                lambda i: i['mac'] == node.mac, node.meta['interfaces'])[0]
+            self.assertEquals(
+                network_data['admin'],
+                {'name': 'admin', 'dev': admin_dev['name']})
+
     def test_nets_empty_list_if_node_does_not_belong_to_cluster(self):
         node = self.env.create_node(api=False)
         network_data = self.env.network_manager.get_node_networks(node.id)
@@ -284,6 +340,36 @@ class TestNetworkManager(BaseHandlers):
         self.assertEquals(len(admin_ips), 1)
         self.assertEquals(admin_ips[0].ip_addr, '10.0.0.1')
 
+    def test_get_free_ips_skips_used_and_gateway(self):
+        map(self.db.delete, self.db.query(IPAddrRange).all())
+        admin_net_id = self.env.network_manager.get_admin_network_id()
+        admin_ng = self.db.query(Network).get(admin_net_id).network_group
+        admin_ng.gateway = '10.0.0.2'
+        self.db.add(IPAddrRange(
+            first='10.0.0.1',
+            last='10.0.0.5',
+            network_group_id=admin_ng.id
+        ))
+        self.db.add(IPAddrRange(
+            first='10.0.0.4',
+            last='10.0.0.6',
+            network_group_id=admin_ng.id
+        ))
+        self.db.add(IPAddr(ip_addr='10.0.0.3', network=admin_net_id))
+        self.db.commit()
+
+        free_ips = self.env.network_manager.get_free_ips(admin_ng.id, num=4)
+        self.assertEquals(
+            free_ips,
+            ['10.0.0.1', '10.0.0.4', '10.0.0.5', '10.0.0.6']
+        )
+        self.assertRaises(
+            errors.OutOfIPs,
+            self.env.network_manager.get_free_ips,
+            admin_ng.id,
+            num=5
+        )
+
     def test_vlan_set_null(self):
         self.env.create_cluster(api=True)
         cluster_db = self.env.clusters[0]
@@ -14,12 +14,21 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from datetime import datetime
 import json
 
+from mock import patch
+from sqlalchemy import event
+
 from nailgun.api.models import Node
 from nailgun.api.models import Notification
+from nailgun.db import engine
+from nailgun.keepalive.heartbeat import HeartbeatRegistry
+from nailgun.keepalive.heartbeat import heartbeats
+from nailgun.network.manager import NetworkManager
 from nailgun.test.base import BaseHandlers
 from nailgun.test.base import reverse
+from nailgun.volumes.manager import VolumeManager
 
 
 class TestHandlers(BaseHandlers):
@@ -176,10 +185,26 @@ class TestHandlers(BaseHandlers):
             ]),
             headers=self.default_headers)
         self.assertEquals(resp.status, 200)
+        self.assertNotEquals(heartbeats.last_seen(node.id), None)
+        heartbeats.flush()
         node = self.db.query(Node).get(node.id)
         self.assertNotEquals(node.timestamp, timestamp)
         self.assertEquals('new', node.manufacturer)
 
+    def test_heartbeats_flushed_without_keepalive_thread(self):
+        node = self.env.create_node(api=False)
+        registry = HeartbeatRegistry(interval=0.01)
+        seen = datetime(2013, 1, 1, 12, 0, 0)
+        registry.beat(node.id, seen)
+        try:
+            self.env.wait_for_true(
+                lambda: registry.last_seen(node.id) is None, timeout=5)
+        finally:
+            # flush in progress is finished before flusher stops
+            registry.stop()
+        node = self.db.query(Node).get(node.id)
+        self.assertEquals(node.timestamp, seen)
+
     def test_node_create_ext_mac(self):
         node1 = self.env.create_node(
             api=False
@@ -250,3 +275,132 @@ class TestHandlers(BaseHandlers):
             headers=self.default_headers,
             expect_errors=True)
         self.assertEquals(resp.status, 403)
+
+    def test_node_list_fields_selection(self):
+        self.env.create_node(api=False)
+        resp = self.app.get(
+            reverse('NodeCollectionHandler') + '?fields=status,online',
+            headers=self.default_headers
+        )
+        self.assertEquals(200, resp.status)
+        response = json.loads(resp.body)
+        self.assertEquals(len(response), 1)
+        self.assertEquals(
+            sorted(response[0].keys()),
+            ['id', 'online', 'status']
+        )
+
+    def test_node_list_unknown_field(self):
+        self.env.create_node(api=False)
+        resp = self.app.get(
+            reverse('NodeCollectionHandler') + '?fields=id,password',
+            headers=self.default_headers,
+            expect_errors=True
+        )
+        self.assertEquals(400, resp.status)
+
+    def _count_list_queries(self):
+        queries = []
+        counting = [True]
+
+        def count(*args, **kwargs):
+            if counting[0]:
+                queries.append(args)
+
+        # listener can't be removed, so it's just switched off
+        event.listen(engine, 'before_cursor_execute', count)
+        try:
+            resp = self.app.get(
+                reverse('NodeCollectionHandler'),
+                headers=self.default_headers
+            )
+        finally:
+            counting[0] = False
+        self.assertEquals(200, resp.status)
+        return len(queries), json.loads(resp.body)
+
+    def test_node_list_query_count_is_constant(self):
+        cluster = self.env.create(
+            cluster_kwargs={},
+            nodes_kwargs=[
+                {"api": True, "pending_addition": True},
+                {"api": True, "pending_addition": True}
+            ]
+        )
+        self.env.create_node(api=True)
+        count, nodes = self._count_list_queries()
+        self.assertEquals(len(nodes), 3)
+
+        for i in xrange(3):
+            self.env.create_node(
+                api=True,
+                cluster_id=cluster['id'],
+                pending_addition=True
+            )
+            self.env.create_node(api=True)
+        new_count, nodes = self._count_list_queries()
+        self.assertEquals(len(nodes), 9)
+        self.assertTrue(all(nodes))
+        self.assertEquals(count, new_count)
+
+    def test_agent_check_in_with_unchanged_meta(self):
+        node = self.env.create_node(api=False)
+        meta = self.env.default_metadata()
+        node_data = {'mac': node.mac, 'is_agent': True,
+                     'status': 'discover', 'meta': meta}
+
+        def check_in():
+            resp = self.app.put(
+                reverse('NodeCollectionHandler'),
+                json.dumps([node_data]),
+                headers=self.default_headers)
+            self.assertEquals(resp.status, 200)
+            self.assertEquals(json.loads(resp.body)[0]['id'], node.id)
+            return self.db.query(Node).get(node.id)
+
+        def reconciliation_mocks():
+            # originals are still called, mocks only record calls
+            return (
+                patch.object(
+                    Node, 'update_meta', autospec=True,
+                    side_effect=Node.update_meta),
+                patch.object(
+                    NetworkManager, 'update_interfaces_info', autospec=True,
+                    side_effect=NetworkManager.update_interfaces_info),
+                patch.object(
+                    VolumeManager, 'gen_volumes_info', autospec=True,
+                    side_effect=VolumeManager.gen_volumes_info)
+            )
+
+        node = check_in()
+        self.assertEquals(node.meta_digest, Node.get_meta_digest(meta))
+
+        node.online = False
+        node.manufacturer = 'manufacturer'
+        self.db.commit()
+        update_meta, update_interfaces, gen_volumes = reconciliation_mocks()
+        with update_meta as update_meta_mock, \
+                update_interfaces as update_interfaces_mock, \
+                gen_volumes as gen_volumes_mock:
+            node = check_in()
+        # only online status is updated
+        self.assertTrue(node.online)
+        self.assertEquals(node.manufacturer, 'manufacturer')
+        self.assertFalse(update_meta_mock.called)
+        self.assertFalse(update_interfaces_mock.called)
+        self.assertFalse(gen_volumes_mock.called)
+
+        meta['memory']['total'] *= 2
+        meta['disks'].append(
+            dict(meta['disks'][0], name='sdz', disk='disk/by-id/sdz'))
+        update_meta, update_interfaces, gen_volumes = reconciliation_mocks()
+        with update_meta as update_meta_mock, \
+                update_interfaces as update_interfaces_mock, \
+                gen_volumes as gen_volumes_mock:
+            node = check_in()
+        self.assertTrue(update_meta_mock.called)
+        self.assertTrue(update_interfaces_mock.called)
+        self.assertTrue(gen_volumes_mock.called)
+        self.assertEquals(node.meta['memory']['total'],
+                          meta['memory']['total'])
+        self.assertEquals(node.meta_digest, Node.get_meta_digest(meta))
@@ -17,6 +17,8 @@
 from copy import deepcopy
 import json
 
+from mock import patch
+
 from nailgun.errors import errors
 from nailgun.test.base import BaseHandlers
 from nailgun.test.base import reverse
@@ -446,6 +448,25 @@ class TestVolumeManager(BaseHandlers):
                 errors.NotEnoughFreeSpace,
                 node.volume_manager.check_disk_space_for_deployment)
 
+    def test_generators_are_memoized(self):
+        volume_manager = self.create_node('compute').volume_manager
+        with patch.object(volume_manager, '_calc_swap_size',
+                          return_value=1024) as calc_swap_size:
+            self.assertEquals(
+                volume_manager.call_generator('calc_os_size'),
+                volume_manager.call_generator('calc_root_size') + 1024)
+            volume_manager.call_generator('calc_min_os_size')
+            volume_manager.call_generator('calc_swap_size')
+
+        self.assertEquals(calc_swap_size.call_count, 1)
+
+    def test_expand_vg(self):
+        volume_manager = self.create_node('controller').volume_manager
+        for vg in volume_manager.allowed_vgs:
+            self.assertEquals(
+                volume_manager.expand_vg(vg['id']),
+                volume_manager.expand_generators(vg))
+
 
 class TestDisks(BaseHandlers):
 
@@ -15,8 +15,12 @@
 #    under the License.
 
 import json
+import threading
+import time
 import uuid
 
+from mock import patch
+
 from nailgun.api.models import Notification
 from nailgun.api.models import Task
 from nailgun.errors import errors
@@ -163,3 +167,96 @@ class TestNotification(BaseHandlers):
             notifications[0].message,
             "Cluster deletion fake error"
         )
+
+    def test_notifications_buffered_and_deduplicated(self):
+        node = self.env.create_node(api=False)
+        task = Task(uuid=str(uuid.uuid4()), name="deploy")
+        self.db.add(task)
+        self.db.commit()
+
+        with patch.object(notifier, 'sink',
+                          notifier.NotificationSink(interval=60)):
+            for i in xrange(3):
+                notifier.notify("error", "Node failed",
+                                node_id=node.id, task_uuid=task.uuid)
+            notifier.notify("error", "Another message",
+                            node_id=node.id, task_uuid=task.uuid)
+            self.assertEqual(
+                self.db.query(Notification).filter_by(
+                    node_id=node.id
+                ).count(),
+                0
+            )
+            notifier.flush()
+
+            # duplicate of already written notification
+            notifier.notify("error", "Node failed",
+                            node_id=node.id, task_uuid=task.uuid)
+            notifier.flush()
+
+        notifications = self.db.query(Notification).filter_by(
+            node_id=node.id
+        ).order_by(Notification.id).all()
+        self.assertEqual(
+            [n.message for n in notifications],
+            ["Node failed", "Another message"]
+        )
+        self.assertTrue(all(n.task_id == task.id for n in notifications))
+
+    def test_failed_notifications_write_keeps_transaction(self):
+        node = self.env.create_node(api=False)
+        sink = notifier.NotificationSink(interval=60)
+
+        with patch.object(notifier, 'sink', sink):
+            notifier.notify("error", "Node failed", node_id=node.id)
+            node.name = "renamed"
+            with patch.object(sink, 'write', side_effect=Exception):
+                # notifications are written once thread commits
+                self.db.commit()
+            self.assertEqual(
+                self.db.query(Notification).filter_by(
+                    node_id=node.id
+                ).count(),
+                0
+            )
+
+            # failed batch is requeued
+            notifier.flush()
+
+        self.db.refresh(node)
+        self.assertEqual(node.name, "renamed")
+        notifications = self.db.query(Notification).filter_by(
+            node_id=node.id
+        ).all()
+        self.assertEqual(len(notifications), 1)
+        self.assertEqual(notifications[0].message, "Node failed")
+
+    def test_notifications_written_on_commit(self):
+        node = self.env.create_node(api=False)
+
+        with patch.object(notifier, 'sink',
+                          notifier.NotificationSink(interval=60)):
+            notifier.notify("error", "Node failed", node_id=node.id)
+            self.db.commit()
+
+        self.assertEqual(
+            self.db.query(Notification).filter_by(node_id=node.id).count(),
+            1
+        )
+
+    def test_flush_timeout(self):
+        sink = notifier.NotificationSink(interval=60)
+        writing = threading.Event()
+
+        def write(session, batch):
+            writing.wait(10)
+            return 0
+
+        with patch.object(notifier, 'sink', sink):
+            with patch.object(sink, 'write', side_effect=write):
+                notifier.notify("done", "Deployed")
+                started = time.time()
+                self.assertFalse(sink.flush(timeout=0.1))
+                self.assertTrue(time.time() - started < 5)
+                writing.set()
+                self.assertTrue(sink.flush())
@@ -16,7 +16,10 @@
 
 import json
 
+from mock import patch
+
 from nailgun.api.models import Notification
+from nailgun.settings import settings
 from nailgun.test.base import BaseHandlers
 from nailgun.test.base import reverse
 
@@ -75,6 +78,23 @@ class TestHandlers(BaseHandlers):
         response = json.loads(resp.body)
         self.assertEquals(len(response), 2)
 
+        with patch.dict(settings.config, {'MAX_ITEMS_PER_PAGE': 2}):
+            resp = self.app.get(
+                reverse('NotificationCollectionHandler'),
+                params={'limit': 100},
+                headers=self.default_headers
+            )
+        self.assertEquals(200, resp.status)
+        self.assertEquals(len(json.loads(resp.body)), 2)
+
+        resp = self.app.get(
+            reverse('NotificationCollectionHandler'),
+            params={'limit': 0},
+            headers=self.default_headers,
+            expect_errors=True
+        )
+        self.assertEquals(400, resp.status)
+
     def test_update(self):
         c = self.env.create_cluster(api=False)
         n0 = self.env.create_notification()
@@ -107,3 +127,55 @@ class TestHandlers(BaseHandlers):
         self.assertEquals(rn1['status'], 'read')
         self.assertIsNone(rn0.get('cluster', None))
         self.assertEquals(rn0['status'], 'read')
+
+    def test_keyset_pagination_and_filters(self):
+        cluster = self.env.create_cluster(api=False)
+        notifications = [
+            self.env.create_notification(
+                topic=topic,
+                status=status,
+                cluster_id=cluster.id
+            )
+            for topic, status in (
+                ('discover', 'unread'),
+                ('error', 'read'),
+                ('error', 'unread'),
+                ('done', 'unread')
+            )
+        ]
+        ids = [n.id for n in notifications]
+
+        def get(**params):
+            resp = self.app.get(
+                reverse('NotificationCollectionHandler'),
+                params=params,
+                headers=self.default_headers
+            )
+            self.assertEquals(200, resp.status)
+            return [n['id'] for n in json.loads(resp.body)]
+
+        self.assertEquals(get(limit=2), [ids[3], ids[2]])
+        self.assertEquals(get(limit=2, before=ids[2]), [ids[1], ids[0]])
+        self.assertEquals(get(since_id=ids[1]), [ids[2], ids[3]])
+        self.assertEquals(get(topic='error'), [ids[2], ids[1]])
+        self.assertEquals(get(topic='error', status='unread'), [ids[2]])
+        self.assertEquals(get(cluster_id=cluster.id), ids[::-1])
+
+        resp = self.app.get(
+            reverse('NotificationCollectionHandler'),
+            params={'topic': 'unknown'},
+            headers=self.default_headers,
+            expect_errors=True
+        )
+        self.assertEquals(400, resp.status)
+
+    def test_unread_count(self):
+        self.env.create_notification(status='read')
+        for i in xrange(2):
+            self.env.create_notification()
+        resp = self.app.get(
+            reverse('NotificationUnreadCountHandler'),
+            headers=self.default_headers
+        )
+        self.assertEquals(200, resp.status)
+        self.assertEquals(json.loads(resp.body), {'unread': 2})
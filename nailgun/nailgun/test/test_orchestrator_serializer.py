@@ -20,6 +20,8 @@ from nailgun.api.models import IPAddrRange
 from nailgun.api.models import NetworkGroup
 from nailgun.api.models import Node
 from nailgun.db import db
+from nailgun.orchestrator.serializers import COMPACT_FORMAT_VERSION
+from nailgun.orchestrator.serializers import expand
 from nailgun.orchestrator.serializers import OrchestratorHASerializer
 from nailgun.orchestrator.serializers import OrchestratorSerializer
 from nailgun.settings import settings
@@ -230,6 +232,18 @@ class TestOrchestratorSerializer(OrchestratorSerializerTestBase):
                  '172.16.0.3-172.16.0.5',
                  '172.16.0.10-172.16.0.12'])
 
+    def test_compact_format(self):
+        compact = self.serializer.serialize(self.cluster, compact=True)
+
+        self.assertEquals(compact['version'], COMPACT_FORMAT_VERSION)
+        self.assertEquals(len(compact['nodes']), 6)
+        for node in compact['nodes']:
+            self.assertNotIn('nodes', node)
+            self.assertNotIn('controller_nodes', node)
+        self.assertEquals(
+            expand(compact),
+            self.serializer.serialize(self.cluster))
+
 
 class TestOrchestratorHASerializer(OrchestratorSerializerTestBase):
 
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import tempfile
+
+from nailgun.api.models import Task
+from nailgun.task.certs import PuppetCertCleaner
+from nailgun.test.base import BaseHandlers
+
+
+class TestPuppetCertCleaner(BaseHandlers):
+
+    def setUp(self):
+        super(TestPuppetCertCleaner, self).setUp()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.calls_file = os.path.join(self.tmp_dir, 'calls')
+        # stand-in for puppet, fails on hostnames starting with 'bad'
+        self.command = os.path.join(self.tmp_dir, 'cert_clean')
+        with open(self.command, 'w') as f:
+            f.write(
+                '#!/bin/sh\n'
+                'echo "$@" >> {0}\n'
+                'for h in "$@"; do\n'
+                '    case $h in bad*) echo "no cert for $h"; exit 1;; esac\n'
+                'done\n'.format(self.calls_file)
+            )
+        os.chmod(self.command, 0755)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        super(TestPuppetCertCleaner, self).tearDown()
+
+    def get_calls(self):
+        with open(self.calls_file) as f:
+            return sorted(f.read().splitlines())
+
+    def test_hostnames_cleaned_in_batches(self):
+        cleaner = PuppetCertCleaner(self.command, workers=2, batch_size=2)
+        results = cleaner.clean(['node-3', 'node-1', 'node-2'])
+        self.assertEquals(
+            results,
+            {'cleaned': ['node-1', 'node-2', 'node-3'], 'failed': {}})
+        self.assertEquals(self.get_calls(), ['node-1 node-2', 'node-3'])
+
+    def test_failed_batch_cleaned_by_hostname(self):
+        cleaner = PuppetCertCleaner(self.command)
+        results = cleaner.clean(['bad-1', 'node-1'])
+        self.assertEquals(results['cleaned'], ['node-1'])
+        self.assertEquals(results['failed'], {'bad-1': 'no cert for bad-1'})
+        self.assertEquals(
+            self.get_calls(), ['bad-1', 'bad-1 node-1', 'node-1'])
+
+    def test_hosts_cleaned_before_failed_one_not_reported(self):
+        # stand-in removes marker of every host until it fails, like
+        # puppet, which can't find certificate on the second call
+        markers_dir = os.path.join(self.tmp_dir, 'certs')
+        os.mkdir(markers_dir)
+        for hostname in ('node-1', 'node-2', 'node-3-bad'):
+            open(os.path.join(markers_dir, hostname), 'w').close()
+        with open(self.command, 'w') as f:
+            f.write(
+                '#!/bin/sh\n'
+                'echo "$@" >> {0}\n'
+                'for h in "$@"; do\n'
+                '    case $h in *bad) echo "error for $h"; exit 1;; esac\n'
+                '    if [ ! -e {1}/$h ]; then\n'
+                '        echo "Could not find a serial number for $h"\n'
+                '        exit 1\n'
+                '    fi\n'
+                '    rm {1}/$h\n'
+                'done\n'.format(self.calls_file, markers_dir)
+            )
+
+        cleaner = PuppetCertCleaner(self.command)
+        results = cleaner.clean(['node-1', 'node-2', 'node-3-bad'])
+        self.assertEquals(results['cleaned'], ['node-1', 'node-2'])
+        self.assertEquals(
+            results['failed'], {'node-3-bad': 'error for node-3-bad'})
+        self.assertEquals(
+            self.get_calls(),
+            ['node-1', 'node-1 node-2 node-3-bad', 'node-2', 'node-3-bad'])
+        self.assertEquals(os.listdir(markers_dir), ['node-3-bad'])
+
+    def test_single_host_without_cert_cleaned(self):
+        with open(self.command, 'w') as f:
+            f.write(
+                '#!/bin/sh\n'
+                'echo "Could not find a serial number for $1"\n'
+                'exit 1\n'
+            )
+        for batch_size in (1, 2):
+            cleaner = PuppetCertCleaner(self.command, batch_size=batch_size)
+            results = cleaner.clean(['node-1', 'node-2'])
+            self.assertEquals(
+                results, {'cleaned': ['node-1', 'node-2'], 'failed': {}})
+
+    def test_missing_command(self):
+        cleaner = PuppetCertCleaner(os.path.join(self.tmp_dir, 'missing'))
+        results = cleaner.clean(['node-1'])
+        self.assertEquals(results['cleaned'], [])
+        self.assertIn('node-1', results['failed'])
+
+    def test_results_saved_into_task(self):
+        cluster = self.env.create_cluster(api=False)
+        task = Task(name='node_deletion', cluster=cluster, result={})
+        self.db.add(task)
+        self.db.commit()
+
+        PuppetCertCleaner(self.command).start(
+            task.uuid, ['node-1', 'bad-1']).join()
+
+        self.db.refresh(task)
+        self.assertEquals(
+            task.result['puppet_certs'],
+            {'cleaned': ['node-1'], 'failed': {'bad-1': 'no cert for bad-1'}})
@@ -123,3 +123,16 @@ class TestHandlers(BaseHandlers):
             expect_errors=True
         )
         self.assertEquals(resp.status, 409)
+
+    def test_release_list_fields_selection(self):
+        self.env.create_release(api=False)
+        resp = self.app.get(
+            reverse('ReleaseCollectionHandler') + '?fields=name,version',
+            headers=self.default_headers
+        )
+        self.assertEquals(200, resp.status)
+        response = json.loads(resp.body)
+        self.assertEquals(
+            sorted(response[0].keys()),
+            ['id', 'name', 'version']
+        )
@@ -14,10 +14,12 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from copy import deepcopy
 import json
 import unittest
 
 from nailgun.api.models import Release
+from nailgun.metadata import release_metadata
 from nailgun.test.base import BaseHandlers
 from nailgun.test.base import reverse
 
@@ -41,6 +43,27 @@ class TestHandlers(BaseHandlers):
         self.assertEquals('5.1', response['version'])
         self.assertEquals('modified release', response['name'])
 
+    def test_release_put_invalidates_compiled_metadata(self):
+        release = self.env.create_release(api=False)
+        metadata = release_metadata.get(release)
+        self.assertIs(metadata, release_metadata.get(release))
+
+        volumes_metadata = deepcopy(release.volumes_metadata)
+        volumes_metadata['volumes_roles_mapping']['compute'] = ['os']
+        resp = self.app.put(
+            reverse('ReleaseHandler', kwargs={'release_id': release.id}),
+            params=json.dumps({
+                'name': 'modified release',
+                'version': '5.1',
+                'volumes_metadata': volumes_metadata
+            }),
+            headers=self.default_headers)
+        self.assertEquals(200, resp.status)
+
+        self.db.refresh(release)
+        metadata = release_metadata.get(release)
+        self.assertEquals(metadata.get_roles_volumes(['compute']), ['os'])
+
     def test_release_put_returns_400_if_no_body(self):
         release = self.env.create_release(api=False)
         resp = self.app.put(
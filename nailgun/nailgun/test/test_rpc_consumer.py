@@ -15,6 +15,8 @@
 #    under the License.
 
 import json
+from mock import Mock
+from mock import patch
 import uuid
 
 from nailgun.api.models import Attributes
@@ -27,6 +29,8 @@ from nailgun.api.models import Notification
 from nailgun.api.models import Task
 from nailgun.api.models import Vlan
 from nailgun.rpc import receiver as rcvr
+from nailgun.rpc.threaded import RPCConsumer
+from nailgun.settings import settings
 from nailgun.test.base import BaseHandlers
 from nailgun.test.base import reverse
 
@@ -415,6 +419,67 @@ class TestConsumer(BaseHandlers):
         self.db.refresh(self.env.nodes[0])
         self.assertEqual(self.env.nodes[0].progress, 100)
 
+    def test_nodes_progress_bulk_update(self):
+        self.env.create(
+            cluster_kwargs={},
+            nodes_kwargs=[
+                {"api": False, "status": "deploying"},
+                {"api": False, "status": "deploying"}
+            ]
+        )
+        node1, node2 = self.env.nodes
+        task = Task(
+            uuid=str(uuid.uuid4()),
+            name="deploy",
+            status="running",
+            cluster_id=self.env.clusters[0].id
+        )
+        self.db.add(task)
+        self.db.commit()
+
+        self.receiver.deploy_resp(
+            task_uuid=task.uuid,
+            nodes=[{'uid': node1.id, 'progress': 20},
+                   {'uid': node2.id, 'progress': 60}]
+        )
+        self.db.refresh(node1)
+        self.db.refresh(node2)
+        self.db.refresh(task)
+        self.assertEqual((node1.progress, node2.progress), (20, 60))
+        coeff = settings.PROVISIONING_PROGRESS_COEFF or 0.3
+        self.assertEqual(
+            task.progress,
+            int(100.0 * coeff + 40.0 * (1.0 - coeff))
+        )
+
+    def test_progress_updates_coalesced(self):
+        node = self.env.create_node(api=False, status="deploying")
+        task = Task(
+            uuid=str(uuid.uuid4()),
+            name="deploy",
+            status="running"
+        )
+        self.db.add(task)
+        self.db.commit()
+
+        with patch.dict(settings.config,
+                        {'DEPLOY_PROGRESS_COALESCE_WINDOW': 60}):
+            for progress in (10, 20, 30):
+                self.receiver.deploy_resp(
+                    task_uuid=task.uuid,
+                    nodes=[{'uid': node.id, 'progress': progress}]
+                )
+            self.db.refresh(node)
+            # first update is applied, following ones are buffered
+            self.assertEqual(node.progress, 10)
+
+            self.receiver.deploy_resp(
+                task_uuid=task.uuid,
+                nodes=[{'uid': node.id, 'status': 'ready'}]
+            )
+            self.db.refresh(node)
+            self.assertEqual((node.status, node.progress), ('ready', 30))
+
     def test_remove_nodes_resp(self):
         self.env.create(
             cluster_kwargs={},
@@ -603,3 +668,57 @@ class TestConsumer(BaseHandlers):
             .join(NetworkGroup).\
             filter(NetworkGroup.cluster_id == cluster_db.id).all()
         self.assertNotEqual(len(nets_db), 0)
+
+
+class TestRPCConsumerPool(BaseHandlers):
+
+    def _message(self, redelivered=False):
+        msg = Mock()
+        msg.delivery_info = {'redelivered': redelivered}
+        return msg
+
+    def test_inline_consumer_stats(self):
+        receiver = Mock()
+        receiver.deploy_resp.side_effect = [None, Exception()]
+        consumer = RPCConsumer(Mock(), receiver)
+        msgs = [self._message(), self._message(True)]
+        for msg in msgs:
+            consumer.consume_msg(
+                {'method': 'deploy_resp', 'args': {'task_uuid': 'a'}},
+                msg
+            )
+            self.assertTrue(msg.ack.called)
+
+        stats = consumer.get_stats()
+        self.assertEquals(stats['received'], 2)
+        self.assertEquals(stats['redelivered'], 1)
+        self.assertEquals(stats['methods']['deploy_resp']['count'], 2)
+        self.assertEquals(stats['methods']['deploy_resp']['errors'], 1)
+
+    def test_pool_keeps_task_messages_order(self):
+        handled = []
+        receiver = Mock()
+        receiver.deploy_resp.side_effect = \
+            lambda **kwargs: handled.append(kwargs)
+        consumer = RPCConsumer(Mock(), receiver, workers=4)
+        consumer.pool.start()
+        msgs = []
+        for progress in xrange(20):
+            for task_uuid in ('a', 'b', 'c'):
+                msg = self._message()
+                msgs.append(msg)
+                consumer.consume_msg({
+                    'method': 'deploy_resp',
+                    'args': {'task_uuid': task_uuid, 'progress': progress}
+                }, msg)
+        consumer.pool.stop()
+        consumer.ack_handled()
+
+        for task_uuid in ('a', 'b', 'c'):
+            self.assertEquals(
+                [h['progress'] for h in handled
+                 if h['task_uuid'] == task_uuid],
+                range(20)
+            )
+        self.assertTrue(all(msg.ack.called for msg in msgs))
+        self.assertEquals(consumer.get_stats()['queue_depth'], 0)
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+from mock import Mock
+from mock import patch
+
+from nailgun import rpc
+from nailgun.test.base import BaseHandlers
+
+
+class TestProducerPool(BaseHandlers):
+
+    def _fake_connection(self):
+        connection = Mock()
+        connection.ensure.side_effect = lambda obj, fun, **kw: fun
+        return connection
+
+    def test_connection_is_reused(self):
+        pool = rpc.ProducerPool('amqp://', limit=2)
+        with patch('nailgun.rpc.Connection') as connection_cls:
+            connection_cls.return_value = self._fake_connection()
+            for i in range(3):
+                pool.publish({'method': 'test'},
+                             exchange=rpc.naily_exchange,
+                             routing_key='naily')
+        self.assertEquals(connection_cls.call_count, 1)
+        stats = pool.get_stats()
+        self.assertEquals(stats['published'], 3)
+        self.assertEquals(stats['connections'], 1)
+
+    def test_broken_connection_is_discarded(self):
+        pool = rpc.ProducerPool('amqp://', limit=1)
+        with patch('nailgun.rpc.Connection') as connection_cls:
+            connection = self._fake_connection()
+            connection.ensure.side_effect = IOError()
+            connection_cls.return_value = connection
+            self.assertRaises(IOError, pool.publish, {},
+                              exchange=rpc.naily_exchange,
+                              routing_key='naily')
+        stats = pool.get_stats()
+        self.assertEquals(stats['errors'], 1)
+        self.assertEquals(stats['connections'], 0)
+
+    def test_lazy_message_truncated(self):
+        message = {'args': 'x' * 100}
+        self.assertEquals(str(rpc.LazyMessage(message)), json.dumps(message))
+        truncated = str(rpc.LazyMessage(message, 10))
+        self.assertTrue(truncated.startswith(json.dumps(message)[:10]))
+        self.assertTrue(truncated.endswith('bytes total)'))
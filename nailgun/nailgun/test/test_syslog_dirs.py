@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+#    Copyright 2013 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import tempfile
+
+from mock import patch
+
+from nailgun.network.manager import NetworkManager
+from nailgun.settings import settings
+from nailgun.task.helpers import TaskHelper
+from nailgun.test.base import BaseHandlers
+
+
+class TestSyslogDirs(BaseHandlers):
+
+    def setUp(self):
+        super(TestSyslogDirs, self).setUp()
+        self.syslog_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.syslog_dir)
+        super(TestSyslogDirs, self).tearDown()
+
+    def create_nodes(self):
+        self.env.create(
+            nodes_kwargs=[
+                {'pending_addition': True},
+                {'pending_addition': True}
+            ]
+        )
+        netmanager = NetworkManager()
+        for i, node in enumerate(self.env.nodes):
+            node.ip = '10.20.0.%d' % (i + 100)
+            node.fqdn = TaskHelper.make_slave_fqdn(node.id)
+            netmanager.assign_admin_ips(node.id, 2)
+        self.db.commit()
+        return self.env.nodes
+
+    def path(self, *names):
+        return os.path.join(self.syslog_dir, *names)
+
+    def test_prepare_syslog_dirs(self):
+        nodes = self.create_nodes()
+        # logs of bootstrap are kept
+        os.makedirs(self.path(nodes[0].ip))
+        open(self.path(nodes[0].ip, 'messages'), 'w').close()
+        # logs of previous installation are backed up
+        os.makedirs(self.path(nodes[1].fqdn))
+
+        with patch('nailgun.task.helpers.os.system') as system:
+            TaskHelper.prepare_syslog_dirs(nodes, self.syslog_dir)
+        system.assert_called_once_with(settings.SYSLOG_RELOAD_COMMAND)
+
+        self.assertTrue(os.path.isfile(self.path(nodes[0].fqdn, 'messages')))
+        self.assertFalse(os.path.exists(self.path(nodes[0].ip)))
+        self.assertTrue(os.path.isdir(self.path(nodes[1].fqdn + '.bak')))
+        self.assertTrue(os.path.isdir(self.path(nodes[1].fqdn)))
+
+        for layout in TaskHelper.make_syslog_layouts(nodes, self.syslog_dir):
+            self.assertEquals(len(layout['links']), 2)
+            for link in layout['links']:
+                self.assertEquals(os.readlink(link), layout['target'])
+
+    def test_no_reload_without_nodes(self):
+        with patch('nailgun.task.helpers.os.system') as system:
+            TaskHelper.prepare_syslog_dirs([], self.syslog_dir)
+        self.assertFalse(system.called)
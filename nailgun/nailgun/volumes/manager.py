@@ -21,9 +21,11 @@ All sizes in megabytes.
 
 import json
 
-from copy import deepcopy
+from nailgun.api.fields import copy_json
 from nailgun.errors import errors
 from nailgun.logger import logger
+from nailgun.metadata import compile_template
+from nailgun.metadata import release_metadata
 
 
 def only_disks(spaces):
@@ -55,26 +57,15 @@ def get_node_volumes(node):
     If spaces don't defained for role, will be used
     partitioning for role `other`.
     """
-    node_volumes = []
-
-    role_volumes = node.cluster.release.volumes_metadata[
-        'volumes_roles_mapping']
-    roles = node.roles + node.pending_roles
-
-    for role in roles:
-        if not role_volumes.get(role):
-            continue
-
-        for volume in role_volumes[role]:
-            if volume not in node_volumes:
-                node_volumes.append(volume)
+    metadata = release_metadata.get(node.cluster.release)
+    node_volumes = list(metadata.get_roles_volumes(
+        node.roles + node.pending_roles))
 
     # Use role other
     if not node_volumes:
         logger.warn('Cannot find volumes for node: %s assigning default '
                     'volumes' % (node.full_name))
-        for volume in role_volumes['other']:
-            node_volumes.append(volume)
+        node_volumes.extend(metadata.role_volumes['other'])
 
     return node_volumes
 
@@ -203,17 +194,13 @@ class DisksFormatConvertor(object):
             ]
         '''
         volumes_info = []
-        for volume_id in get_node_volumes(node):
-            volume = filter(
-                lambda volume: volume.get('id') == volume_id,
-                node.cluster.release.volumes_metadata['volumes'])[0]
-
+        volume_manager = node.volume_manager
+        for volume in volume_manager.allowed_vgs:
             # Here we calculate min_size of nodes
-            min_size = node.volume_manager.expand_generators(
-                volume)['min_size']
+            min_size = volume_manager.expand_vg(volume['id'])['min_size']
 
             volumes_info.append({
-                'name': volume_id,
+                'name': volume['id'],
                 'label': volume['label'],
                 'min_size': min_size})
 
@@ -342,7 +329,7 @@ class Disk(object):
         Size in parameter should include size of lvm meta
         """
         logger.debug('Creating or updating PV: disk=%s vg=%s, size=%s',
-                     self.id, name, str(size))
+                     self.id, name, size)
 
         if size is None:
             logger.debug(
@@ -409,37 +396,74 @@ class Disk(object):
 
 
 class VolumeManager(object):
+
+    # Generators which don't depend on node
+    static_generators = {
+        # root = 10GB
+        'calc_root_size': gb_to_mb(10),
+        # boot = 200MB
+        'calc_boot_size': 200,
+        # boot records size = 300MB
+        'calc_boot_records_size': 300,
+        # let's think that size of mbr is 10MB
+        'calc_mbr_size': 10,
+        # lvm meta = 64MB for one volume group
+        'calc_lvm_meta_size': 64,
+        # virtual storage = 5GB
+        'calc_min_vm_size': gb_to_mb(5),
+        'calc_min_glance_size': gb_to_mb(5),
+        'calc_min_cinder_size': gb_to_mb(1.5)
+    }
+
+    # Generators which are calculated by manager methods
+    method_generators = {
+        # Calculate swap space based on total RAM
+        'calc_swap_size': '_calc_swap_size',
+        'calc_os_size': '_calc_os_size',
+        'calc_os_vg_size': '_calc_os_size',
+        'calc_min_os_size': '_calc_os_size',
+        'calc_total_vg': '_calc_total_vg',
+        'calc_total_root_vg': '_calc_total_root_vg'
+    }
+
+    # Generators which results depend on allocated
+    # volumes, all others are memoized by manager
+    volatile_generators = frozenset([
+        'calc_total_vg',
+        'calc_total_root_vg'
+    ])
+
     def __init__(self, node):
         '''Disks and volumes will be set according to node attributes.
         VolumeManager should not make any updates in database.
         '''
         # Make sure that we don't change volumes directly from manager
-        self.volumes = deepcopy(node.attributes.volumes) or []
+        self.volumes = copy_json(node.attributes.volumes) or []
         # For swap calculation
         self.ram = node.meta['memory']['total']
+        self.generated = {}
         self.allowed_vgs = []
+        self.vg_templates = {}
 
         # If node bound to the cluster than it has a role
         # and volume groups which we should to allocate
         if node.cluster:
-            volumes_metadata = node.cluster.release.volumes_metadata
+            metadata = release_metadata.get(node.cluster.release)
             # Adding volume groups in same order
             # as they represent in volumes_roles_mapping list
             for vg_name in get_node_volumes(node):
-                vg = filter(lambda vg: vg.get('id') == vg_name,
-                            volumes_metadata['volumes'])[0]
-                self.allowed_vgs.append(vg)
+                self.allowed_vgs.append(metadata.vgs[vg_name])
+                self.vg_templates[vg_name] = metadata.vg_templates[vg_name]
+
+        existing_disks = dict([
+            (disk['id'], disk) for disk in only_disks(self.volumes)])
+        disks_count = len(node.meta['disks'])
+        boot_is_raid = True if disks_count > 1 else False
 
         self.disks = []
         for d in sorted(node.meta['disks'], key=lambda i: i['name']):
-            disks_count = len(node.meta["disks"])
-            boot_is_raid = True if disks_count > 1 else False
-
-            existing_disk = filter(
-                lambda disk: d['disk'] == disk['id'],
-                only_disks(self.volumes))
-
-            disk_volumes = existing_disk[0].get(
+            existing_disk = existing_disks.get(d['disk'])
+            disk_volumes = existing_disk.get(
                 'volumes', []) if existing_disk else []
 
             disk = Disk(
@@ -454,13 +478,13 @@ class VolumeManager(object):
 
             self.disks.append(disk)
 
-        self.__logger('Initialized with node: %s' % node.full_name)
-        self.__logger('Initialized with volumes: %s' % self.volumes)
-        self.__logger('Initialized with disks: %s' % self.disks)
+        self.__logger('Initialized with node: %s', node.full_name)
+        self.__logger('Initialized with volumes: %s', self.volumes)
+        self.__logger('Initialized with disks: %s', self.disks)
 
     def set_pv_size(self, disk_id, volume_name, size):
-        self.__logger('Update PV size for disk=%s volume_name=%s size=%s' %
-                      (disk_id, volume_name, size))
+        self.__logger('Update PV size for disk=%s volume_name=%s size=%s',
+                      disk_id, volume_name, size)
 
         disk = filter(lambda disk: disk.id == disk_id, self.disks)[0]
         disk.set_pv_size(volume_name, size)
@@ -472,14 +496,9 @@ class VolumeManager(object):
         # Recalculate sizes of volume groups
         for idx, volume in enumerate(self.volumes):
             if volume.get('type') == 'vg':
-                vg_id = volume.get('id')
-                vg_template = filter(
-                    lambda volume: volume.get('id') == vg_id,
-                    self.allowed_vgs)[0]
-
-                self.volumes[idx] = self.expand_generators(vg_template)
+                self.volumes[idx] = self.expand_vg(volume.get('id'))
 
-        self.__logger('Updated volume size %s' % self.volumes)
+        self.__logger('Updated volume size %s', self.volumes)
         return self.volumes
 
     def get_pv_size(self, disk_id, volume_name):
@@ -499,43 +518,29 @@ class VolumeManager(object):
         return size_without_lvm_meta
 
     def call_generator(self, generator, *args):
-        generators = {
-            # Calculate swap space based on total RAM
-            'calc_swap_size': self._calc_swap_size,
-            # root = 10GB
-            'calc_root_size': lambda: gb_to_mb(10),
-            # boot = 200MB
-            'calc_boot_size': lambda: 200,
-            # boot records size = 300MB
-            'calc_boot_records_size': lambda: 300,
-            # let's think that size of mbr is 10MB
-            'calc_mbr_size': lambda: 10,
-            # lvm meta = 64MB for one volume group
-            'calc_lvm_meta_size': lambda: 64,
-            'calc_total_vg': self._calc_total_vg,
-            # virtual storage = 5GB
-            'calc_min_vm_size': lambda: gb_to_mb(5),
-            'calc_min_glance_size': lambda: gb_to_mb(5),
-            'calc_min_cinder_size': lambda: gb_to_mb(1.5),
-            'calc_total_root_vg': self._calc_total_root_vg
-        }
-
-        generators['calc_os_size'] = \
-            lambda: generators['calc_root_size']() + \
-            generators['calc_swap_size']()
-
-        generators['calc_os_vg_size'] = generators['calc_os_size']
-        generators['calc_min_os_size'] = generators['calc_os_size']
+        if generator in self.static_generators:
+            return self.static_generators[generator]
 
-        if generator not in generators:
+        if generator not in self.method_generators:
             raise errors.CannotFindGenerator(
                 u'Cannot find generator %s' % generator)
 
-        result = generators[generator](*args)
-        self.__logger('Generator %s with args %s returned result: %s' %
-                      (generator, args, result))
+        memoize = not args and generator not in self.volatile_generators
+        if memoize and generator in self.generated:
+            return self.generated[generator]
+
+        result = getattr(self, self.method_generators[generator])(*args)
+        if memoize:
+            self.generated[generator] = result
+
+        self.__logger('Generator %s with args %s returned result: %s',
+                      generator, args, result)
         return result
 
+    def _calc_os_size(self):
+        return self.call_generator('calc_root_size') + \
+            self.call_generator('calc_swap_size')
+
     def _calc_total_root_vg(self):
         return self._calc_total_vg('os') - \
             self.call_generator('calc_swap_size')
@@ -578,23 +583,22 @@ class VolumeManager(object):
         '''Allocate volume group. If size is None,
         then allocate all existing space on all disks.
         '''
-        self.__logger('Allocate volume group %s with size %s' % (name, size))
+        self.__logger('Allocate volume group %s with size %s', name, size)
 
         if size is None:
             for disk in self.disks:
                 if disk.free_space > 0:
                     self.__logger('Allocating all available space for PV: '
-                                  'disk: %s vg: %s' % (disk.id, name))
+                                  'disk: %s vg: %s', disk.id, name)
                     disk.create_pv(name)
                 else:
                     self.__logger('Not enough free space for PV allocation: '
-                                  'disk: %s vg: %s' % (disk.id, name))
+                                  'disk: %s vg: %s', disk.id, name)
                     disk.create_pv(name, 0)
         else:
             not_allocated_size = size
             for disk in self.disks:
-                self.__logger('Creating PV: disk: %s, vg: %s' %
-                              (disk.id, name))
+                self.__logger('Creating PV: disk: %s, vg: %s', disk.id, name)
 
                 if disk.free_space >= not_allocated_size:
                     # if we can allocate all required size
@@ -618,54 +622,31 @@ class VolumeManager(object):
         self.volumes = [d.render() for d in self.disks]
 
         if not self.allowed_vgs:
-            self.__logger('Role is None return volumes: %s' % self.volumes)
+            self.__logger('Role is None return volumes: %s', self.volumes)
             return self.volumes
 
-        self.volumes.extend(self.allowed_vgs)
-
         for vg in self.allowed_vgs:
             # For last volume group in allowed_vgs list
             # we allocates all free space
             if len(self.allowed_vgs) == 1 or vg == self.allowed_vgs[-1]:
                 self._allocate_vg(vg['id'])
             else:
-                min_size = self.expand_generators(vg)['min_size']
+                min_size = self.expand_vg(vg['id'])['min_size']
                 self._allocate_vg(vg['id'], min_size)
 
-        self.volumes = self.expand_generators(self.volumes)
-        self.__logger('Generated volumes: %s' % self.volumes)
+        vgs = [self.expand_vg(vg['id']) for vg in self.allowed_vgs]
+        self.volumes = copy_json(self.volumes) + vgs
+        self.__logger('Generated volumes: %s', self.volumes)
         return self.volumes
 
+    def expand_vg(self, vg_id):
+        """Returns volume group template of node
+        with expanded generators
+        """
+        return self.vg_templates[vg_id](self.call_generator)
+
     def expand_generators(self, cdict):
-        new_dict = {}
-        if isinstance(cdict, dict):
-            for i, val in cdict.iteritems():
-                if type(val) in (str, unicode, int, float):
-                    new_dict[i] = val
-                elif isinstance(val, dict):
-                    if "generator" in val:
-                        genval = self.call_generator(
-                            val["generator"],
-                            *(val.get("generator_args", []))
-                        )
-                        self.__logger(
-                            'Generator %s with args %s expanded to: %s' %
-                            (val['generator'],
-                             val.get('generator_args', []),
-                             genval))
-
-                        new_dict[i] = genval
-                    else:
-                        new_dict[i] = self.expand_generators(val)
-                elif isinstance(val, list):
-                    new_dict[i] = []
-                    for d in val:
-                        new_dict[i].append(self.expand_generators(d))
-        elif isinstance(cdict, list):
-            new_dict = []
-            for d in cdict:
-                new_dict.append(self.expand_generators(d))
-        return new_dict
+        return compile_template(cdict)(self.call_generator)
 
     def check_disk_space_for_deployment(self):
         '''Check disks space for minimal installation.
@@ -676,8 +657,8 @@ class VolumeManager(object):
         disks_space = sum([d.size for d in self.disks])
         minimal_installation_size = self.__calc_minimal_installation_size()
 
-        self.__logger('Checking disks space: disks space %s, minimal size %s' %
-                      (disks_space, minimal_installation_size))
+        self.__logger('Checking disks space: disks space %s, minimal size %s',
+                      disks_space, minimal_installation_size)
 
         if disks_space < minimal_installation_size:
             raise errors.NotEnoughFreeSpace()
@@ -691,10 +672,10 @@ class VolumeManager(object):
 
         min_installation_size = disks_count * boot_size
         for vg in self.allowed_vgs:
-            min_size = self.expand_generators(vg)['min_size']
+            min_size = self.expand_vg(vg['id'])['min_size']
             min_installation_size += min_size
 
         return min_installation_size
 
-    def __logger(self, message):
-        logger.debug('VolumeManager %s: %s', id(self), message)
+    def __logger(self, message, *args):
+        logger.debug('VolumeManager %s: ' + message, id(self), *args)
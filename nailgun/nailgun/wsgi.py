@@ -23,6 +23,7 @@ from web.httpserver import WSGIServer
 curdir = os.path.dirname(__file__)
 sys.path.insert(0, curdir)
 
+from nailgun.api.handlers import flush_notifications
 from nailgun.api.handlers import forbid_client_caching
 from nailgun.db import engine
 from nailgun.db import load_db_driver
@@ -34,6 +35,8 @@ from nailgun.urls import urls
 
 def build_app():
     app = web.application(urls, locals())
+    # outer processor, runs after request is committed
+    app.add_processor(flush_notifications)
     app.add_processor(load_db_driver)
     app.add_processor(forbid_client_caching)
     return app
@@ -81,6 +84,7 @@ def appstart(keepalive=False):
     app = build_app()
 
     from nailgun.keepalive import keep_alive
+    from nailgun import rpc
     from nailgun.rpc import threaded
 
     if keepalive:
@@ -109,4 +113,6 @@ def appstart(keepalive=False):
     if not settings.FAKE_TASKS:
         logger.info("Stopping RPC consumer...")
         rpc_process.join()
+        logger.info("Closing RPC producer connections...")
+        rpc.producer_pool.close()
     logger.info("Done")
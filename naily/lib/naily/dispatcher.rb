@@ -83,10 +83,11 @@ module Naily
       Naily.logger.info("'deploy' method called with data: #{data.inspect}")
 
       reporter = Naily::Reporter.new(@producer, data['respond_to'], data['args']['task_uuid'])
-      @orchestrator.provision(reporter, data['args']['task_uuid'], data['args']['deployment_info'])
+      deployment_info = expand_deployment_info(data['args']['deployment_info'])
+      @orchestrator.provision(reporter, data['args']['task_uuid'], deployment_info)
 
       begin
-        @orchestrator.deploy(reporter, data['args']['task_uuid'], data['args']['deployment_info'])
+        @orchestrator.deploy(reporter, data['args']['task_uuid'], deployment_info)
         reporter.report('status' => 'ready', 'progress' => 100)
       rescue Timeout::Error
         msg = "Timeout of deployment is exceeded."
@@ -127,6 +128,14 @@ module Naily
 
     private
     
+    def expand_deployment_info(deployment_info)
+      # Compact format (version 2) keeps attributes common for all nodes once:
+      # {'version' => 2, 'common' => {...}, 'nodes' => [{...}, ...]}
+      return deployment_info unless deployment_info.is_a?(Hash)
+      common = deployment_info['common'] || {}
+      deployment_info['nodes'].map { |node| node.merge(common) }
+    end
+
     def report_result(result, reporter)
       result = {} unless result.instance_of?(Hash)
       status = {'status' => 'ready', 'progress' => 100}.merge(result)